@@ -0,0 +1,189 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import numpy as np
+
+from cache import aggregate_cache, mark_provisional, memoize
+from cube import CUBE_DIMENSIONS
+from dataset import current_snapshot
+from instrumentation import stage
+from metrics_engine import EMPTY_METRICS, finalize_totals
+from parallel import PARALLEL_MIN_ROWS
+from sampling import APPROX_MIN_ROWS, APPROX_QUERIES
+from schema import GRADE_COLUMNS
+from stats_engine import CORRELATION_COLUMNS, factor_tests, moment_sums
+from timeseries import ALL_STUDENTS
+
+logger = logging.getLogger(__name__)
+
+_refiner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refine")
+_local = threading.local()
+
+
+def filter_index():
+    return current_snapshot().index
+
+
+def normalized_filters(filters):
+    index = filter_index()
+    return index.normalize(filters) if filters and index is not None else {}
+
+
+@memoize(aggregate_cache)
+def filtered_view(filters):
+    snapshot = current_snapshot()
+    bitmap = snapshot.index.select(filters)
+    views = snapshot.shared_views
+    if views is None or snapshot.index.count(bitmap) < PARALLEL_MIN_ROWS:
+        views = snapshot.index  # below this many rows the process pool costs more than it saves
+    try:
+        cube, totals = views.view(bitmap)
+    except BrokenProcessPool:
+        logger.warning("a view worker died; computing %s in this process", filters)
+        cube, totals = snapshot.index.view(bitmap)
+    return cube, finalize_totals(totals), {}
+
+
+@memoize(aggregate_cache)
+def selection_size(filters):
+    index = filter_index()
+    return index.count(index.select(filters))
+
+
+@memoize(aggregate_cache)
+def sampled_view(filters):
+    snapshot = current_snapshot()
+    cube, totals, margins = snapshot.sample.view(snapshot.index.select(filters))
+    return cube, finalize_totals(totals), margins
+
+
+@contextmanager
+def exact_views():
+    _local.exact = True
+    try:
+        yield
+    finally:
+        _local.exact = False
+
+
+def approximate(filters):
+    filters = normalized_filters(filters)
+    return (APPROX_QUERIES == "on" and bool(filters) and not getattr(_local, "exact", False)
+            and current_snapshot().sample is not None and not filtered_view.cached(filters)
+            and selection_size(filters) >= APPROX_MIN_ROWS)
+
+
+def _refine(filters):
+    try:
+        filtered_view(filters)
+    except Exception:
+        logger.exception("refining %s failed", filters)
+
+
+def view(filters):
+    with stage("filter"):
+        if approximate(filters):
+            _refiner.submit(_refine, filters)
+            mark_provisional()
+            return sampled_view(filters)
+        return filtered_view(filters)
+
+
+def grade_cube(filters=None):
+    filters = normalized_filters(filters)
+    return view(filters)[0] if filters else current_snapshot().cube
+
+
+def school_metrics():
+    return current_snapshot().metrics
+
+
+def metrics_for(school, filters=None):
+    filters = normalized_filters(filters)
+    if filters:
+        return view(filters)[1].get(school, EMPTY_METRICS)
+    return school_metrics().get(school, EMPTY_METRICS)
+
+
+def metric_margins(school, filters=None):
+    filters = normalized_filters(filters)
+    return view(filters)[2].get(school, {}) if filters else {}
+
+
+def schools():
+    return grade_cube().schools
+
+
+def term_labels():
+    series = current_snapshot().term_series
+    return GRADE_COLUMNS if series is None else series.terms
+
+
+@memoize(aggregate_cache)
+def term_means(school, filters, grouping, first, last, window):
+    filters = normalized_filters(filters)
+    snapshot = current_snapshot()
+    series = snapshot.term_series
+    if series is None:
+        # Streaming mode keeps no rows, so only the ungrouped G1-G3 means are known.
+        cube = grade_cube(filters)
+        running = np.cumsum([0.0] + [cube.measure_mean(school, term) for term in GRADE_COLUMNS])
+        stop = np.arange(first, last + 1) + 1
+        start = np.maximum(stop - window, 0)
+        return [ALL_STUDENTS], ((running[stop] - running[start]) / (stop - start))[None, :]
+    selected = None
+    if filters:
+        selected = np.unpackbits(snapshot.index.select(filters), count=snapshot.row_count).astype(bool)
+    return series.means(school, grouping, first, last, window, selected)
+
+
+@memoize(aggregate_cache, shared=True)
+def factor_effects(filters):
+    # Tests for every factor and school come out of one pass over the view's grade histograms.
+    return factor_tests(grade_cube(filters), [dim for dim in CUBE_DIMENSIONS if dim != "school"])
+
+
+@memoize(aggregate_cache, shared=True)
+def correlation_moments(filters):
+    filters = normalized_filters(filters)
+    snapshot = current_snapshot()
+    frame = snapshot.frame
+    if frame is None:
+        return None  # streaming mode keeps no rows to correlate
+    if filters:
+        positions = snapshot.index.positions(snapshot.index.select(filters))
+        frame = frame[["school", *CORRELATION_COLUMNS]].take(positions)
+    return moment_sums(frame, snapshot.cube.schools)
+
+
+KPI_CARDS = [
+    ("total", "Total Students", "👥"),
+    ("ratio", "School Ratio", "🏫"),
+    ("grade", "Avg Final Grade", "📊"),
+    ("absences", "Absences / Student", "📅"),
+    ("activities", "Activities", "🎯"),
+    ("freetime", "Free Time Rating", "🕒"),
+    ("health", "Health Rating", "💪"),
+]
+
+
+def _margin(margins, key, digits=1):
+    return f" ± {margins[key]:.{digits}f}" if margins.get(key) else ""
+
+
+def kpi_values(school, filters=None):
+    m = metrics_for(school, filters)
+    e = metric_margins(school, filters)
+    ratio = f"GP: {m['gp_pct']}% · MS: {m['ms_pct']}%" if school == "All" else f"{school}: {m['share_pct']}%"
+    return {
+        "total": f"{m['total']}{_margin(e, 'total', 0)}",
+        "ratio": ratio,
+        "grade": f"{m['avg_grade']}{_margin(e, 'avg_grade')} / 20",
+        "absences": f"{int(m['avg_absences'])}{_margin(e, 'avg_absences', 0)} / yr",
+        "activities": f"{m['activities_pct']}{_margin(e, 'activities_pct', 0)}%",
+        "freetime": f"{m['avg_freetime']}{_margin(e, 'avg_freetime')} / 5",
+        "health": f"{m['avg_health']}{_margin(e, 'avg_health')} / 5",
+    }
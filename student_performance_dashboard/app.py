@@ -1,15 +1,24 @@
+import hmac
 import os
+import threading
 
-from dash import Dash, html, page_container, dcc, callback, Output, Input
+from flask import jsonify, request
+from dash import Dash, html, page_container, page_registry, dcc, callback, Output, Input
 import dash_bootstrap_components as dbc
 
+from export import init_export_routes
+from instrumentation import init_app, instrumented
+from responses import init_responses
+from startup import LAZY_STARTUP, startup_step
+
 COLOR_BG = "#FFFFFF"
 COLOR_BLUE1 = "#034BE4"
 COLOR_SIDEBAR_BG = "#F7FAFF"
 COLOR_LINK_ACTIVE = COLOR_BLUE1
 COLOR_LINK_INACTIVE = "#223355"
 
-app = Dash(__name__, use_pages=True, external_stylesheets=[dbc.themes.SANDSTONE])
+with startup_step("dash app and pages"):
+    app = Dash(__name__, use_pages=True, external_stylesheets=[dbc.themes.SANDSTONE])
 server = app.server
 
 app.layout = dbc.Container([
@@ -42,6 +51,7 @@ app.layout = dbc.Container([
     Output("sidebar-nav", "children"),
     Input("url", "pathname"),
 )
+@instrumented
 def update_sidebar(pathname):
     def nav_style(active):
         return {
@@ -70,8 +80,83 @@ def update_sidebar(pathname):
         "boxShadow": "0 2px 6px 0 #E0EAFF22"
     })
 
-from pages.overview import register_callbacks
-register_callbacks(app)
+from pages import academic, overview
+overview.register_callbacks(app)
+
+from dataset import manager, upsert_records
+from figure_updates import CLIENTSIDE_FILTERS
+from precompute import page_layouts, start_precompute
+init_app(server)
+init_export_routes(server)
+init_responses(server)
+
+_views_registered = threading.Event()
+
+def register_view_callbacks():
+    # Whether a page updates in the browser depends on the size of its embedded data, so with
+    # CLIENTSIDE_FILTERS=on these callbacks wait for the data; the browser's dependency request waits too.
+    if not _views_registered.is_set():
+        overview.register_view_callbacks(app)
+        academic.register_view_callbacks(app)
+        _views_registered.set()
+
+def warm_up():
+    manager.current()
+    register_view_callbacks()
+    for page in page_registry.values():
+        with startup_step(f"layout of {page['module']}"):
+            page_layouts([page])
+
+_warm_up_pid = None
+_warm_up_lock = threading.Lock()
+
+def start_worker():
+    if LAZY_STARTUP == "on":
+        try:
+            warm_up()
+        finally:
+            _views_registered.set()  # a failed load must not hold the dependency request forever
+    start_precompute(app)
+
+def precompute_new_version(version):
+    # Before the worker's first request Dash has not registered every callback; that request precomputes.
+    # Upserted versions only differ in a few rows, so the new file or frame is what is precomputed again.
+    if _warm_up_pid == os.getpid() and manager.current().delta is None:
+        start_precompute(app)
+
+manager.on_swap(precompute_new_version)
+
+if CLIENTSIDE_FILTERS != "on":
+    register_view_callbacks()
+if LAZY_STARTUP != "on" and __name__ != "__mp_main__":  # pool workers import this script but only run parallel.py
+    warm_up()
+
+RECORDS_API_TOKEN = os.environ.get("RECORDS_API_TOKEN")
+
+@server.route("/api/records", methods=["POST"])
+def upsert_records_route():
+    supplied = request.headers.get("Authorization", "")
+    if not RECORDS_API_TOKEN or not hmac.compare_digest(supplied, f"Bearer {RECORDS_API_TOKEN}"):
+        return jsonify(error="record updates are disabled or the token is wrong"), 403
+    try:
+        result = upsert_records(request.get_json(force=True))
+    except (KeyError, TypeError, ValueError) as exc:
+        return jsonify(error=str(exc)), 400
+    return jsonify(result)
+
+@server.before_request
+def start_dataset_watcher():
+    global _warm_up_pid
+    manager.start_watcher()
+    if _warm_up_pid != os.getpid():
+        # The first request of each worker, usually a health check, has Dash register the callbacks,
+        # so precompute can start. In lazy mode the data is loaded in the background first.
+        with _warm_up_lock:
+            if _warm_up_pid != os.getpid():
+                _warm_up_pid = os.getpid()
+                threading.Thread(target=start_worker, name="warm-up", daemon=True).start()
+    if request.path.endswith("/_dash-dependencies"):
+        _views_registered.wait()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8050))
@@ -0,0 +1,59 @@
+// Applies the figure updates from figure_updates.py in the browser when
+// CLIENTSIDE_FILTERS=on embeds every school's updates in a dcc.Store, and
+// gathers the filter panel from filters.py into each page's filter store.
+(function () {
+    function applyUpdate(figure, update) {
+        const next = Object.assign({}, figure, {
+            data: update.data || figure.data.slice(),
+            layout: Object.assign({}, figure.layout, update.layout || {})
+        });
+        (update.traces || []).forEach(function ([index, prop, value]) {
+            next.data[index] = Object.assign({}, next.data[index], {[prop]: value});
+        });
+        return next;
+    }
+
+    function schoolView(data, school) {
+        if (data.schools[school]) {
+            return data.schools[school];
+        }
+        // A school missing from the data shows the empty view, like the server callbacks.
+        const name = JSON.stringify(String(school)).slice(1, -1);
+        return JSON.parse(JSON.stringify(data.empty).split("{school}").join(name));
+    }
+
+    function factorPlot(slot) {
+        return function (school, factor, data, figure) {
+            return applyUpdate(figure, schoolView(data, school)[slot][factor]);
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            overview: function (school, data, ...figures) {
+                const view = schoolView(data, school);
+                return view.kpis.concat(figures.map(function (figure, i) {
+                    return applyUpdate(figure, view.figures[i]);
+                }));
+            },
+            academicMetrics: function (school, data) {
+                return schoolView(data, school).kpis;
+            },
+            collectFilters: function (values, ids) {
+                const filters = {};
+                ids.forEach(function (id, i) {
+                    const value = values[i];
+                    if (id.kind === "between" && value) {
+                        filters[id.column] = {between: value};
+                    } else if (id.kind === "in" && value && value.length) {
+                        filters[id.column] = value;
+                    }
+                });
+                return filters;
+            },
+            supportPlot: factorPlot("support"),
+            lifestylePlot: factorPlot("lifestyle"),
+            personalPlot: factorPlot("personal")
+        }
+    });
+})();
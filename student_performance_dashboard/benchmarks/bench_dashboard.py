@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402  registers the pages and callbacks
+from cache import aggregate_cache, figure_cache  # noqa: E402
+from bitmap import BitmapIndex, SortIndex  # noqa: E402
+from cube import build_cube  # noqa: E402
+from dataset import manager  # noqa: E402
+from datastore import load_frame  # noqa: E402
+from metrics_engine import compute_metrics  # noqa: E402
+from parallel import PARALLEL_WORKERS, SharedViews  # noqa: E402
+from sampling import StratifiedSample  # noqa: E402
+from stats_engine import factor_tests, moment_sums  # noqa: E402
+from timeseries import TermSeries  # noqa: E402
+
+overview = sys.modules["pages.overview"]
+academic = sys.modules["pages.academic"]
+
+DEFAULT_SIZES = [400, 100_000, 1_000_000, 10_000_000]
+NOISE_FLOOR_MS = 1.0
+
+
+def synthesize(rows, seed=0):
+    base = load_frame()
+    index = np.random.default_rng(seed).integers(0, len(base), rows)
+    return base.iloc[index].reset_index(drop=True)
+
+
+CALLBACK_INPUTS = {
+    ("url", "pathname"): "/academic",
+    ("school-filter", "value"): ["All", "GP", "MS"],
+    ("academic-school-filter", "value"): ["All", "GP", "MS"],
+    ("support-factor", "value"): "schoolsup",
+    ("lifestyle-factor", "value"): "studytime",
+    ("personal-factor", "value"): "absences",
+    ("overview-filters", "data"): {},
+    ("academic-filters", "data"): {},
+    ("academic-trend-group", "value"): "sex",
+    ("academic-trend-range", "value"): (0, 2),
+    ("academic-trend-window", "value"): 2,
+}
+
+FILTERS = {"sex": ["F"], "Mjob": ["health", "teacher"], "age": {"between": [15, 17]}}
+
+
+def _payload(output_key, dep, values):
+    if output_key.startswith(".."):
+        outputs = [dict(zip(("id", "property"), o.split(".", 1)))
+                   for o in output_key[2:-2].split("...")]
+    else:
+        outputs = dict(zip(("id", "property"), output_key.split(".", 1)))
+    inputs = [{"id": i["id"], "property": i["property"], "value": values[(i["id"], i["property"])]}
+              for i in dep["inputs"]]
+    return {"output": output_key, "outputs": outputs, "inputs": inputs,
+            "changedPropIds": [f"{inputs[0]['id']}.{inputs[0]['property']}"]}
+
+
+def callback_cases():
+    client = app.server.test_client()
+    deps = client.get("/_dash-dependencies").get_json()
+    cases = {}
+    for dep in deps:
+        keys = [(i["id"], i["property"]) for i in dep["inputs"]]
+        if dep.get("clientside_function") or any(key not in CALLBACK_INPUTS for key in keys):
+            continue
+        func = app.app.callback_map[dep["output"]]["callback"]
+        name = getattr(func, "__wrapped__", func).__name__
+        variants = [CALLBACK_INPUTS[key] for key in keys if isinstance(CALLBACK_INPUTS[key], list)]
+        for choice in (variants[0] if variants else [None]):
+            values = {key: choice if isinstance(CALLBACK_INPUTS[key], list) else CALLBACK_INPUTS[key]
+                      for key in keys}
+            label = f"callback/{name}" + (f"[{choice}]" if choice is not None else "")
+            cases[label] = _payload(dep["output"], dep, values)
+    return cases
+
+
+FACTOR_CHARTS = [("schoolsup", "box"), ("studytime", "violin"), ("absences", "strip"), ("Walc", "bar")]
+
+
+def builder_cases(cube):
+    return {
+        "figure/plot_categorical_bar": lambda: overview.plot_categorical_bar(
+            overview.categorical_bar_values(cube, "All", "sex", ["F", "M"]), "Gender", ["F", "M"],
+            {"F": "Female", "M": "Male"}),
+        "figure/plot_donut": lambda: overview.plot_donut("Has Internet Access", 83.3),
+        "figure/plot_grade_distribution": lambda: overview.plot_grade_distribution(
+            overview.grade_distribution_bins(cube, "All")),
+        **{f"figure/plot_grade_by_factor[{chart}]": (lambda f=factor, c=chart:
+                                                      academic.plot_grade_by_factor(cube, "All", f, c))
+           for factor, chart in FACTOR_CHARTS},
+        **{f"traces/grade_by_factor_traces[{chart}]": (lambda f=factor, c=chart:
+                                                        academic.grade_by_factor_traces(cube, "All", f, c))
+           for factor, chart in FACTOR_CHARTS},
+        "figure/plot_grade_trend": lambda: academic.plot_grade_trend(
+            academic.grade_trend_traces(["F", "M"], np.array([[11.2, 11.5, 11.9], [10.8, 10.9, 11.1]]), "sex",
+                                        ["G1", "G2", "G3"], 0),
+            academic.trend_xaxis(["G1", "G2", "G3"], 0, 2)),
+    }
+
+
+def measure(func, repeat, size_of=None):
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    entry = {"median_ms": statistics.median(times), "min_ms": min(times),
+             "peak_alloc_kb": peak // 1024}
+    if size_of is not None:
+        entry["json_bytes"] = size_of(result)
+    return entry
+
+
+def run(sizes, repeat):
+    client = app.server.test_client()
+    callbacks = callback_cases()
+    results = {}
+    for rows in sizes:
+        frame = synthesize(rows)
+        results[f"{rows}/data/build_cube"] = measure(lambda: build_cube(frame), repeat)
+        results[f"{rows}/data/compute_metrics"] = measure(lambda: compute_metrics(frame), repeat)
+        results[f"{rows}/data/bitmap_index"] = measure(lambda: BitmapIndex(frame), repeat)
+        index = BitmapIndex(frame)
+        results[f"{rows}/data/bitmap_select"] = measure(lambda: index.select(FILTERS), repeat)
+        results[f"{rows}/data/bitmap_view"] = measure(lambda: index.view(index.select(FILTERS)), repeat)
+        if PARALLEL_WORKERS:
+            views = SharedViews(frame)
+            results[f"{rows}/data/shared_view"] = measure(lambda: views.view(index.select(FILTERS)), repeat)
+            del views
+        results[f"{rows}/data/stratified_sample"] = measure(lambda: StratifiedSample(frame), repeat)
+        sample = StratifiedSample(frame)
+        results[f"{rows}/data/sampled_view"] = measure(lambda: sample.view(index.select(FILTERS)), repeat)
+        results[f"{rows}/data/sort_index"] = measure(lambda: SortIndex(frame), repeat)
+        results[f"{rows}/data/term_series"] = measure(lambda: TermSeries(frame), repeat)
+        series = TermSeries(frame)
+        selected = np.unpackbits(index.select(FILTERS), count=rows).astype(bool)
+        results[f"{rows}/data/term_means"] = measure(
+            lambda: series.means("All", "sex", 0, len(series.terms) - 1, 2, selected), repeat)
+        snapshot = manager.swap_frame(frame)
+        factors = [dim for dim in snapshot.cube.levels if dim != "school"]
+        results[f"{rows}/data/factor_tests"] = measure(lambda: factor_tests(snapshot.cube, factors), repeat)
+        results[f"{rows}/data/moment_sums"] = measure(lambda: moment_sums(frame, snapshot.cube.schools), repeat)
+        for name, func in builder_cases(snapshot.cube).items():
+            results[f"{rows}/{name}"] = measure(func, repeat, lambda fig: len(to_json_plotly(fig)))
+
+        def post(body):
+            aggregate_cache.clear()
+            figure_cache.clear()
+            response = client.post("/_dash-update-component", json=body)
+            assert response.status_code == 200, response.data[:500]
+            return response
+        for name, body in callbacks.items():
+            results[f"{rows}/{name}"] = measure(lambda b=body: post(b), repeat, lambda r: len(r.data))
+            results[f"{rows}/{name}[cached]"] = measure(
+                lambda b=body: client.post("/_dash-update-component", json=b), repeat)
+        del frame, snapshot, index, sample, series, selected
+        print(f"{rows:>10} rows done", file=sys.stderr)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, entry in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        new_ms, old_ms = entry["median_ms"], old["median_ms"]
+        if new_ms > old_ms * (1 + threshold) and new_ms - old_ms > NOISE_FLOOR_MS:
+            regressions.append((key, old_ms, new_ms))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard figure builders and callbacks.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated row counts to synthesize")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative slowdown of median time before failing")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat)
+    report = {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    width = max(len(key) for key in results)
+    for key, entry in results.items():
+        size = f"{entry['json_bytes']:>10}B" if "json_bytes" in entry else ""
+        print(f"{key:<{width}}  {entry['median_ms']:>10.2f} ms  {entry['peak_alloc_kb']:>9} KiB {size}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for key, old_ms, new_ms in regressions:
+            print(f"REGRESSION {key}: {old_ms:.2f} ms -> {new_ms:.2f} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
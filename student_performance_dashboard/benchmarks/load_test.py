@@ -0,0 +1,361 @@
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from datastore import load_frame  # noqa: E402
+from schema import BOOL_COLUMNS  # noqa: E402
+
+SCHOOLS = ["All", "GP", "MS"]
+FILTER_CHOICES = [{}, {"sex": ["F"]}, {"Mjob": ["health", "teacher"]}, {"age": {"between": [15, 17]}},
+                  {"sex": ["M"], "internet": [True]}]
+# Values each input takes in a simulated session; the first one is the page's initial state.
+PAGES = {
+    "overview": {
+        "path": "/",
+        "inputs": {
+            ("school-filter", "value"): SCHOOLS,
+            ("overview-filters", "data"): FILTER_CHOICES,
+        },
+    },
+    "academic": {
+        "path": "/academic",
+        "inputs": {
+            ("academic-school-filter", "value"): SCHOOLS,
+            ("academic-filters", "data"): FILTER_CHOICES,
+            ("support-factor", "value"): ["schoolsup", "famsup", "paid", "internet"],
+            ("lifestyle-factor", "value"): ["studytime", "freetime", "goout", "activities"],
+            ("personal-factor", "value"): ["Walc", "Dalc", "absences", "health"],
+            ("academic-trend-group", "value"): ["All", "sex", "school", "higher"],
+            ("academic-trend-range", "value"): [[0, 2], [1, 2]],
+            ("academic-trend-window", "value"): [1, 2],
+        },
+    },
+}
+READY_TIMEOUT = 180
+MEMORY_INTERVAL = 0.5
+NOISE_FLOOR_MS = 1.0
+
+
+def write_dataset(rows, directory, seed=0):
+    base = load_frame()
+    frame = base.iloc[np.random.default_rng(seed).integers(0, len(base), rows)].reset_index(drop=True)
+    frame = frame.assign(**{col: np.where(frame[col], "yes", "no") for col in BOOL_COLUMNS})
+    path = os.path.join(directory, "student_data.csv")
+    frame.drop(columns=["final_grade"], errors="ignore").to_csv(path, index=False)
+    return path
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port, env):
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+                   "--threads", str(args.threads), "--timeout", "120", "--graceful-timeout", "5",
+                   "--log-level", "warning"]
+        command += ["--preload"] if args.preload else []
+        command += ["app:server"]
+    else:
+        command = [sys.executable, "-c", "import logging; logging.getLogger('werkzeug').setLevel(logging.ERROR); "
+                   f"from app import server; server.run('127.0.0.1', {port}, threaded=True)"]
+    return subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL)
+
+
+def wait_ready(port, process):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"server not ready after {READY_TIMEOUT}s")
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class MemoryMonitor(threading.Thread):
+    # Samples the resident memory of the server and its worker processes (Linux /proc only).
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_worker_kb = 0
+        self.peak_total_kb = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        pids = [self.pid, *_children(self.pid)]
+        sizes = [size for size in map(_rss_kb, pids) if size is not None]
+        if sizes:
+            workers = sizes[1:] or sizes
+            self.peak_worker_kb = max(self.peak_worker_kb, max(workers))
+            self.peak_total_kb = max(self.peak_total_kb, sum(sizes))
+        return sizes
+
+    def run(self):
+        while not self.stopped.wait(MEMORY_INTERVAL):
+            self.sample()
+
+
+def callback_plan(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    connection.request("GET", "/_dash-dependencies")
+    deps = json.loads(connection.getresponse().read())
+    plan = {}
+    for page, spec in PAGES.items():
+        plan[page] = [dep for dep in deps if not dep.get("clientside_function") and dep["inputs"]
+                      and all((i["id"], i["property"]) in spec["inputs"] for i in dep["inputs"])]
+    return plan
+
+
+def payload(dep, state, changed):
+    if dep["output"].startswith(".."):
+        outputs = [dict(zip(("id", "property"), o.split(".", 1))) for o in dep["output"][2:-2].split("...")]
+    else:
+        outputs = dict(zip(("id", "property"), dep["output"].split(".", 1)))
+    inputs = [{"id": i["id"], "property": i["property"], "value": state[(i["id"], i["property"])]}
+              for i in dep["inputs"]]
+    return {"output": dep["output"], "outputs": outputs, "inputs": inputs,
+            "state": [{"id": s["id"], "property": s["property"], "value": state.get((s["id"], s["property"]))}
+                      for s in dep.get("state", [])],
+            "changedPropIds": [f"{key[0]}.{key[1]}" for key in changed]}
+
+
+def callback_name(dep):
+    return dep["output"].strip(".").split("...")[0].split("@")[0]
+
+
+class User(threading.Thread):
+    # One simulated session after another: open a page, let its callbacks render it, then change
+    # one input at a time and fire every callback that depends on it, as the Dash renderer does.
+    def __init__(self, port, plan, args, deadline, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.plan = plan
+        self.args = args
+        self.deadline = deadline
+        self.random = random.Random(seed)
+        self.samples = []
+        self.errors = 0
+        self.connection = None
+
+    def request(self, method, path, name, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        if self.args.accept_encoding:
+            headers["Accept-Encoding"] = self.args.accept_encoding
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            self.connection.request(method, path, body=data, headers=headers)
+            response = self.connection.getresponse()
+            size = len(response.read())
+            ok = response.status in (200, 204)
+        except (OSError, http.client.HTTPException):
+            self.connection = None
+            ok = False
+        elapsed = time.perf_counter() - start
+        if ok:
+            self.samples.append((name, elapsed, size))
+        else:
+            self.errors += 1
+
+    def fire(self, deps, state, changed):
+        for dep in deps:
+            self.request("POST", "/_dash-update-component", callback_name(dep), payload(dep, state, changed))
+
+    def session(self):
+        page = self.random.choice(list(PAGES))
+        spec = PAGES[page]
+        state = {key: choices[0] for key, choices in spec["inputs"].items()}
+        self.request("GET", spec["path"], f"GET {spec['path']}")
+        self.fire(self.plan[page], state, list(state))
+        for _ in range(self.args.steps):
+            if time.monotonic() >= self.deadline:
+                return
+            time.sleep(self.args.think)
+            key = self.random.choice(list(spec["inputs"]))
+            state[key] = self.random.choice(spec["inputs"][key])
+            self.fire([dep for dep in self.plan[page]
+                       if key in [(i["id"], i["property"]) for i in dep["inputs"]]], state, [key])
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline:
+                self.session()
+        finally:
+            if self.connection is not None:
+                self.connection.close()
+
+
+def percentiles(seconds):
+    if len(seconds) < 2:
+        value = seconds[0] * 1000 if seconds else float("nan")
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    cuts = statistics.quantiles(seconds, n=100, method="inclusive")
+    return {"p50_ms": cuts[49] * 1000, "p95_ms": cuts[94] * 1000, "p99_ms": cuts[98] * 1000}
+
+
+def run(args):
+    port = args.port or free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        if args.rows:
+            env["STUDENT_DATA_PATH"] = write_dataset(args.rows, directory)
+            env["STUDENT_ARTIFACT_PATH"] = os.path.join(directory, "missing.columns")
+        process = start_server(args, port, env)
+        try:
+            wait_ready(port, process)
+            plan = callback_plan(port)
+            monitor = MemoryMonitor(process.pid)
+            idle = monitor.sample()
+            idle = max(idle[1:] or idle, default=None)
+            # Warm every worker's caches the way a first wave of users would, then measure.
+            for page, spec in PAGES.items():
+                User(port, plan, args, 0, 0).fire(plan[page], {k: c[0] for k, c in spec["inputs"].items()},
+                                                  list(spec["inputs"]))
+            monitor.start()
+            start = time.monotonic()
+            users = [User(port, plan, args, start + args.duration, seed) for seed in range(args.users)]
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            elapsed = time.monotonic() - start
+            monitor.stopped.set()
+            monitor.sample()
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    samples = [sample for user in users for sample in user.samples]
+    by_name, sizes = {}, {}
+    for name, seconds, size in samples:
+        by_name.setdefault(name, []).append(seconds)
+        sizes.setdefault(name, []).append(size)
+    return {
+        "requests": len(samples),
+        "errors": sum(user.errors for user in users),
+        "seconds": elapsed,
+        "throughput_rps": len(samples) / elapsed,
+        **percentiles([seconds for _, seconds, _ in samples]),
+        "received_kb": sum(size for _, _, size in samples) / 1024,
+        "idle_worker_rss_kb": idle,
+        "peak_worker_rss_kb": monitor.peak_worker_kb or None,
+        "peak_total_rss_kb": monitor.peak_total_kb or None,
+        "callbacks": {name: {"requests": len(values), **percentiles(values),
+                             "mean_response_kb": statistics.fmean(sizes[name]) / 1024}
+                      for name, values in sorted(by_name.items())},
+    }
+
+
+def compare(result, baseline, threshold):
+    regressions = []
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        if result[key] > baseline[key] * (1 + threshold) and result[key] - baseline[key] > NOISE_FLOOR_MS:
+            regressions.append((key, baseline[key], result[key]))
+    if result["throughput_rps"] < baseline["throughput_rps"] * (1 - threshold):
+        regressions.append(("throughput_rps", baseline["throughput_rps"], result["throughput_rps"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay concurrent dashboard sessions against a local server.")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep the users running")
+    parser.add_argument("--steps", type=int, default=10, help="input changes per session before a new one starts")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a user waits between input changes")
+    parser.add_argument("--rows", type=int, default=0, help="synthesize a dataset of this many rows; 0 uses the real one")
+    parser.add_argument("--server", choices=["gunicorn", "flask"],
+                        default="gunicorn" if importlib.util.find_spec("gunicorn") else "flask")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--preload", action="store_true", help="load the app in the gunicorn master")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--accept-encoding", default="gzip, br",
+                        help="Accept-Encoding header sent with every request; empty asks for plain bodies")
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative slowdown of latency or throughput before failing")
+    args = parser.parse_args()
+
+    result = run(args)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "result": result,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{result['requests']} requests, {result['errors']} errors in {result['seconds']:.1f}s: "
+          f"{result['throughput_rps']:.1f} req/s, {result['received_kb'] / 1024:.1f} MiB received")
+    print(f"latency p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms")
+    if result["peak_worker_rss_kb"]:
+        print(f"peak RSS {result['peak_worker_rss_kb'] // 1024} MiB per worker, "
+              f"{result['peak_total_rss_kb'] // 1024} MiB in total")
+    width = max((len(name) for name in result["callbacks"]), default=0)
+    for name, entry in result["callbacks"].items():
+        print(f"  {name:<{width}}  {entry['requests']:>7}  p50 {entry['p50_ms']:>8.1f}  "
+              f"p95 {entry['p95_ms']:>8.1f}  p99 {entry['p99_ms']:>8.1f} ms  {entry['mean_response_kb']:>7.1f} KB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["result"]
+        regressions = compare(result, baseline, args.threshold)
+        for key, old, new in regressions:
+            print(f"REGRESSION {key}: {old:.2f} -> {new:.2f}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import copy
+from collections.abc import Hashable
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, CUBE_MEASURES, build_cube
+from metrics_engine import METRIC_COLUMNS, metric_totals
+from schema import BOOL_COLUMNS, CATEGORICAL_COLUMNS, INT8_COLUMNS, GRADE_COLUMNS
+
+FILTER_COLUMNS = CATEGORICAL_COLUMNS + BOOL_COLUMNS + [c for c in INT8_COLUMNS if c not in GRADE_COLUMNS]
+SORT_COLUMNS = ["school", "sex", "age", "address", "studytime", "failures", "schoolsup", "famsup",
+                "internet", "higher", "absences", "G1", "G2", "G3", "final_grade"]
+# Selections below this fraction of the rows are sorted directly instead of scanning a full order.
+SORT_SCAN_FRACTION = 16
+VIEW_COLUMNS = list(dict.fromkeys(CUBE_DIMENSIONS + CUBE_MEASURES + METRIC_COLUMNS))
+
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def _numeric(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+class BitmapIndex:
+    def __init__(self, frame, columns=FILTER_COLUMNS):
+        self.frame = frame
+        self.rows = len(frame)
+        self.values = {}
+        self.bitmaps = {}
+        for col in columns:
+            codes, uniques = pd.factorize(frame[col], sort=True)
+            self.values[col] = uniques.tolist()
+            self.bitmaps[col] = [np.packbits(codes == i) for i in range(len(uniques))]
+        self._all = np.packbits(np.ones(self.rows, dtype=bool))
+        self._none = np.zeros_like(self._all)
+
+    def _column(self, col, values):
+        selected = set(values)
+        bitmaps = [b for v, b in zip(self.values[col], self.bitmaps[col]) if v in selected]
+        return reduce(np.bitwise_or, bitmaps, self._none)
+
+    def evaluate(self, expr):
+        if "and" in expr:
+            return reduce(np.bitwise_and, map(self.evaluate, expr["and"]), self._all)
+        if "or" in expr:
+            return reduce(np.bitwise_or, map(self.evaluate, expr["or"]), self._none)
+        if "not" in expr:
+            return np.bitwise_and(np.invert(self.evaluate(expr["not"])), self._all)
+        col = expr["column"]
+        if col not in self.bitmaps:
+            raise ValueError(f"{col} is not an indexed filter column")
+        if "between" in expr:
+            lo, hi = expr["between"]
+            return self._column(col, [v for v in self.values[col] if lo <= v <= hi])
+        return self._column(col, expr["in"])
+
+    def normalize(self, filters):
+        # Canonical AND-of-ORs form: drops unknown values and selections that keep everything.
+        # Filters arrive from the browser, so unknown columns and malformed specs are dropped too.
+        normalized = {}
+        for col, spec in sorted(filters.items() if isinstance(filters, dict) else []):
+            if col not in self.values:
+                continue
+            if isinstance(spec, dict):
+                bounds = spec.get("between")
+                if not (isinstance(bounds, (list, tuple)) and len(bounds) == 2 and all(map(_numeric, bounds))
+                        and all(map(_numeric, self.values[col]))):
+                    continue
+                lo, hi = bounds
+                values = [v for v in self.values[col] if lo <= v <= hi]
+            elif isinstance(spec, (list, tuple)):
+                wanted = {v for v in spec if isinstance(v, Hashable)}
+                values = [v for v in self.values[col] if v in wanted]
+            else:
+                continue
+            if len(values) < len(self.values[col]):
+                normalized[col] = values
+        return normalized
+
+    def select(self, filters):
+        return self.evaluate({"and": [{"column": col, "in": values}
+                                      for col, values in self.normalize(filters).items()]})
+
+    def count(self, bitmap):
+        return int(_POPCOUNT[bitmap].sum())
+
+    def positions(self, bitmap):
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.rows))
+
+    def view(self, bitmap):
+        rows = self.frame[VIEW_COLUMNS].take(self.positions(bitmap))
+        return build_cube(rows), metric_totals(rows)
+
+    def updated(self, frame, positions):
+        # The index of `frame`, which differs from this one's frame only at `positions` (appended
+        # rows included). Only the bitmaps of values that lose or gain one of those rows are patched.
+        index = copy.copy(self)
+        index.frame, index.rows = frame, len(frame)
+        index._all = np.packbits(np.ones(index.rows, dtype=bool))
+        index._none = np.zeros_like(index._all)
+        grow = len(index._all) - len(self._all)
+        byte, bit = positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8)
+        index.values, index.bitmaps = {}, {}
+        for col, bitmaps in self.bitmaps.items():
+            after = frame[col].take(positions).to_numpy()
+            touched = set(self.frame[col].take(positions[positions < self.rows]).tolist()) | set(after.tolist())
+            previous = dict(zip(self.values[col], bitmaps))
+            index.values[col], index.bitmaps[col] = [], []
+            for value in sorted(previous.keys() | touched):
+                bitmap = previous.get(value, self._none)
+                if grow:
+                    bitmap = np.concatenate([bitmap, np.zeros(grow, dtype=np.uint8)])
+                if value in touched:
+                    bitmap = bitmap if grow else bitmap.copy()
+                    hit = after == value
+                    np.bitwise_and.at(bitmap, byte, ~bit)
+                    np.bitwise_or.at(bitmap, byte[hit], bit[hit])
+                    if not bitmap.any():
+                        continue
+                index.values[col].append(value)
+                index.bitmaps[col].append(bitmap)
+        return index
+
+
+def _sort_keys(values):
+    return values.cat.codes.to_numpy() if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+
+
+def _bisect(order, keys, row_keys, rows):
+    # Where each (key, row) pair belongs in `order`, which is sorted by key and then by row.
+    lo, hi = np.zeros(len(rows), dtype=np.int64), np.full(len(rows), len(order))
+    while (lo < hi).any():
+        mid = (lo + hi) // 2
+        at = order[np.minimum(mid, len(order) - 1)]
+        less = (keys[at] < row_keys) | ((keys[at] == row_keys) & (at < rows))
+        lo = np.where((lo < hi) & less, mid + 1, lo)
+        hi = np.where((lo < hi) & ~less, mid, hi)
+    return lo
+
+
+class SortIndex:
+    def __init__(self, frame, columns=SORT_COLUMNS):
+        # One stable argsort per column: the rows of any selection in column order are the
+        # selected entries of this permutation, ties in student_id order (reversed when descending).
+        self.frame = frame
+        self.orders = {col: np.argsort(_sort_keys(frame[col]), kind="stable").astype(np.int32)
+                       for col in columns}
+
+    def sort(self, positions, col, descending=False):
+        # `positions` (ascending) in the order of this column. A small selection sorts its own keys,
+        # ties staying in row order as in the full order; a large one is read off the full order.
+        if len(positions) < len(self.frame) // SORT_SCAN_FRACTION:
+            ordered = positions[np.argsort(_sort_keys(self.frame[col])[positions], kind="stable")]
+        else:
+            selected = np.zeros(len(self.frame), dtype=bool)
+            selected[positions] = True
+            ordered = self.orders[col][selected[self.orders[col]]]
+        return ordered[::-1] if descending else ordered
+
+    def updated(self, frame, positions):
+        # Finds the changed rows by binary search, takes them out and inserts them again at their
+        # new keys. Categories stay sorted when new ones arrive, so the other rows keep their order.
+        index = SortIndex.__new__(SortIndex)
+        index.frame, index.orders = frame, {}
+        before = positions[positions < len(self.frame)]
+        for col, order in self.orders.items():
+            keys, new_keys = _sort_keys(self.frame[col]), _sort_keys(frame[col])
+            rest = np.delete(order, _bisect(order, keys, keys[before], before))
+            added = positions[np.lexsort((positions, new_keys[positions]))]
+            index.orders[col] = np.insert(rest, _bisect(rest, new_keys, new_keys[added], added),
+                                          added.astype(np.int32))
+        return index
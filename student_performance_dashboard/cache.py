@@ -0,0 +1,363 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+
+from dataset import manager
+from datastore import BASE_DIR
+
+SHARED_CACHE = os.environ.get("SHARED_CACHE")
+SHARED_CACHE_TTL = int(os.environ.get("SHARED_CACHE_TTL", 7 * 24 * 3600))
+SWEEP_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def discard(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class DirectoryStore:
+    def __init__(self, directory, ttl=SHARED_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._swept = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, name):
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.ttl:
+                    return None
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, name, value):
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        self.sweep()
+
+    def sweep(self):
+        # Every deploy and data version writes new names, so expired entries are deleted, along
+        # with temp files of killed writers. Each process sweeps at most once a minute.
+        now = time.time()
+        if now - self._swept < SWEEP_INTERVAL:
+            return
+        self._swept = now
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def claim(self, name, lease):
+        path = os.path.join(self.directory, name)
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                # A holder that was killed never releases; once its lease is over the claim is free.
+                try:
+                    if time.time() - os.stat(path).st_mtime < lease:
+                        return False
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def size(self):
+        return sum(1 for name in os.listdir(self.directory) if ".tmp-" not in name)
+
+
+class RedisStore:
+    def __init__(self, client, ttl=SHARED_CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, name):
+        return self.client.get(name)
+
+    def set(self, name, value):
+        self.client.set(name, value, ex=self.ttl)
+
+    def claim(self, name, lease):
+        return bool(self.client.set(name, b"", nx=True, ex=lease))
+
+    def release(self, name):
+        self.client.delete(name)
+
+    def size(self):
+        return self.client.dbsize()
+
+
+def open_store(location):
+    if location.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return RedisStore(redis.Redis.from_url(location))
+    return DirectoryStore(location)
+
+
+def _code_fingerprint():
+    digest = hashlib.blake2b(digest_size=8)
+    for root, dirs, files in sorted(os.walk(BASE_DIR)):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(".py"):
+                with open(os.path.join(root, name), "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _pack(value):
+    # Plain JSON plus tagged tuples, numpy arrays and non-string keys. Unlike pickle, reading
+    # an entry cannot run code, whoever wrote it.
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return {"__objects__": [list(value.shape), [_pack(v) for v in value.ravel().tolist()]]}
+        data = base64.b64encode(np.ascontiguousarray(value).tobytes()).decode()
+        return {"__ndarray__": [value.dtype.str, list(value.shape), data]}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {"__tuple__": [_pack(v) for v in value]}
+    if isinstance(value, list):
+        return [_pack(v) for v in value]
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith("__") for k in value):
+            return {k: _pack(v) for k, v in value.items()}
+        return {"__dict__": [[_pack(k), _pack(v)] for k, v in value.items()]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(f"{type(value).__name__} cannot be stored in the shared cache")
+
+
+def _unpack(obj):
+    if len(obj) != 1:
+        return obj
+    (tag, body), = obj.items()
+    if tag == "__ndarray__":
+        dtype, shape, data = body
+        return np.frombuffer(base64.b64decode(data), dtype=np.dtype(dtype)).reshape(shape).copy()
+    if tag == "__objects__":
+        shape, items = body
+        array = np.empty(len(items), dtype=object)
+        array[:] = items
+        return array.reshape(shape)
+    if tag == "__tuple__":
+        return tuple(body)
+    if tag == "__dict__":
+        return {k: v for k, v in body}
+    return obj
+
+
+def encode(value):
+    return json.dumps(_pack(value), separators=(",", ":")).encode()
+
+
+def decode(blob):
+    return json.loads(blob, object_hook=_unpack)
+
+
+class SharedCache:
+    def __init__(self, store):
+        self.store = store
+        self.namespace = _code_fingerprint()
+        self.hits = 0
+        self.misses = 0
+
+    def key_name(self, key):
+        return hashlib.blake2b(repr((self.namespace, key)).encode(), digest_size=20).hexdigest()
+
+    def get(self, key, default=None):
+        blob = self.store.get(self.key_name(key))
+        if blob is None:
+            self.misses += 1
+            return default
+        try:
+            value = decode(blob)
+        except (TypeError, ValueError):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            blob = encode(value)
+        except TypeError:
+            logger.warning("not sharing %s", key[0], exc_info=True)
+            return
+        self.store.set(self.key_name(key), blob)
+
+    def claim(self, key, lease):
+        return self.store.claim(self.key_name(key) + ".claim", lease)
+
+    def release(self, key):
+        self.store.release(self.key_name(key) + ".claim")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self.store.size(),
+            "maxsize": None,
+        }
+
+
+aggregate_cache = LRUCache(int(os.environ.get("AGGREGATE_CACHE_SIZE", 64)))
+figure_cache = LRUCache(int(os.environ.get("FIGURE_CACHE_SIZE", 512)))
+# Drill-down selections hold one row position per matching student, so only a few are kept.
+drilldown_cache = LRUCache(int(os.environ.get("DRILLDOWN_CACHE_SIZE", 8)))
+shared_cache = SharedCache(open_store(SHARED_CACHE)) if SHARED_CACHE else None
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+_local = threading.local()
+
+
+def mark_provisional():
+    # Values computed from an approximate view are returned but not cached, so the
+    # exact view replaces them once it is ready.
+    _local.provisional = True
+
+
+def _compute(func, args, caches):
+    outer = getattr(_local, "provisional", False)
+    _local.provisional = False
+    try:
+        value = func(*args)
+        provisional = _local.provisional
+    finally:
+        _local.provisional = outer or _local.provisional
+    if not provisional:
+        for cache, key in caches:
+            cache.set(key, value)
+    return value
+
+
+def memoize(cache, shared=False):
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args):
+            with manager.pinned() as snapshot:
+                key = (name, snapshot.version, _freeze(args))
+                caches = [(cache, key)]
+                if shared and shared_cache is not None and snapshot.content_key is not None:
+                    caches.append((shared_cache, (name, snapshot.content_key, key[2])))
+                for store, store_key in caches:
+                    value = store.get(store_key, _MISSING)
+                    if value is not _MISSING:
+                        if store is not cache:
+                            cache.set(key, value)
+                        return value
+                return _compute(func, args, caches)
+        def cached(*args):
+            return (name, manager.current().version, _freeze(args)) in cache
+
+        wrapper.cache = cache
+        wrapper.cached = cached
+        return wrapper
+    return decorator
+
+
+def _discard_stale_versions(version):
+    for cache in (aggregate_cache, figure_cache, drilldown_cache):
+        cache.discard(lambda key: key[1] != version)
+
+
+manager.on_swap(_discard_stale_versions)
+
+
+def cache_stats():
+    stats = {"aggregates": aggregate_cache.stats(), "figures": figure_cache.stats(),
+             "drilldown": drilldown_cache.stats()}
+    if shared_cache is not None:
+        stats["shared"] = shared_cache.stats()
+    return stats
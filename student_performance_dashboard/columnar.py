@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from schema import BOOL_COLUMNS, CATEGORICAL_COLUMNS, SCHEMA_COLUMNS
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+STORED_COLUMNS = SCHEMA_COLUMNS + ["final_grade"]
+BLOCK_ROWS = 1 << 22
+
+
+def _count_rows(path):
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        while block := f.read(1 << 24):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return lines - 1 + (last != b"\n")
+
+
+def _column_file(out_dir, col, staging=False):
+    return os.path.join(out_dir, f"{col}.staging.npy" if staging else f"{col}.npy")
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def write_artifact(chunks, csv_path, target_dir):
+    rows = _count_rows(csv_path)
+    out_dir = f"{target_dir}.tmp-{os.getpid()}"
+    os.makedirs(out_dir)
+    arrays, categories = {}, {col: [] for col in CATEGORICAL_COLUMNS}
+    offset = 0
+    for chunk in chunks:
+        stop = offset + len(chunk)
+        if stop > rows:
+            raise ValueError(f"{csv_path} has more rows than lines; quoted newlines are not supported")
+        for col in STORED_COLUMNS:
+            if col in CATEGORICAL_COLUMNS:
+                known = categories[col]
+                known.extend(c for c in chunk[col].cat.categories if c not in known)
+                values = chunk[col].cat.set_categories(known).cat.codes.to_numpy(np.int16)
+            else:
+                values = chunk[col].to_numpy()
+            if col not in arrays:
+                arrays[col] = np.lib.format.open_memmap(
+                    _column_file(out_dir, col, staging=col in CATEGORICAL_COLUMNS),
+                    mode="w+", dtype=values.dtype, shape=(rows,))
+            arrays[col][offset:stop] = values
+        offset = stop
+    if offset != rows:
+        raise ValueError(f"expected {rows} rows in {csv_path}, parsed {offset}")
+
+    columns = {}
+    for col, array in arrays.items():
+        if col in CATEGORICAL_COLUMNS:
+            known = categories[col]
+            ordered = sorted(known)
+            remap = np.array([ordered.index(c) for c in known], dtype=np.int16)
+            codes = np.lib.format.open_memmap(_column_file(out_dir, col), mode="w+",
+                                              dtype=np.int8 if len(ordered) < 128 else np.int16,
+                                              shape=(rows,))
+            for start in range(0, rows, BLOCK_ROWS):
+                codes[start:start + BLOCK_ROWS] = remap[array[start:start + BLOCK_ROWS]]
+            arrays[col] = codes
+            os.remove(_column_file(out_dir, col, staging=True))
+            columns[col] = {"kind": "category", "categories": ordered}
+        else:
+            columns[col] = {"kind": "bool" if col in BOOL_COLUMNS else "numeric", "dtype": str(array.dtype)}
+        arrays[col].flush()
+    manifest = {"format": FORMAT_VERSION, "rows": rows, "source": _source_stamp(csv_path), "columns": columns}
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    _swap_in(out_dir, target_dir)
+    return manifest
+
+
+def _swap_in(new_dir, target_dir):
+    # Running workers may still have the old columns memory-mapped, so the
+    # old files are unlinked rather than overwritten in place.
+    old_dir = f"{target_dir}.old-{os.getpid()}"
+    if os.path.exists(target_dir):
+        os.rename(target_dir, old_dir)
+    os.rename(new_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def read_manifest(artifact_dir):
+    try:
+        with open(os.path.join(artifact_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == FORMAT_VERSION else None
+
+
+def artifact_is_current(artifact_dir, csv_path):
+    manifest = read_manifest(artifact_dir)
+    if manifest is None:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    stamp = _source_stamp(csv_path)
+    return (stamp["size"], stamp["mtime"]) == (manifest["source"]["size"], manifest["source"]["mtime"])
+
+
+def open_artifact(artifact_dir):
+    manifest = read_manifest(artifact_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"no columnar dataset in {artifact_dir}")
+    data = {}
+    for col, meta in manifest["columns"].items():
+        array = np.load(_column_file(artifact_dir, col), mmap_mode="r")
+        if meta["kind"] == "category":
+            array = pd.Categorical.from_codes(array, categories=meta["categories"], validate=False)
+        data[col] = array
+    return pd.DataFrame(data, copy=False)
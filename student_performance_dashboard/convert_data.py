@@ -0,0 +1,24 @@
+import argparse
+import time
+
+from columnar import write_artifact
+from datastore import ARTIFACT_PATH, DATA_PATH
+from ingest import INGEST_CHUNK_ROWS, iter_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the student CSV into a memory-mappable directory of .npy columns.")
+    parser.add_argument("csv", nargs="?", default=DATA_PATH)
+    parser.add_argument("out_dir", nargs="?", default=ARTIFACT_PATH)
+    parser.add_argument("--chunksize", type=int, default=INGEST_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = write_artifact(iter_chunks(args.csv, args.chunksize), args.csv, args.out_dir)
+    print(f"wrote {manifest['rows']} rows x {len(manifest['columns'])} columns "
+          f"to {args.out_dir} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
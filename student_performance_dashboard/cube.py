@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+from schema import GRADE_COLUMNS
+
+CUBE_DIMENSIONS = ["school", "sex", "address", "famsize", "schoolsup", "famsup",
+                   "paid", "internet", "activities", "higher", "studytime",
+                   "freetime", "goout", "Dalc", "Walc", "health", "absences"]
+CUBE_MEASURES = ["G1", "G2", "G3"]
+
+# final_grade is the mean of three integer grades, so it lives exactly on a
+# 1/3 grid: bin u holds the students whose G1 + G2 + G3 == u.
+GRADE_UNITS = 61
+GRADE_GRID = np.arange(GRADE_UNITS) / 3
+
+
+class GradeCube:
+    def __init__(self, schools, levels, hist, measure_sums):
+        self.schools = schools
+        self.levels = levels
+        self.hist = hist
+        self.measure_sums = measure_sums
+        self.counts = {dim: h.sum(axis=2) for dim, h in hist.items()}
+        self.sums = {dim: h @ GRADE_GRID for dim, h in hist.items()}
+        self.sumsq = {dim: h @ GRADE_GRID ** 2 for dim, h in hist.items()}
+
+    def _rows(self, table, school):
+        if school == "All":
+            return table.sum(axis=0)
+        if school not in self.schools:
+            return np.zeros(table.shape[1:], dtype=table.dtype)
+        return table[self.schools.index(school)]
+
+    def total(self, school):
+        return int(self._rows(self.counts["school"], school).sum())
+
+    def level_counts(self, school, dim):
+        return dict(zip(self.levels[dim], self._rows(self.counts[dim], school).tolist()))
+
+    def proportions(self, school, dim):
+        total = self.total(school)
+        return {level: count / total if total else 0.0
+                for level, count in self.level_counts(school, dim).items()}
+
+    def grade_stats(self, school, dim):
+        counts = self._rows(self.counts[dim], school)
+        sums = self._rows(self.sums[dim], school)
+        sumsq = self._rows(self.sumsq[dim], school)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sums / counts
+            var = sumsq / counts - mean ** 2
+        return pd.DataFrame({"count": counts, "sum": sums, "sumsq": sumsq,
+                             "mean": mean, "std": np.sqrt(np.clip(var, 0, None))},
+                            index=pd.Index(self.levels[dim], name=dim))
+
+    def grade_histogram(self, school, dim=None, level=None):
+        if dim is None:
+            return self._rows(self.hist["school"], school).sum(axis=0)
+        return self._rows(self.hist[dim], school)[self.levels[dim].index(level)]
+
+    def measure_mean(self, school, measure):
+        total = self.total(school)
+        return self._rows(self.measure_sums[measure], school) / total if total else float("nan")
+
+    def grade_mean(self, school):
+        stats = self.grade_stats(school, "school")
+        return stats["sum"].sum() / stats["count"].sum()
+
+
+def grade_units(df):
+    units = df[GRADE_COLUMNS].to_numpy(dtype=np.int64).sum(axis=1)
+    if len(units) and (units.min() < 0 or units.max() >= GRADE_UNITS):
+        raise ValueError("G1, G2 and G3 must lie between 0 and 20")
+    return units
+
+
+def grade_histogram(school_codes, n_schools, codes, n_levels, units, weights=None):
+    flat = (school_codes * n_levels + codes) * GRADE_UNITS + units
+    return np.bincount(flat, weights=weights, minlength=n_schools * n_levels * GRADE_UNITS) \
+        .reshape(n_schools, n_levels, GRADE_UNITS)
+
+
+def build_cube(df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES):
+    school_codes, schools = pd.factorize(df["school"], sort=True)
+    n_schools = len(schools)
+    units = grade_units(df)
+    levels, hist = {}, {}
+    for dim in dimensions:
+        codes, uniques = pd.factorize(df[dim], sort=True)
+        hist[dim] = grade_histogram(school_codes, n_schools, codes, len(uniques), units)
+        levels[dim] = uniques.tolist()
+    measure_sums = {m: np.bincount(school_codes, weights=df[m].to_numpy(dtype=np.float64),
+                                   minlength=n_schools)
+                    for m in measures}
+    return GradeCube(list(schools), levels, hist, measure_sums)
+
+
+def _positions(values, union):
+    index = {value: i for i, value in enumerate(union)}
+    return np.array([index[value] for value in values], dtype=np.intp)
+
+
+def merge_cubes(a, b, sign=1):
+    schools = sorted(set(a.schools) | set(b.schools))
+    levels, hist, measure_sums = {}, {}, {}
+    for dim in a.levels:
+        levels[dim] = sorted(set(a.levels[dim]) | set(b.levels[dim]))
+        merged = np.zeros((len(schools), len(levels[dim]), GRADE_UNITS), dtype=np.int64)
+        for part, factor in ((a, 1), (b, sign)):
+            merged[np.ix_(_positions(part.schools, schools),
+                          _positions(part.levels[dim], levels[dim]))] += factor * part.hist[dim]
+        hist[dim] = merged
+    for measure in a.measure_sums:
+        merged = np.zeros(len(schools))
+        for part, factor in ((a, 1), (b, sign)):
+            merged[_positions(part.schools, schools)] += factor * part.measure_sums[measure]
+        measure_sums[measure] = merged
+    return GradeCube(schools, levels, hist, measure_sums)
@@ -0,0 +1,353 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+from bitmap import BitmapIndex, SortIndex
+from cube import build_cube, merge_cubes
+from datastore import (ARTIFACT_PATH, DATA_PATH, artifact_available, load_frame,
+                       open_artifact, streaming_enabled)
+from ingest import ingest_csv
+from metrics_engine import finalize_totals, merge_totals, metric_totals
+from parallel import PARALLEL_MIN_ROWS, PARALLEL_WORKERS, SharedViews, in_pool_worker
+from sampling import APPROX_QUERIES, StratifiedSample
+from schema import CATEGORICAL_COLUMNS, coerce_records
+from startup import startup_step
+from timeseries import TermSeries, load_history
+
+RELOAD_INTERVAL = float(os.environ.get("DATA_RELOAD_INTERVAL", 30))
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    def __init__(self, version, fingerprint, base_frame, cube, totals, row_count, delta=None):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.base_frame = base_frame
+        self.cube = cube
+        self.totals = totals
+        self.metrics = finalize_totals(totals)
+        self.row_count = row_count
+        self.delta = delta
+        self.loaded_at = time.time()
+        self._frame = base_frame if delta is None else None
+        self._frame_lock = threading.Lock()
+        self._index = None
+        self._sample = None
+        self._shared_views = None
+        self._term_series = None
+        self._sort_index = None
+
+    @property
+    def frame(self):
+        if self._frame is None and self.base_frame is not None:
+            with self._frame_lock:
+                if self._frame is None:
+                    self._frame = apply_delta(self.base_frame, self.delta)
+        return self._frame
+
+    @property
+    def index(self):
+        frame = self.frame
+        if self._index is None and frame is not None:
+            with self._frame_lock:
+                if self._index is None:
+                    self._index = BitmapIndex(frame)
+        return self._index
+
+    @property
+    def sample(self):
+        frame = self.frame
+        if self._sample is None and frame is not None and APPROX_QUERIES == "on":
+            with self._frame_lock:
+                if self._sample is None:
+                    self._sample = StratifiedSample(frame)
+        return self._sample
+
+    @property
+    def shared_views(self):
+        frame = self.frame
+        large = frame is not None and len(frame) >= PARALLEL_MIN_ROWS
+        if self._shared_views is None and large and PARALLEL_WORKERS and not in_pool_worker():
+            with self._frame_lock:
+                if self._shared_views is None:
+                    self._shared_views = SharedViews(frame)
+        return self._shared_views
+
+    @property
+    def term_series(self):
+        frame = self.frame
+        if self._term_series is None and frame is not None:
+            with self._frame_lock:
+                if self._term_series is None:
+                    self._term_series = TermSeries(frame, load_history())
+        return self._term_series
+
+    @property
+    def sort_index(self):
+        frame = self.frame
+        if self._sort_index is None and frame is not None:
+            with self._frame_lock:
+                if self._sort_index is None:
+                    self._sort_index = SortIndex(frame)
+        return self._sort_index
+
+    def warm(self, names=("index", "sample", "shared_views", "term_series", "sort_index")):
+        # Builds the named row-level structures now rather than on first use.
+        for name in names:
+            getattr(self, name)
+
+    @property
+    def content_key(self):
+        # Only snapshots read straight from the data file can be shared across workers.
+        return self.fingerprint if self.delta is None else None
+
+    def rows(self, student_ids):
+        in_delta = student_ids.isin(self.delta.index) if self.delta is not None else \
+            pd.Series(False, index=student_ids.index)
+        parts = []
+        if in_delta.any():
+            parts.append(self.delta.loc[student_ids[in_delta]])
+        if (~in_delta).any():
+            if self.base_frame is None:
+                raise ValueError("existing students can only be updated when rows are kept in memory")
+            parts.append(self.base_frame.iloc[student_ids[~in_delta].to_numpy()])
+        return _concat(parts)
+
+
+def _concat(frames):
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame()
+    for col in CATEGORICAL_COLUMNS:
+        categories = sorted(set().union(*(f[col].cat.categories for f in frames)))
+        frames = [f.assign(**{col: f[col].cat.set_categories(categories)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _student_ids(values):
+    # Missing ids append; anything else must be a whole number (JSON may send 3.0 next to nulls).
+    ids = pd.Series(np.nan, index=values.index)
+    for key, value in values.items():
+        if value is None or value != value:
+            continue
+        if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, np.integer, np.floating)) \
+                or value % 1:
+            raise ValueError(f"student_id must be an integer, got {value!r}")
+        ids[key] = value
+    return ids
+
+
+def apply_delta(base, delta):
+    # Column by column: a copy of the base with the delta rows written over it or appended.
+    rows = max(len(base), delta.index.max() + 1)
+    positions = delta.index.to_numpy()
+    columns = {}
+    for col in base.columns:
+        values, changed = base[col], delta[col]
+        if col in CATEGORICAL_COLUMNS:
+            categories = sorted(set(values.cat.categories) | set(changed.cat.categories))
+            if categories != list(values.cat.categories):
+                values = values.cat.set_categories(categories)
+            codes = np.empty(rows, dtype=values.cat.codes.dtype)
+            codes[:len(base)] = values.cat.codes.to_numpy()
+            codes[positions] = changed.cat.set_categories(categories).cat.codes.to_numpy()
+            columns[col] = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        else:
+            array = np.empty(rows, dtype=values.dtype)
+            array[:len(base)] = values.to_numpy()
+            array[positions] = changed.to_numpy()
+            columns[col] = array
+    return pd.DataFrame(columns)
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(1 << 22):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_snapshot(version, fingerprint, path=DATA_PATH, artifact_path=ARTIFACT_PATH):
+    if artifact_available(path, artifact_path):
+        frame = open_artifact(artifact_path)
+    elif streaming_enabled(path, artifact_path):
+        cube, totals, rows = ingest_csv(path)
+        return Snapshot(version, fingerprint, None, cube, totals, rows)
+    else:
+        frame = load_frame(path)
+    snapshot = Snapshot(version, fingerprint, frame, build_cube(frame), metric_totals(frame), len(frame))
+    snapshot.warm()
+    return snapshot
+
+
+def carry_forward(old, snapshot, records):
+    # Derive the row-level structures from the previous version's before the new version is
+    # published. Nothing is re-factorized or re-sorted, but every column, bitmap and sort order is
+    # still copied once (older versions stay readable), so an upsert is an O(rows) memory copy.
+    positions = records.index.to_numpy()
+    frame = apply_delta(old.frame, records)
+    snapshot._frame = frame
+    snapshot._index = old.index.updated(frame, positions)
+    snapshot._sort_index = old.sort_index.updated(frame, positions)
+    snapshot._term_series = old.term_series.updated(frame, positions)
+    # Both are opt-in and resample or copy every row anyway.
+    snapshot.warm(["sample", "shared_views"])
+
+
+class DatasetManager:
+    def __init__(self, path=DATA_PATH, artifact_path=ARTIFACT_PATH):
+        self.path = path
+        self.artifact_path = artifact_path
+        self._snapshot = None
+        self._stamps = None
+        self._load_lock = threading.Lock()
+        self._local = threading.local()
+        self._listeners = []
+        self._watcher = None
+        self._watcher_pid = None
+
+    def _stamps_now(self):
+        return _file_stamp(self.path), _file_stamp(os.path.join(self.artifact_path, "manifest.json"))
+
+    def current(self):
+        pinned = getattr(self._local, "snapshot", None)
+        if pinned is not None:
+            return pinned
+        if self._snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._stamps = self._stamps_now()
+                    with startup_step("load dataset"):
+                        self._snapshot = build_snapshot(1, _file_hash(self.path), self.path, self.artifact_path)
+        return self._snapshot
+
+    @contextmanager
+    def pinned(self, snapshot=None):
+        if getattr(self._local, "snapshot", None) is not None:
+            yield self._local.snapshot
+            return
+        self._local.snapshot = snapshot or self.current()
+        try:
+            yield self._local.snapshot
+        finally:
+            self._local.snapshot = None
+
+    def on_swap(self, listener):
+        self._listeners.append(listener)
+
+    def check_for_update(self):
+        stamps = self._stamps_now()
+        if self._snapshot is None or stamps == self._stamps or stamps[0] is None:
+            return False
+        with self._load_lock:
+            old = self._snapshot
+            fingerprint = _file_hash(self.path)
+            if old.fingerprint == fingerprint and stamps[1] == self._stamps[1]:
+                self._stamps = stamps
+                return False
+            snapshot = build_snapshot(old.version + 1, fingerprint, self.path, self.artifact_path)
+            self._snapshot = snapshot
+            self._stamps = stamps
+        logger.info("dataset reloaded as version %s", snapshot.version)
+        for listener in self._listeners:
+            listener(snapshot.version)
+        return True
+
+    def swap_frame(self, frame):
+        with self._load_lock:
+            version = self._snapshot.version + 1 if self._snapshot is not None else 1
+            snapshot = Snapshot(version, None, frame, build_cube(frame), metric_totals(frame), len(frame))
+            self._stamps = self._stamps_now()
+            self._snapshot = snapshot
+        for listener in self._listeners:
+            listener(snapshot.version)
+        return snapshot
+
+    def upsert(self, records):
+        records = coerce_records(pd.DataFrame(records))
+        with self._load_lock:
+            old = self.current()
+            ids = _student_ids(records.pop("student_id") if "student_id" in records else
+                               pd.Series(None, index=records.index, dtype=object))
+            if (ids >= old.row_count).any() or (ids < 0).any():
+                raise ValueError("student_id must refer to an existing student; omit it to append")
+            appended = ids.isna()
+            ids[appended] = old.row_count + np.arange(appended.sum())
+            records.index = pd.Index(ids.astype(np.int64), name="student_id")
+            records = records[~records.index.duplicated(keep="last")]
+            existing = records.index[records.index < old.row_count].to_series()
+            previous = old.rows(existing) if len(existing) else pd.DataFrame()
+
+            cube = merge_cubes(old.cube, build_cube(records))
+            totals = merge_totals(old.totals, metric_totals(records))
+            if len(previous):
+                cube = merge_cubes(cube, build_cube(previous), sign=-1)
+                totals = merge_totals(totals, metric_totals(previous), sign=-1)
+            delta = records if old.delta is None else \
+                _concat([old.delta[~old.delta.index.isin(records.index)].reset_index(),
+                         records.reset_index()]).set_index("student_id")
+            snapshot = Snapshot(old.version + 1, old.fingerprint, old.base_frame, cube, totals,
+                                old.row_count + int(appended.sum()), delta)
+            if old.frame is not None:
+                carry_forward(old, snapshot, records)
+            self._snapshot = snapshot
+        for listener in self._listeners:
+            listener(snapshot.version)
+        return {"version": snapshot.version, "inserted": int(appended.sum()),
+                "updated": len(existing)}
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.check_for_update()
+            except Exception:
+                logger.exception("dataset reload failed; keeping version %s", self._snapshot.version)
+
+    def start_watcher(self, interval=RELOAD_INTERVAL):
+        if interval <= 0 or (self._watcher is not None and self._watcher_pid == os.getpid()):
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                         name="dataset-watcher", daemon=True)
+        self._watcher_pid = os.getpid()
+        self._watcher.start()
+
+
+manager = DatasetManager()
+
+
+def current_snapshot():
+    return manager.current()
+
+
+def dataset_version():
+    return manager.current().version
+
+
+def upsert_records(records):
+    return manager.upsert(records)
+
+
+def consistent_snapshot(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with manager.pinned():
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+from columnar import artifact_is_current, open_artifact
+from schema import READ_OPTIONS, add_final_grade, validate_columns
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.environ.get("STUDENT_DATA_PATH", os.path.join(BASE_DIR, "data", "student_data.csv"))
+ARTIFACT_PATH = os.environ.get("STUDENT_ARTIFACT_PATH", os.path.join(BASE_DIR, "data", "student_data.columns"))
+STREAMING_INGEST = os.environ.get("STREAMING_INGEST", "auto")
+STREAMING_THRESHOLD_MB = float(os.environ.get("STREAMING_THRESHOLD_MB", 256))
+
+
+def load_frame(path=DATA_PATH):
+    validate_columns(pd.read_csv(path, nrows=0).columns, path)
+    return add_final_grade(pd.read_csv(path, **READ_OPTIONS))
+
+
+def artifact_available(path=DATA_PATH, artifact_path=ARTIFACT_PATH):
+    return artifact_is_current(artifact_path, path)
+
+
+def streaming_enabled(path=DATA_PATH, artifact_path=ARTIFACT_PATH):
+    if artifact_available(path, artifact_path):
+        return False
+    if STREAMING_INGEST == "auto":
+        return os.path.getsize(path) > STREAMING_THRESHOLD_MB * 2 ** 20
+    return STREAMING_INGEST == "on"
@@ -0,0 +1,247 @@
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from dash import Input, Output, State, callback, ctx, dash_table, dcc, html
+import dash_bootstrap_components as dbc
+
+from bitmap import SORT_COLUMNS
+from cache import drilldown_cache, memoize
+from dataset import consistent_snapshot, current_snapshot
+from filters import option_label
+from instrumentation import instrumented, stage
+from schema import BOOL_COLUMNS, CATEGORICAL_COLUMNS
+
+DRILLDOWN_PAGE_SIZE = int(os.environ.get("DRILLDOWN_PAGE_SIZE", 20))
+
+COLOR_DARK = "#062A74"
+COLOR_BLUE1 = "#034BE4"
+TABLE_COLUMNS = ["student_id"] + SORT_COLUMNS
+# Bool columns are shown as yes/no, so the table filters them as text.
+TEXT_COLUMNS = [col for col in SORT_COLUMNS if col in CATEGORICAL_COLUMNS + BOOL_COLUMNS]
+QUERY_TERM = re.compile(r"\{(?P<column>[^}]+)\}\s+(?P<op>[is]?(?:[<>!]=|[=<>]|eq|ne|lt|le|gt|ge|contains))\s+(?P<value>.+)")
+QUERY_OPERAND = re.compile(r"(?P<kind>\w+)\((?P<value>.*)\)")
+OPERATORS = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+COMPARISONS = {"eq": np.equal, "ne": np.not_equal, "lt": np.less, "le": np.less_equal,
+               "gt": np.greater, "ge": np.greater_equal}
+
+# A drill is the slice of students behind a clicked mark: {"column", "in": [values]} for a
+# factor level or {"column", "range": [lo, hi]} (hi excluded) for a grade bin, plus a label.
+
+
+def grade_range_drill(points):
+    # Each bar of the grade histogram carries its bin edges as customdata.
+    bins = sorted(tuple(point["customdata"]) for point in points
+                  if isinstance(point.get("customdata"), list) and len(point["customdata"]) == 2
+                  and all(map(_bound, point["customdata"])))
+    if not bins:
+        return None
+    lo, hi = bins[0][0], bins[-1][1]
+    return {"column": "final_grade", "range": [lo, hi], "label": f"final grade {lo:g}–{hi:g}"}
+
+
+def factor_drill(points, factor):
+    index = current_snapshot().index
+    labels = {str(point.get("x")) for point in points}
+    if index is None or factor not in index.values:
+        return None
+    levels = [value for value in index.values[factor] if option_label(value) in labels]
+    if not levels:
+        return None
+    return {"column": factor, "in": levels,
+            "label": f"{factor} = {', '.join(option_label(value) for value in levels)}"}
+
+
+def _is_number(value):
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _bound(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def clean_drill(drill, snapshot):
+    # The drill store round-trips through the browser, so anything but the two shapes above is ignored.
+    if not isinstance(drill, dict) or not isinstance(drill.get("label"), str):
+        return None
+    column, levels, bounds = drill.get("column"), drill.get("in"), drill.get("range")
+    if isinstance(levels, list) and column in snapshot.index.values:
+        return {"column": column, "label": drill["label"],
+                "in": [value for value in levels if isinstance(value, (str, int, float))]}
+    if (isinstance(bounds, list) and len(bounds) == 2 and all(map(_bound, bounds)) and column in SORT_COLUMNS
+            and pd.api.types.is_numeric_dtype(snapshot.frame[column]) and snapshot.frame[column].dtype != bool):
+        return {"column": column, "label": drill["label"], "range": bounds}
+    return None
+
+
+def parse_query(query):
+    # The DataTable filter row sends e.g. {age} s> 16 && {address} icontains U.
+    terms = []
+    for part in filter(None, (query or "").split(" && ")):
+        match = QUERY_TERM.fullmatch(part.strip())
+        if match is None or match["column"] not in TABLE_COLUMNS:
+            raise ValueError(part.strip())
+        op = match["op"]
+        op = op[1:] if op[0] in "is" and op[1:] in {*OPERATORS, *COMPARISONS, "contains"} else op
+        value = match["value"].strip()
+        operand = QUERY_OPERAND.fullmatch(value)
+        if operand is not None:
+            # Typed operands such as num(16) or str(U); other forms would silently match nothing.
+            value = operand["value"].strip()
+            if operand["kind"] not in ("num", "str") or operand["kind"] == "num" and not _is_number(value):
+                raise ValueError(part.strip())
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1]
+        terms.append((match["column"], OPERATORS.get(op, op), value))
+    return terms
+
+
+def column_values(frame, column, positions):
+    if column == "student_id":
+        return positions
+    values = frame[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.categories.to_numpy()[values.cat.codes.to_numpy()[positions]]
+    return values.to_numpy()[positions]
+
+
+def term_mask(values, op, value):
+    if op == "contains":
+        return pd.Series(values).map(option_label).str.contains(value, case=False, regex=False).to_numpy()
+    if values.dtype == bool:
+        value = {"yes": True, "true": True, "no": False, "false": False}.get(value.lower())
+        if value is None:
+            return np.zeros(len(values), dtype=bool)
+    elif values.dtype != object:
+        try:
+            value = float(value)
+        except ValueError:
+            return np.zeros(len(values), dtype=bool)
+    return COMPARISONS[op](values, value)
+
+
+@memoize(drilldown_cache)
+def selection_positions(school, filters, drill, sort_by):
+    # Student positions of the selection in display order, before the filter row.
+    snapshot = current_snapshot()
+    index, frame = snapshot.index, snapshot.frame
+    spec = index.normalize(filters)
+    narrowing = {"school": [school]} if school != "All" else {}
+    if drill and "in" in drill and drill["column"] in index.values:
+        narrowing[drill["column"]] = drill["in"]
+    for column, values in narrowing.items():
+        allowed = set(spec.get(column, index.values[column]))
+        spec[column] = [value for value in values if value in allowed]
+    positions = index.positions(index.select(spec))
+    if drill and "range" in drill:
+        lo, hi = drill["range"]
+        values = column_values(frame, drill["column"], positions)
+        positions = positions[(values >= lo) & (values < hi)]
+    if sort_by and sort_by[0]["column_id"] in snapshot.sort_index.orders:
+        positions = snapshot.sort_index.sort(positions, sort_by[0]["column_id"], sort_by[0]["direction"] == "desc")
+    elif sort_by and sort_by[0]["direction"] == "desc":
+        positions = positions[::-1]
+    return positions
+
+
+@memoize(drilldown_cache)
+def drilldown_positions(school, filters, drill, query, sort_by):
+    # The sorted selection narrowed by the filter row. Both are cached, so a page request only
+    # slices, and editing the filter row reuses the selection.
+    terms = parse_query(query)
+    positions = selection_positions(school, filters, drill, sort_by)
+    frame = current_snapshot().frame
+    for column, op, value in terms:
+        positions = positions[term_mask(column_values(frame, column, positions), op, value)]
+    return positions
+
+
+def table_rows(frame, positions):
+    rows = frame.take(positions)[SORT_COLUMNS]
+    rows = rows.assign(**{col: rows[col].map(option_label) for col in SORT_COLUMNS if rows[col].dtype == bool},
+                       final_grade=rows["final_grade"].astype(float).round(2))
+    return [{"student_id": int(position), **record} for position, record in zip(positions, rows.to_dict("records"))]
+
+
+def drilldown_panel(page, hint):
+    header = {"backgroundColor": "#E8F0FE", "color": COLOR_DARK, "fontWeight": 600}
+    return html.Div([
+        dbc.Row([
+            dbc.Col(html.Div(hint, id=f"{page}-drilldown-title", style={"color": COLOR_DARK})),
+            dbc.Col(dbc.Button("Show all students", id=f"{page}-drilldown-clear", color="link", size="sm"),
+                    width="auto"),
+        ], align="center"),
+        dcc.Store(id=f"{page}-drilldown", data=None),
+        dash_table.DataTable(
+            id=f"{page}-drilldown-table",
+            columns=[{"name": col, "id": col, "type": "text" if col in TEXT_COLUMNS else "numeric"}
+                     for col in TABLE_COLUMNS],
+            data=[], page_current=0, page_size=DRILLDOWN_PAGE_SIZE, page_count=1,
+            page_action="custom", sort_action="custom", sort_mode="single", sort_by=[],
+            filter_action="custom", filter_query="",
+            style_table={"overflowX": "auto"}, style_header=header,
+            style_cell={"fontSize": "0.85rem", "padding": "4px 8px", "color": COLOR_DARK},
+        ),
+    ], className="mt-2")
+
+
+def register_drilldown(page, school_id, triggers, to_drill, states=()):
+    @callback(
+        Output(f"{page}-drilldown", "data"),
+        *[Input(graph_id, prop) for graph_id, prop in triggers],
+        Input(f"{page}-drilldown-clear", "n_clicks"),
+        *[State(state_id, "value") for state_id in states],
+        prevent_initial_call=True
+    )
+    @instrumented
+    @consistent_snapshot
+    def select_drilldown(*args):
+        if ctx.triggered_id == f"{page}-drilldown-clear":
+            return None
+        event = ctx.triggered[0]["value"] or {}
+        return to_drill(event.get("points") or [], *args[len(triggers) + 1:]) if event.get("points") else None
+
+    table = f"{page}-drilldown-table"
+
+    @callback(
+        Output(table, "data"),
+        Output(table, "page_count"),
+        Output(table, "page_current"),
+        Output(f"{page}-drilldown-title", "children"),
+        Input(school_id, "value"),
+        Input(f"{page}-filters", "data"),
+        Input(f"{page}-drilldown", "data"),
+        Input(table, "page_current"),
+        Input(table, "page_size"),
+        Input(table, "sort_by"),
+        Input(table, "filter_query")
+    )
+    @instrumented
+    @consistent_snapshot
+    def update_drilldown(school, filters, drill, page_current, page_size, sort_by, query):
+        snapshot = current_snapshot()
+        if snapshot.index is None:
+            return [], 1, 0, "Student rows are not kept when the dataset is ingested in streaming mode."
+        # Any change other than paging starts again from the first page.
+        if f"{table}.page_current" not in ctx.triggered_prop_ids:
+            page_current = 0
+        drill = clean_drill(drill, snapshot)
+        with stage("filter"):
+            try:
+                positions = drilldown_positions(school, filters, drill, query, sort_by)
+            except ValueError as exc:
+                return [], 1, 0, f"Could not read the table filter “{exc}”."
+        page_size = page_size or DRILLDOWN_PAGE_SIZE
+        page_count = max(math.ceil(len(positions) / page_size), 1)
+        page_current = min(page_current or 0, page_count - 1)
+        with stage("figure_build"):
+            rows = table_rows(snapshot.frame, positions[page_current * page_size:(page_current + 1) * page_size])
+        title = " · ".join([f"{len(positions):,} students", *([drill["label"]] if drill else []),
+                            *([f"school {school}"] if school != "All" else [])])
+        return rows, page_count, page_current, title
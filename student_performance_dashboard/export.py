@@ -0,0 +1,273 @@
+import importlib.util
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from dash import Input, Output, State, callback, dcc, html
+import dash_bootstrap_components as dbc
+from flask import abort, send_file
+from markupsafe import escape
+
+from aggregates import KPI_CARDS, exact_views, grade_cube, kpi_values
+from cube import CUBE_DIMENSIONS
+from dataset import current_snapshot, manager
+from instrumentation import instrumented
+from schema import BOOL_COLUMNS, SCHEMA_COLUMNS
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "student-dashboard-exports"))
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 50_000))
+EXPORT_TTL = float(os.environ.get("EXPORT_TTL", 3600))
+
+POLL_INTERVAL_MS = 1000
+COLOR_DARK = "#062A74"
+EXPORT_KINDS = [("rows.csv", "Filtered rows (CSV)"), ("rows.parquet", "Filtered rows (Parquet)"),
+                ("summary.csv", "Grade summary (CSV)"), ("summary.parquet", "Grade summary (Parquet)"),
+                ("report.html", "Charts and tables (HTML)")]
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+logger = logging.getLogger(__name__)
+
+_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+REPORTS = {}
+
+# Job state lives in a JSON file next to the export, so any worker process can
+# report progress and serve the download.
+
+
+def _job_path(job_id, suffix):
+    return os.path.join(EXPORT_DIR, job_id + suffix)
+
+
+def _write_status(job_id, **status):
+    path = _job_path(job_id, ".json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(status, f)
+    os.replace(path + ".tmp", path)
+
+
+def job_status(job_id):
+    if not isinstance(job_id, str) or not JOB_ID.fullmatch(job_id):
+        return None
+    try:
+        with open(_job_path(job_id, ".json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _prune():
+    cutoff = time.time() - EXPORT_TTL
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def export_options():
+    parquet = importlib.util.find_spec("pyarrow") is not None
+    rows = current_snapshot().index is not None
+    return [{"label": label, "value": kind} for kind, label in EXPORT_KINDS
+            if (parquet or not kind.endswith(".parquet")) and (rows or not kind.startswith("rows."))]
+
+
+def selected_positions(school, filters):
+    snapshot = current_snapshot()
+    index = snapshot.index
+    if index is None:
+        raise ValueError("row exports need row-level data; the dataset is ingested in streaming mode")
+    positions = index.positions(index.select(filters))
+    if school != "All":
+        positions = positions[snapshot.frame["school"].to_numpy()[positions] == school]
+    return snapshot.frame, positions
+
+
+def _row_chunks(frame, positions):
+    for start in range(0, max(len(positions), 1), EXPORT_CHUNK_ROWS):
+        yield frame[SCHEMA_COLUMNS].take(positions[start:start + EXPORT_CHUNK_ROWS]), \
+            min(start + EXPORT_CHUNK_ROWS, len(positions)) / max(len(positions), 1)
+
+
+def write_rows_csv(path, school, filters, progress):
+    frame, positions = selected_positions(school, filters)
+    with open(path, "w", newline="") as f:
+        for i, (chunk, done) in enumerate(_row_chunks(frame, positions)):
+            # yes/no as in the source export, so the file can be loaded back in.
+            chunk = chunk.assign(**{col: np.where(chunk[col], "yes", "no") for col in BOOL_COLUMNS})
+            chunk.to_csv(f, header=i == 0, index=False)
+            progress(done)
+
+
+def write_rows_parquet(path, school, filters, progress):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    frame, positions = selected_positions(school, filters)
+    writer = None
+    try:
+        for chunk, done in _row_chunks(frame, positions):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            progress(done)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def summary_table(school, filters):
+    cube = grade_cube(filters)
+    parts = [cube.grade_stats(school, dim)[["count", "mean", "std"]].rename_axis("level").reset_index()
+             .assign(dimension=dim) for dim in CUBE_DIMENSIONS]
+    table = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame({"dimension": table["dimension"], "level": table["level"].astype(str),
+                         "students": table["count"], "mean_grade": table["mean"].round(2),
+                         "grade_std": table["std"].round(2)})
+
+
+def write_summary(file_format, path, school, filters, progress):
+    table = summary_table(school, filters)
+    if file_format == "parquet":
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+    progress(1.0)
+
+
+def write_report(path, school, filters, progress, page=None, extras=()):
+    values = kpi_values(school, filters)
+    kpis = pd.DataFrame({"Metric": [title for _, title, _ in KPI_CARDS],
+                         "Value": [values[key] for key, _, _ in KPI_CARDS]})
+    figures = REPORTS[page](school, filters, *extras)
+    parts = [f"<h1>{escape(page.title())}: {escape(school)}</h1>",
+             f"<p>Filters: {escape(json.dumps(filters) if filters else 'none')}</p>",
+             kpis.to_html(index=False)]
+    for i, (title, figure) in enumerate(figures):
+        parts.append(f"<h2>{escape(title)}</h2>")
+        parts.append(figure.to_html(full_html=False, include_plotlyjs=i == 0))
+        progress((i + 1) / (len(figures) + 1))
+    parts.append("<h2>Grade summary</h2>")
+    parts.append(summary_table(school, filters).to_html(index=False))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>{''.join(parts)}</body></html>")
+    progress(1.0)
+
+
+WRITERS = {"rows.csv": write_rows_csv, "rows.parquet": write_rows_parquet,
+           "summary.csv": partial(write_summary, "csv"), "summary.parquet": partial(write_summary, "parquet"),
+           "report.html": write_report}
+
+
+def _run(job_id, snapshot, kind, school, filters, page, extras):
+    status = job_status(job_id)
+    path = _job_path(job_id, "." + kind.rsplit(".", 1)[1])
+    last = 0.0
+
+    def progress(done):
+        nonlocal last
+        if done == 1.0 or time.monotonic() - last > 0.5:
+            last = time.monotonic()
+            _write_status(job_id, **{**status, "state": "running", "progress": done})
+
+    try:
+        progress(0.0)
+        with manager.pinned(snapshot), exact_views():
+            writer = partial(write_report, page=page, extras=extras) if kind == "report.html" else WRITERS[kind]
+            writer(path + ".part", school, filters, progress)
+        os.replace(path + ".part", path)
+        _write_status(job_id, **{**status, "state": "done", "progress": 1.0, "path": os.path.basename(path)})
+    except Exception as exc:
+        logger.exception("export %s failed", job_id)
+        _write_status(job_id, **{**status, "state": "failed", "error": str(exc)})
+
+
+def submit_export(page, kind, school, filters, extras=()):
+    if kind not in WRITERS:
+        raise ValueError(f"unknown export kind {kind}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _prune()
+    job_id = uuid.uuid4().hex
+    snapshot = manager.current()
+    name, extension = kind.rsplit(".", 1)
+    _write_status(job_id, state="queued", progress=0.0, kind=kind,
+                  filename=f"{page}-{school}-{name}-v{snapshot.version}.{extension}")
+    _pool.submit(_run, job_id, snapshot, kind, school, filters or {}, page, list(extras))
+    return job_id
+
+
+def export_panel(page):
+    return dbc.Row([
+        dbc.Col([
+            html.Label("Export:", style={"color": COLOR_DARK}),
+            dcc.Dropdown(id=f"{page}-export-kind", options=export_options(), value="summary.csv",
+                         clearable=False),
+        ], width=3),
+        dbc.Col(dbc.Button("Export", id=f"{page}-export-button", color="primary", className="mt-4"),
+                width="auto"),
+        dbc.Col(html.Div(id=f"{page}-export-status", className="mt-4"), width=4),
+        dcc.Store(id=f"{page}-export-job"),
+        dcc.Interval(id=f"{page}-export-poll", interval=POLL_INTERVAL_MS, disabled=True),
+    ], className="mt-2", align="center")
+
+
+def status_view(job_id, status):
+    if status is None:
+        return html.Span("This export has expired.")
+    if status["state"] == "done":
+        return html.A(f"Download {status['filename']}", href=f"/exports/{job_id}")
+    if status["state"] == "failed":
+        return html.Span(f"Export failed: {status['error']}", style={"color": "#C0392B"})
+    percent = round(status["progress"] * 100)
+    return dbc.Progress(value=percent, label=f"{percent}%", striped=True, animated=True)
+
+
+def register_export(page, school_id, report_figures, extra_ids=()):
+    REPORTS[page] = report_figures
+
+    @callback(
+        Output(f"{page}-export-job", "data"),
+        Output(f"{page}-export-poll", "disabled"),
+        Input(f"{page}-export-button", "n_clicks"),
+        State(f"{page}-export-kind", "value"),
+        State(school_id, "value"),
+        State(f"{page}-filters", "data"),
+        *[State(extra_id, "value") for extra_id in extra_ids],
+        prevent_initial_call=True
+    )
+    @instrumented
+    def start_export(n_clicks, kind, school, filters, *extras):
+        return submit_export(page, kind, school, filters, extras), False
+
+    @callback(
+        Output(f"{page}-export-status", "children"),
+        Output(f"{page}-export-poll", "disabled", allow_duplicate=True),
+        Input(f"{page}-export-poll", "n_intervals"),
+        State(f"{page}-export-job", "data"),
+        prevent_initial_call=True
+    )
+    @instrumented
+    def poll_export(n_intervals, job_id):
+        status = job_status(job_id)
+        return status_view(job_id, status), status is None or status["state"] in ("done", "failed")
+
+
+def init_export_routes(server):
+    @server.route("/exports/<job_id>")
+    def download_export(job_id):
+        status = job_status(job_id)
+        if status is None or status["state"] != "done":
+            abort(404)
+        # send_file streams the file in blocks, so large CSVs never sit in memory.
+        return send_file(os.path.join(EXPORT_DIR, status["path"]), as_attachment=True,
+                         download_name=status["filename"], max_age=0)
@@ -0,0 +1,72 @@
+import base64
+import logging
+import os
+
+import numpy as np
+from dash import Patch
+from plotly.io.json import to_json_plotly
+
+from instrumentation import stage
+
+CLIENTSIDE_FILTERS = os.environ.get("CLIENTSIDE_FILTERS", "off")
+CLIENTSIDE_MAX_KB = float(os.environ.get("CLIENTSIDE_MAX_KB", 1024))
+
+logger = logging.getLogger(__name__)
+
+# numpy dtype names and their plotly.js typed array codes (no 64-bit integers in plotly.js).
+TYPED_ARRAY_CODES = {"int8": "i1", "uint8": "u1", "int16": "i2", "uint16": "u2",
+                     "int32": "i4", "uint32": "u4", "float32": "f4", "float64": "f8"}
+
+# Embedded payloads also carry the view of a school the data does not have, built for this name;
+# assets/clientside.js puts the selected school in its place, as the server callbacks would show it.
+SCHOOL_PLACEHOLDER = "{school}"
+
+# A figure update is a small JSON description of what changes on a styled
+# skeleton: per-trace properties, a replacement trace list and layout keys.
+# The server applies it as a dash.Patch; assets/clientside.js applies the same
+# dict in the browser.
+
+
+def trace_update(values, prop="y", per_trace=False):
+    if per_trace:
+        return {"traces": [[i, prop, [value]] for i, value in enumerate(values)]}
+    return {"traces": [[0, prop, values]]}
+
+
+def replace_update(traces, **layout):
+    return {"data": traces, "layout": layout}
+
+
+def typed_array(values, dtype):
+    # Numbers travel as a plotly.js typed array, the base64 of the raw buffer: shorter than
+    # JSON number text and without formatting each float on the way out.
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    if array.size == 0:
+        return []
+    spec = {"dtype": TYPED_ARRAY_CODES[array.dtype.name], "bdata": base64.b64encode(array).decode("ascii")}
+    if array.ndim > 1:
+        spec["shape"] = ", ".join(map(str, array.shape))
+    return spec
+
+
+def update_patch(update):
+    patch = Patch()
+    with stage("update_layout"):
+        if "data" in update:
+            patch["data"] = update["data"]
+        for key, value in update.get("layout", {}).items():
+            patch["layout"][key] = value
+        for i, prop, value in update.get("traces", []):
+            patch["data"][i][prop] = value
+    return patch
+
+
+def embeddable(build_payload):
+    if CLIENTSIDE_FILTERS != "on":
+        return False
+    size = len(to_json_plotly(build_payload()))
+    if size > CLIENTSIDE_MAX_KB * 1024:
+        logger.warning("%s is %d KB, above CLIENTSIDE_MAX_KB; using server callbacks",
+                       build_payload.__qualname__, size // 1024)
+        return False
+    return True
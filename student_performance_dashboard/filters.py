@@ -0,0 +1,91 @@
+from dash import (ALL, ClientsideFunction, Input, Output, State, callback, clientside_callback,
+                  dcc, html, no_update)
+import dash_bootstrap_components as dbc
+
+from aggregates import approximate, filter_index
+from dataset import consistent_snapshot
+from instrumentation import instrumented
+from sampling import APPROX_QUERIES
+
+REFINE_INTERVAL_MS = 1000
+
+COLOR_DARK = "#062A74"
+FILTER_CONTROLS = [("sex", "Gender"), ("address", "Address"), ("Mjob", "Mother's Job"),
+                   ("Fjob", "Father's Job"), ("failures", "Past Failures")]
+RANGE_CONTROLS = [("age", "Age")]
+
+
+def filter_id(page, column, kind="in"):
+    return {"type": "filter", "page": page, "column": column, "kind": kind}
+
+
+def option_label(value):
+    return {True: "yes", False: "no"}.get(value, str(value)) if isinstance(value, bool) else str(value)
+
+
+def filter_panel(page):
+    index = filter_index()
+    if index is None:
+        return html.Div()
+    controls = [
+        dbc.Col([
+            html.Label(label, style={"color": COLOR_DARK}),
+            dcc.Dropdown(
+                id=filter_id(page, column),
+                options=[{"label": option_label(v), "value": v} for v in index.values[column]],
+                multi=True, placeholder="Any"
+            )
+        ], width=2)
+        for column, label in FILTER_CONTROLS
+    ]
+    for column, label in RANGE_CONTROLS:
+        values = index.values[column]
+        controls.append(dbc.Col([
+            html.Label(label, style={"color": COLOR_DARK}),
+            dcc.RangeSlider(
+                id=filter_id(page, column, "between"), min=min(values), max=max(values), step=1,
+                value=[min(values), max(values)], marks={v: str(v) for v in values}
+            )
+        ], width=2))
+    return dbc.Row(controls, className="mt-2")
+
+
+def filter_store(page):
+    return html.Div([
+        dcc.Store(id=f"{page}-filters", data={}),
+        dcc.Interval(id=f"{page}-refine", interval=REFINE_INTERVAL_MS, disabled=True),
+    ])
+
+
+def register_filter_store(page):
+    pattern = {"type": "filter", "page": page, "column": ALL, "kind": ALL}
+    clientside_callback(
+        ClientsideFunction("dashboard", "collectFilters"),
+        Output(f"{page}-filters", "data"),
+        Input(pattern, "value"),
+        State(pattern, "id"),
+    )
+    if APPROX_QUERIES != "on":
+        return
+
+    # Approximate views poll until the background exact view is ready.
+    @callback(
+        Output(f"{page}-refine", "disabled"),
+        Input(f"{page}-filters", "data")
+    )
+    @instrumented
+    @consistent_snapshot
+    def refine_pending(filters):
+        return not approximate(filters)
+
+    @callback(
+        Output(f"{page}-filters", "data", allow_duplicate=True),
+        Input(f"{page}-refine", "n_intervals"),
+        State(f"{page}-filters", "data"),
+        prevent_initial_call=True
+    )
+    @instrumented
+    @consistent_snapshot
+    def refresh_filters(n_intervals, filters):
+        # The same filters again re-run the page callbacks, which now find the exact view cached.
+        return no_update if approximate(filters) else dict(filters)
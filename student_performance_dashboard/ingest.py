@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+from cube import build_cube, merge_cubes
+from datastore import DATA_PATH
+from metrics_engine import merge_totals, metric_totals
+from schema import READ_OPTIONS, add_final_grade, validate_columns
+
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", 200_000))
+
+
+def iter_chunks(path=DATA_PATH, chunksize=INGEST_CHUNK_ROWS):
+    validate_columns(pd.read_csv(path, nrows=0).columns, path)
+    with pd.read_csv(path, chunksize=chunksize, **READ_OPTIONS) as reader:
+        for chunk in reader:
+            yield add_final_grade(chunk)
+
+
+def ingest_csv(path=DATA_PATH, chunksize=INGEST_CHUNK_ROWS):
+    cube, totals, rows = None, {}, 0
+    for chunk in iter_chunks(path, chunksize):
+        part = build_cube(chunk)
+        cube = part if cube is None else merge_cubes(cube, part)
+        totals = merge_totals(totals, metric_totals(chunk))
+        rows += len(chunk)
+    if cube is None:
+        raise ValueError(f"{path} contains no student rows")
+    return cube, totals, rows
@@ -0,0 +1,158 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, g, has_request_context, request
+
+from cache import cache_stats
+from startup import STARTUP_STEPS
+
+PROFILE_HEADER = "X-Debug-Profile"
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+_local = threading.local()
+_profile_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                label_text = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {n}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+                lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("dashboard_callback_stage_seconds",
+                          "Time spent in each stage of a Dash callback.",
+                          ("callback", "stage"), SECONDS_BUCKETS)
+CALLBACK_SECONDS = Histogram("dashboard_callback_seconds",
+                             "Wall time of a Dash callback request, including serialization.",
+                             ("callback",), SECONDS_BUCKETS)
+RESPONSE_BYTES = Histogram("dashboard_callback_response_bytes",
+                           "Size of Dash callback responses.", ("callback",), BYTES_BUCKETS)
+
+
+@contextmanager
+def stage(name):
+    callback = getattr(_local, "callback", None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if callback is not None:
+            STAGE_SECONDS.observe((callback, name), time.perf_counter() - start)
+
+
+def instrumented(func):
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_local, "callback", None)
+        _local.callback = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe((name, "callback"), elapsed)
+            _local.callback = outer
+            if has_request_context():
+                g.dashboard_callback = name
+                g.dashboard_callback_seconds = elapsed
+    return wrapper
+
+
+def _before_request():
+    g.dashboard_request_start = time.perf_counter()
+    if PROFILE_DIR and request.headers.get(PROFILE_HEADER) and _profile_lock.acquire(blocking=False):
+        g.dashboard_profiler = cProfile.Profile()
+        g.dashboard_profiler.enable()
+
+
+def _stop_profiler(profiler):
+    profiler.disable()
+    _profile_lock.release()
+
+
+def _after_request(response):
+    profiler = g.pop("dashboard_profiler", None)
+    callback = g.get("dashboard_callback")
+    if profiler is not None:
+        _stop_profiler(profiler)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+                                         f"{callback or request.endpoint}.prof")
+        profiler.dump_stats(path)
+        response.headers["X-Profile-Path"] = path
+    if callback is not None:
+        total = time.perf_counter() - g.dashboard_request_start
+        STAGE_SECONDS.observe((callback, "serialize"), max(total - g.dashboard_callback_seconds, 0.0))
+        CALLBACK_SECONDS.observe((callback,), total)
+        RESPONSE_BYTES.observe((callback,), response.calculate_content_length() or 0)
+    return response
+
+
+def _teardown_request(exc):
+    # after_request is skipped when a handler or a later hook raises; the lock must not stay taken.
+    profiler = g.pop("dashboard_profiler", None)
+    if profiler is not None:
+        _stop_profiler(profiler)
+
+
+def render_metrics():
+    lines = []
+    for histogram in (CALLBACK_SECONDS, STAGE_SECONDS, RESPONSE_BYTES):
+        lines.extend(histogram.render())
+    stats = cache_stats()
+    for metric, key, kind, documentation in [
+        ("dashboard_cache_hits_total", "hits", "counter", "Cache lookups that found an entry."),
+        ("dashboard_cache_misses_total", "misses", "counter", "Cache lookups that missed."),
+        ("dashboard_cache_hit_ratio", "hit_rate", "gauge", "Hits divided by lookups."),
+        ("dashboard_cache_entries", "size", "gauge", "Entries currently cached."),
+    ]:
+        lines.append(f"# HELP {metric} {documentation}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{cache="{name}"}} {values[key]}' for name, values in stats.items())
+    lines.append("# HELP dashboard_startup_seconds Wall time of each step of bringing this worker up.")
+    lines.append("# TYPE dashboard_startup_seconds gauge")
+    lines.extend(f'dashboard_startup_seconds{{step="{name}"}} {seconds}' for name, seconds, _ in STARTUP_STEPS)
+    return "\n".join(lines) + "\n"
+
+
+def init_app(server):
+    server.before_request(_before_request)
+    server.after_request(_after_request)
+    server.teardown_request(_teardown_request)
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
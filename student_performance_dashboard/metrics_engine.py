@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = ["final_grade", "absences", "health", "freetime",
+                  "activities", "internet", "higher"]
+
+
+def encode_columns(df):
+    codes, schools = pd.factorize(df["school"], sort=True)
+    values = np.column_stack([np.ones(len(df))] +
+                             [df[col].to_numpy(dtype=np.float64) for col in METRIC_COLUMNS])
+    return codes, list(schools), values
+
+
+def metric_sums(codes, n_schools, values):
+    k = values.shape[1]
+    flat = (codes[:, None] * k + np.arange(k)).ravel()
+    return np.bincount(flat, weights=values.ravel(), minlength=n_schools * k).reshape(n_schools, k)
+
+
+EMPTY_METRICS = {"total": 0, "avg_grade": 0.0, "gp_pct": 0, "ms_pct": 0, "activities_pct": 0,
+                 "avg_absences": 0, "avg_health": 0.0, "avg_freetime": 0.0, "internet_pct": 0.0,
+                 "higher_pct": 0.0, "share_pct": 0}
+
+
+def finalize_metrics(schools, sums):
+    grand_total = sums[:, 0].sum()
+    gp_count = sums[schools.index("GP"), 0] if "GP" in schools else 0
+    rows = {"All": (sums.sum(axis=0), gp_count)}
+    for school, row in zip(schools, sums):
+        rows[school] = (row, row[0] if school == "GP" else 0)
+
+    result = {}
+    for key, (row, gp) in rows.items():
+        total = row[0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grade, absences, health, freetime, activities, internet, higher = row[1:] / total
+            gp_pct = round(gp / total * 100) if total else 0
+        result[key] = {
+            "total": int(total),
+            "avg_grade": round(grade, 1),
+            "gp_pct": gp_pct,
+            "ms_pct": 100 - gp_pct,
+            "activities_pct": round(activities * 100),
+            "avg_absences": round(absences),
+            "avg_health": round(health, 1),
+            "avg_freetime": round(freetime, 1),
+            "internet_pct": internet * 100,
+            "higher_pct": higher * 100,
+            "share_pct": round(total / grand_total * 100) if grand_total else 0,
+        }
+    return result
+
+
+def metric_totals(df):
+    codes, schools, values = encode_columns(df)
+    return dict(zip(schools, metric_sums(codes, len(schools), values)))
+
+
+def merge_totals(a, b, sign=1):
+    merged = dict(a)
+    for school, row in b.items():
+        merged[school] = merged[school] + sign * row if school in merged else sign * row
+    return merged
+
+
+def finalize_totals(totals):
+    schools = sorted(school for school, row in totals.items() if row[0] > 0)
+    if not schools:
+        return {"All": dict(EMPTY_METRICS)}
+    return finalize_metrics(schools, np.array([totals[school] for school in schools]))
+
+
+def compute_metrics(df):
+    return finalize_totals(metric_totals(df))
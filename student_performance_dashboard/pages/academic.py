@@ -1,8 +1,21 @@
-from dash import html, dcc, register_page, Input, Output, callback
+from functools import cache
+
+from dash import html, dcc, register_page, ClientsideFunction, Input, Output, State, callback
 import dash_bootstrap_components as dbc
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+
+from aggregates import (KPI_CARDS, correlation_moments, factor_effects, grade_cube, kpi_values, schools,
+                        term_labels, term_means)
+from cache import figure_cache, memoize
+from dataset import consistent_snapshot
+from drilldown import drilldown_panel, factor_drill, register_drilldown
+from export import export_panel, register_export
+from figure_updates import SCHOOL_PLACEHOLDER, embeddable, replace_update, typed_array, update_patch
+from filters import filter_panel, filter_store, register_filter_store
+from instrumentation import instrumented, stage
+from stats_engine import CORRELATION_COLUMNS, correlation_matrix, cube_correlations, school_row
+from summaries import (KDE_GRID, STRIP_FALLBACK, STRIP_MAX_POINTS, box_summary,
+                       kde_summary, strip_density, strip_sample)
+from timeseries import TREND_GROUPINGS, TREND_MAX_POINTS, lttb
 
 COLOR_BG = "#FFFFFF"
 COLOR_DARK = "#062A74"
@@ -15,22 +28,7 @@ PALETTE_MAIN = [COLOR_ORANGE, COLOR_BLUE1, COLOR_BLUE2, COLOR_CYAN, COLOR_GREY]
 
 register_page(__name__, path="/academic", name="Academic Insights")
 
-df = pd.read_csv("data/student_data.csv")
-df["final_grade"] = df[["G1", "G2", "G3"]].mean(axis=1)
-
-def calculate_metrics(df_filtered):
-    return {
-        "total": len(df_filtered),
-        "avg_grade": round(df_filtered["final_grade"].mean(), 1),
-        "gp_pct": round((df_filtered["school"] == "GP").mean() * 100),
-        "ms_pct": 100 - round((df_filtered["school"] == "GP").mean() * 100),
-        "activities_pct": round((df_filtered["activities"] == "yes").mean() * 100),
-        "avg_absences": round(df_filtered["absences"].mean()),
-        "avg_health": round(df_filtered["health"].mean(), 1),
-        "avg_freetime": round(df_filtered["freetime"].mean(), 1)
-    }
-
-def card(title, val, icon="📊", highlight=False):
+def card(title, value_id, icon="📊", highlight=False):
     style = {
         "flex": "0 0 auto",
         "width": "100%",
@@ -45,7 +43,6 @@ def card(title, val, icon="📊", highlight=False):
         "margin": "0"
     }
 
-    safe_val = str(val) if val is not None else "-"
     return dbc.Card([
         dbc.CardBody([
             html.Div([
@@ -74,7 +71,7 @@ def card(title, val, icon="📊", highlight=False):
                 "marginBottom": "0.6em"
             }),
 
-            html.Div(safe_val, style={
+            html.Div("-", id=value_id, style={
                 "color": COLOR_BLUE1,
                 "fontWeight": 700,
                 "fontSize": "1.15rem",
@@ -85,74 +82,175 @@ def card(title, val, icon="📊", highlight=False):
         ])
     ], style=style)
 
-def plot_grade_by_factor(data, factor, chart_type="box"):
+def summary_box_trace(label, summary, color, x=None, **kwargs):
+    return dict(
+        type="box", name=label, x=[label if x is None else x],
+        q1=[summary["q1"]], median=[summary["median"]], q3=[summary["q3"]],
+        lowerfence=[summary["lowerfence"]], upperfence=[summary["upperfence"]],
+        mean=[summary["mean"]], boxpoints=False, marker=dict(color=color),
+        legendgroup=label, **kwargs
+    )
+
+def summary_outlier_trace(label, summary, color, x=None):
+    return dict(
+        type="scatter", x=[label if x is None else x] * len(summary["outliers"]), y=summary["outliers"],
+        mode="markers", marker=dict(color=color, size=5),
+        customdata=summary["outlier_counts"],
+        hovertemplate="%{y:.2f} (%{customdata} students)<extra></extra>",
+        legendgroup=label, showlegend=False
+    )
+
+def grade_by_factor_traces(cube, school, factor, chart_type="box"):
+    import numpy as np
     binary_factors = {"schoolsup", "famsup", "paid", "internet", "activities"}
     ALCOHOL_LEVELS = [1, 2, 3, 4, 5]
     ALCOHOL_COLORS = [COLOR_CYAN, COLOR_BLUE2, COLOR_BLUE1, COLOR_GREY, COLOR_ORANGE]
 
-    if factor not in data.columns or data[factor].dropna().nunique() < 1:
-        return go.Figure()
+    xaxis = dict(title=dict(text=factor.replace("_", " ").title()))
+    legend = dict(title=dict(text=""))
+    if factor not in cube.levels:
+        return [], xaxis, legend
+    counts = cube.level_counts(school, factor)
+    levels = [lvl for lvl, n in counts.items() if n > 0]
+    if not levels:
+        return [], xaxis, legend
 
-    order = sorted(data[factor].dropna().unique())
+    labels = {lvl: str(lvl) for lvl in levels}
+    order = [labels[lvl] for lvl in levels]
     color_seq = PALETTE_MAIN
 
     if factor in {"Dalc", "Walc"}:
-        data = data.copy()
-        data[factor] = data[factor].astype(str)
         order = [str(lvl) for lvl in ALCOHOL_LEVELS]
         color_seq = ALCOHOL_COLORS
     elif factor in binary_factors:
+        labels = {True: "yes", False: "no"}
         order = ["yes", "no"]
         color_seq = [COLOR_BLUE1, COLOR_ORANGE]
 
+    colors = {label: color_seq[i % len(color_seq)] for i, label in enumerate(order)}
+    hists = {labels[lvl]: cube.grade_histogram(school, factor, lvl) for lvl in levels}
+    present = [label for label in order if label in hists]
+
+    traces = []
     if chart_type == "strip":
-        fig = px.strip(data, x=factor, y="final_grade",
-                       category_orders={factor: order},
-                       color=factor,
-                       color_discrete_sequence=color_seq)
+        if STRIP_FALLBACK == "density" and sum(counts.values()) > STRIP_MAX_POINTS:
+            for label in present:
+                grades, n = strip_density(hists[label])
+                traces.append(dict(
+                    type="scatter", name=label, x=[label] * len(grades), y=typed_array(grades, np.float32),
+                    mode="markers", marker=dict(color=colors[label], size=typed_array(n, np.int32),
+                                                sizemode="area", sizeref=2 * max(int(n.max()), 1) / 20 ** 2,
+                                                sizemin=2),
+                    customdata=typed_array(n, np.int32), hovertemplate="%{y:.2f} (%{customdata} students)<extra></extra>"
+                ))
+        else:
+            samples = strip_sample([hists[label] for label in present])
+            for label, sample in zip(present, samples):
+                traces.append(dict(
+                    type="box", name=label, x=[label] * len(sample), y=typed_array(sample, np.float32),
+                    boxpoints="all", jitter=1, pointpos=0, hoveron="points",
+                    fillcolor="rgba(255,255,255,0)", line=dict(color="rgba(255,255,255,0)"),
+                    marker=dict(color=colors[label])
+                ))
+        xaxis.update(categoryorder="array", categoryarray=order)
     elif chart_type == "bar":
-        agg = (
-            data.groupby(factor, observed=True)["final_grade"]
-            .mean()
-            .reindex(order, fill_value=None)
-            .reset_index()
-        )
-        fig = px.bar(agg, x=factor, y="final_grade", color=factor,
-                     category_orders={factor: order},
-                     color_discrete_sequence=color_seq)
+        means = cube.grade_stats(school, factor)["mean"]
+        means = {labels[lvl]: float(means[lvl]) for lvl in levels}
+        for label in order:
+            traces.append(dict(
+                type="bar", name=label, x=[label], y=[means.get(label)], orientation="v",
+                marker=dict(color=colors[label]), legendgroup=label, offsetgroup=label,
+                alignmentgroup="True", showlegend=True, textposition="auto",
+                hovertemplate=f"{factor}=%{{x}}<br>final_grade=%{{y}}<extra></extra>"
+            ))
+        xaxis.update(categoryorder="array", categoryarray=order)
+        legend = dict(title=dict(text=factor), tracegroupgap=0)
     elif chart_type == "violin":
-        fig = px.violin(data, x=factor, y="final_grade", box=True, points="all",
-                        category_orders={factor: order},
-                        color=factor,
-                        color_discrete_sequence=color_seq)
+        for pos, label in enumerate(order):
+            if label not in hists:
+                continue
+            density = kde_summary(hists[label])
+            mask = density > 0
+            half = density[mask] / density.max() * 0.45
+            grid = KDE_GRID[mask]
+            traces.append(dict(
+                type="scatter", name=label,
+                x=typed_array(np.concatenate([pos + half, pos - half[::-1]]), np.float32),
+                y=typed_array(np.concatenate([grid, grid[::-1]]), np.float32), mode="lines", fill="toself",
+                line=dict(color=colors[label], width=1.5), opacity=0.6,
+                legendgroup=label, hoverinfo="skip"
+            ))
+            summary = box_summary(hists[label])
+            traces.append(summary_box_trace(label, summary, colors[label], x=pos,
+                                            width=0.12, showlegend=False))
+        xaxis.update(tickmode="array", tickvals=list(range(len(order))), ticktext=order,
+                     range=[-0.6, len(order) - 0.4])
     else:
-        fig = px.box(data, x=factor, y="final_grade",
-                     category_orders={factor: order},
-                     color=factor,
-                     color_discrete_sequence=color_seq)
+        for label in present:
+            summary = box_summary(hists[label])
+            traces.append(summary_box_trace(label, summary, colors[label]))
+            if summary["outliers"]:
+                traces.append(summary_outlier_trace(label, summary, colors[label]))
+        xaxis.update(categoryorder="array", categoryarray=order)
+    return traces, xaxis, legend
 
+@cache
+def factor_layout():
+    import plotly.graph_objects as go
+    fig = go.Figure()
     fig.update_layout(
         template="simple_white",
         height=320,
         showlegend=True,
-        xaxis_title=factor.replace("_", " ").title(),
+        barmode="relative",
         yaxis=dict(range=[0, 20], tick0=0, dtick=5, title="Final Grade", color=COLOR_DARK),
         plot_bgcolor=COLOR_BG,
         paper_bgcolor=COLOR_BG,
         font=dict(color=COLOR_DARK)
     )
-    return fig
+    return fig.to_dict()["layout"]
+
+def plot_grade_by_factor(cube, school, factor, chart_type="box"):
+    import plotly.graph_objects as go
+    traces, xaxis, legend = grade_by_factor_traces(cube, school, factor, chart_type)
+    return go.Figure({"data": traces, "layout": {**factor_layout(), "xaxis": xaxis, "legend": legend}})
+
+TREND_COLORS = [COLOR_BLUE2, COLOR_ORANGE, COLOR_BLUE1, COLOR_GREY, COLOR_CYAN]
+TREND_WINDOWS = [1, 2, 3, 4, 6, 8, 12]
+TREND_MAX_TICKS = 12
+TREND_MARKERS_UP_TO = 60
 
-def plot_grade_trend(data):
-    avg = data[["G1", "G2", "G3"]].mean().reset_index()
-    avg.columns = ["Term", "Average"]
+def cohort_label(grouping, level):
+    if grouping == "All":
+        return level
+    return f"{grouping}={'yes' if level is True else 'no' if level is False else level}"
 
-    fig = go.Figure(go.Scatter(
-        x=avg["Term"], y=avg["Average"], mode="lines+markers",
-        line=dict(color=COLOR_BLUE2, width=3),
-        marker=dict(size=8)
-    ))
+def grade_trend_traces(levels, means, grouping, terms, first):
+    import numpy as np
+    traces = []
+    for i, (level, row) in enumerate(zip(levels, means)):
+        x = np.arange(first, first + len(row))[np.isfinite(row)]
+        y = row[np.isfinite(row)]
+        # Long series are cut down to their visually significant points before they are sent.
+        keep = lttb(x.astype(np.float64), y, TREND_MAX_POINTS)
+        x, y = x[keep], y[keep]
+        traces.append(dict(
+            type="scatter", name=cohort_label(grouping, level), x=typed_array(x, np.int32), y=typed_array(y, np.float32),
+            customdata=[terms[t] for t in x], mode="lines+markers" if len(x) <= TREND_MARKERS_UP_TO else "lines",
+            line=dict(color=TREND_COLORS[i % len(TREND_COLORS)], width=3), marker=dict(size=8),
+            hovertemplate="%{customdata}: %{y:.2f}<extra>%{fullData.name}</extra>"
+        ))
+    return traces
 
+def trend_xaxis(terms, first, last):
+    import numpy as np
+    ticks = np.unique(np.linspace(first, last, min(last - first + 1, TREND_MAX_TICKS)).round().astype(int))
+    return dict(title=dict(text="Term", font=dict(size=14)), tickmode="array", tickvals=ticks.tolist(),
+                ticktext=[terms[t] for t in ticks], tickfont=dict(size=12), range=[first - 0.1, last + 0.1])
+
+def plot_grade_trend(traces, xaxis):
+    import plotly.graph_objects as go
+    fig = go.Figure({"data": traces})
     fig.update_layout(
         template="simple_white",
         height=300,
@@ -163,13 +261,7 @@ def plot_grade_trend(data):
             xanchor='center',
             font=dict(size=16, color=COLOR_BLUE1)
         ),
-        xaxis=dict(
-            title="Term",
-            tickmode="array",
-            tickvals=["G1", "G2", "G3"],
-            title_font=dict(size=14),
-            tickfont=dict(size=12)
-        ),
+        xaxis=xaxis,
         yaxis=dict(
             title="Average Grade",
             range=[0, 20],
@@ -183,121 +275,419 @@ def plot_grade_trend(data):
     )
     return fig
 
-layout = dbc.Container([
-    html.Br(),
-    html.H2("Academic Insights", style={"color": COLOR_BLUE1}),
-    dbc.Row([
+# Styled figures are built once, on first render; callbacks only patch their data.
+@cache
+def figure_skeletons():
+    return {"factor": {"data": [], "layout": factor_layout()},
+            "trend": plot_grade_trend([], trend_xaxis(["G1", "G2", "G3"], 0, 2)).to_dict(),
+            "effects": {"data": [], "layout": effects_layout()},
+            "correlation": {"data": [], "layout": correlation_layout()}}
+
+@memoize(figure_cache, shared=True)
+def grade_by_factor_parts(school, filters, factor, chart_type):
+    return grade_by_factor_traces(grade_cube(filters), school, factor, chart_type=chart_type)
+
+def term_range(terms, selected):
+    last = len(terms) - 1
+    if not selected:
+        return 0, last
+    return min(max(int(min(selected)), 0), last), min(max(int(max(selected)), 0), last)
+
+@memoize(figure_cache, shared=True)
+def trend_parts(school, filters, grouping, selected_terms, window):
+    terms = term_labels()
+    first, last = term_range(terms, selected_terms)
+    grouping = grouping if grouping in TREND_GROUPINGS else "All"
+    levels, means = term_means(school, filters, grouping, first, last, max(int(window or 1), 1))
+    return grade_trend_traces(levels, means, grouping, terms, first), trend_xaxis(terms, first, last)
+
+def personal_chart_type(factor):
+    return "strip" if factor == "absences" else ("bar" if factor in ["Walc", "Dalc"] else "box")
+
+SUPPORT_FACTORS = [("School Support", "schoolsup"), ("Family Support", "famsup"),
+                   ("Paid Classes", "paid"), ("Internet Access", "internet")]
+LIFESTYLE_FACTORS = [("Free Time", "freetime"), ("Going Out", "goout"),
+                     ("Study Time", "studytime"), ("Activities", "activities")]
+PERSONAL_FACTORS = [("Weekday Alcohol", "Dalc"), ("Weekend Alcohol", "Walc"),
+                    ("Absences", "absences"), ("Health Rating", "health")]
+FACTOR_PLOTS = {
+    "support": (SUPPORT_FACTORS, lambda factor: "box"),
+    "lifestyle": (LIFESTYLE_FACTORS, lambda factor: "violin"),
+    "personal": (PERSONAL_FACTORS, personal_chart_type),
+}
+
+def factor_update(school, filters, factor, chart_type):
+    traces, xaxis, legend = grade_by_factor_parts(school, filters, factor, chart_type)
+    return replace_update(traces, xaxis=xaxis, legend=legend)
+
+def trend_update(school, filters, grouping="All", selected_terms=None, window=1):
+    traces, xaxis = trend_parts(school, filters, grouping, selected_terms, window)
+    return replace_update(traces, xaxis=xaxis)
+
+EFFECT_FACTORS = [(label, value) for factors, _ in FACTOR_PLOTS.values() for label, value in factors]
+SIGNIFICANCE_LEVEL = 0.05
+EFFECT_HOVER_LEVELS = 8
+
+def format_p(p):
+    import numpy as np
+    if not np.isfinite(p):
+        return "n/a"
+    stars = "***" if p < 0.001 else "**" if p < 0.01 else "*" if p < SIGNIFICANCE_LEVEL else ""
+    return ("<0.001" if p < 0.001 else f"{p:.3f}") + stars
+
+def level_label(level):
+    return "yes" if level is True else "no" if level is False else str(level)
+
+def factor_effect_traces(effects, school):
+    import numpy as np
+    row = school_row(effects["schools"], school)
+    rows = []
+    for label, factor in EFFECT_FACTORS:
+        tests = effects["factors"].get(factor)
+        if row is None or tests is None or not np.isfinite(tests["f"][row]):
+            continue
+        means = [f"{level_label(level)}: {mean:.2f} (n={int(n)})"
+                 for level, mean, n in zip(tests["levels"], tests["means"][row], tests["n"][row]) if n > 0]
+        if len(means) > EFFECT_HOVER_LEVELS:
+            means = means[:EFFECT_HOVER_LEVELS] + [f"… {len(means) - EFFECT_HOVER_LEVELS} more levels"]
+        tests_text = (f"ANOVA F {tests['f'][row]:.2f}, p {format_p(tests['f_p'][row])}<br>"
+                      f"Kruskal-Wallis H {tests['h'][row]:.2f}, p {format_p(tests['h_p'][row])}")
+        rows.append((tests["eta2"][row], label, tests["f_p"][row], tests_text + "<br>" + "<br>".join(means)))
+    rows.sort(key=lambda r: r[0])
+    traces = [dict(
+        type="bar", orientation="h", x=[round(float(r[0]), 4) for r in rows], y=[r[1] for r in rows],
+        text=[f"p {format_p(r[2])}" for r in rows], textposition="outside", cliponaxis=False,
+        hovertext=[r[3] for r in rows], hovertemplate="<b>%{y}</b> · η² %{x:.3f}<br>%{hovertext}<extra></extra>",
+        marker=dict(color=[COLOR_BLUE1 if r[2] < SIGNIFICANCE_LEVEL else COLOR_CYAN for r in rows]),
+        showlegend=False
+    )]
+    # Leave room right of the longest bar for its p-value label.
+    xaxis = {**effects_layout()["xaxis"], "range": [0, max([r[0] for r in rows], default=0.01) * 1.35]}
+    return traces, xaxis
+
+@cache
+def effects_layout():
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.update_layout(
+        template="simple_white",
+        height=460,
+        margin=dict(t=40, b=50, l=140, r=40),
+        xaxis=dict(title=dict(text="Share of grade variance explained (η²)"), color=COLOR_DARK),
+        yaxis=dict(color=COLOR_DARK),
+        plot_bgcolor=COLOR_BG,
+        paper_bgcolor=COLOR_BG,
+        font=dict(color=COLOR_DARK),
+        annotations=[dict(text=f"Dark bars: ANOVA p < {SIGNIFICANCE_LEVEL}. * p < 0.05, ** p < 0.01, *** p < 0.001",
+                          xref="paper", yref="paper", x=1, y=1.06, showarrow=False,
+                          font=dict(size=11, color=COLOR_GREY), xanchor="right")]
+    )
+    return fig.to_dict()["layout"]
+
+def correlation_table(school, filters):
+    import numpy as np
+    moments = correlation_moments(filters)
+    if moments is None:
+        cube = grade_cube(filters)
+        columns = [c for c in CORRELATION_COLUMNS if c in cube.levels]
+        r = cube_correlations(cube, school, columns)
+        return columns, ["final_grade"], np.array([[r[c] for c in columns]])
+    row = school_row(moments["schools"], school)
+    columns = moments["columns"]
+    if row is None:
+        return columns, columns, np.full((len(columns), len(columns)), np.nan)
+    corr = correlation_matrix(moments, row)
+    # final_grade first, then the columns most tied to it.
+    target = columns.index("final_grade")
+    strength = np.nan_to_num(np.abs(corr[target]), nan=-1.0)
+    strength[target] = 2.0
+    order = np.argsort(-strength, kind="stable")
+    columns = [columns[i] for i in order]
+    return columns, columns, corr[np.ix_(order, order)]
+
+def correlation_traces(x, y, corr):
+    import numpy as np
+    z = [[None if not np.isfinite(v) else round(float(v), 2) for v in row] for row in corr]
+    return [dict(
+        type="heatmap", x=x, y=y, z=z, zmin=-1, zmax=1, colorscale="RdBu", xgap=1, ygap=1,
+        texttemplate="%{z:.2f}", textfont=dict(size=9),
+        colorbar=dict(title=dict(text="r"), thickness=12),
+        hovertemplate="%{y} × %{x}: r = %{z:.2f}<extra></extra>"
+    )]
+
+@cache
+def correlation_layout():
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.update_layout(
+        template="simple_white",
+        height=560,
+        margin=dict(t=30, b=80, l=90, r=30),
+        xaxis=dict(tickangle=-45, color=COLOR_DARK, showgrid=False),
+        yaxis=dict(autorange="reversed", color=COLOR_DARK, showgrid=False),
+        plot_bgcolor=COLOR_BG,
+        paper_bgcolor=COLOR_BG,
+        font=dict(color=COLOR_DARK)
+    )
+    return fig.to_dict()["layout"]
+
+@memoize(figure_cache, shared=True)
+def statistics_parts(school, filters):
+    x, y, corr = correlation_table(school, filters)
+    height = correlation_layout()["height"] if len(y) > 1 else 200
+    return (*factor_effect_traces(factor_effects(filters), school), correlation_traces(x, y, corr), height)
+
+def statistics_updates(school, filters):
+    effects, xaxis, correlations, height = statistics_parts(school, filters)
+    return replace_update(effects, xaxis=xaxis), replace_update(correlations, height=height)
+
+def plot_statistics(school, filters):
+    import plotly.graph_objects as go
+    effects, xaxis, correlations, height = statistics_parts(school, filters)
+    return (go.Figure({"data": effects, "layout": {**effects_layout(), "xaxis": xaxis}}),
+            go.Figure({"data": correlations, "layout": {**correlation_layout(), "height": height}}))
+
+def report_figures(school, filters, support, lifestyle, personal, grouping, selected_terms, window):
+    cube = grade_cube(filters)
+    return [("Grade Trend", plot_grade_trend(*trend_parts(school, filters, grouping, selected_terms, window))),
+            *[(f"Grades by {label}", plot_grade_by_factor(cube, school, factor, chart_type(factor)))
+              for (factors, chart_type), factor in zip(FACTOR_PLOTS.values(), [support, lifestyle, personal])
+              for label, value in factors if value == factor],
+            *zip(["Factor Effects", "Correlations"], plot_statistics(school, filters))]
+
+@memoize(figure_cache, shared=True)
+def clientside_payload():
+    def school_view(school):
+        values = kpi_values(school)
+        return {
+            "kpis": [values[key] for key, _, _ in KPI_CARDS],
+            **{slot: {factor: factor_update(school, {}, factor, chart_type(factor)) for _, factor in factors}
+               for slot, (factors, chart_type) in FACTOR_PLOTS.items()},
+        }
+    return {"schools": {school: school_view(school) for school in ["All", *schools()]},
+            "empty": school_view(SCHOOL_PLACEHOLDER)}
+
+# Decided on first use, since measuring the payload needs the data.
+@cache
+def clientside_mode():
+    return embeddable(clientside_payload)
+
+def factor_options(factors):
+    return [{"label": label, "value": value} for label, value in factors]
+
+def trend_controls():
+    terms = term_labels()
+    step = max(1, -(-len(terms) // TREND_MAX_TICKS))
+    return dbc.Row([
         dbc.Col([
-            html.Label("Filter by School:", style={"color": COLOR_DARK}),
+            html.Label("Group by:", style={"color": COLOR_DARK}),
             dcc.Dropdown(
-                id="academic-school-filter",
-                options=[{"label": "All", "value": "All"}] +
-                        [{"label": s, "value": s} for s in sorted(df["school"].unique())],
+                id="academic-trend-group",
+                options=[{"label": "All students" if g == "All" else g, "value": g} for g in TREND_GROUPINGS],
                 value="All", clearable=False,
                 style={"backgroundColor": COLOR_BG}
             )
-        ], width=3)
-    ]),
-    html.Br(),
-    html.H4("Key Metrics", style={"color": COLOR_BLUE1}),
-    html.Div(
-        id="academic-metrics-row",
-        style={
-            "display": "grid",
-            "gridTemplateColumns": "repeat(auto-fit, minmax(160px, 1fr))",
-            "gap": "12px",
-            "padding": "12px 6px",
-            "alignItems": "stretch"
-        }
-    ),
-    html.Hr(),
-    html.H4("Support & Lifestyle Factors vs Grades", style={"color": COLOR_BLUE1}),
-    dbc.Row([
-        dbc.Col([
-            html.Label("", style={"color": COLOR_DARK}),
-            dcc.Dropdown(
-                id="support-factor",
-                options=[
-                    {"label": "School Support", "value": "schoolsup"},
-                    {"label": "Family Support", "value": "famsup"},
-                    {"label": "Paid Classes", "value": "paid"},
-                    {"label": "Internet Access", "value": "internet"},
-                ],
-                value="schoolsup", clearable=False,
-                style={"backgroundColor": COLOR_BG}
-            ),
-            dcc.Graph(id="support-plot")
-        ], width=6),
+        ], width=3),
         dbc.Col([
-            html.Label("", style={"color": COLOR_DARK}),
+            html.Label("Rolling mean over:", style={"color": COLOR_DARK}),
             dcc.Dropdown(
-                id="lifestyle-factor",
-                options=[
-                    {"label": "Free Time", "value": "freetime"},
-                    {"label": "Going Out", "value": "goout"},
-                    {"label": "Study Time", "value": "studytime"},
-                    {"label": "Activities", "value": "activities"},
-                ],
-                value="studytime", clearable=False,
+                id="academic-trend-window",
+                options=[{"label": "1 term" if w == 1 else f"{w} terms", "value": w}
+                         for w in TREND_WINDOWS if w <= len(terms)],
+                value=1, clearable=False,
                 style={"backgroundColor": COLOR_BG}
-            ),
-            dcc.Graph(id="lifestyle-plot")
-        ], width=6),
-    ]),
-    html.Hr(),
-    html.H4("Health and Personal Factors vs Grades", style={"color": COLOR_BLUE1}),
-    dbc.Row([
+            )
+        ], width=2),
         dbc.Col([
-            html.Label("", style={"color": COLOR_DARK}),
-            dcc.Dropdown(
-                id="personal-factor",
-                options=[
-                    {"label": "Weekday Alcohol", "value": "Dalc"},
-                    {"label": "Weekend Alcohol", "value": "Walc"},
-                    {"label": "Absences", "value": "absences"},
-                    {"label": "Health Rating", "value": "health"},
-                ],
-                value="Walc", clearable=False,
-                style={"backgroundColor": COLOR_BG}
-            ),
-            dcc.Graph(id="personal-plot")
-        ])
-    ]),
-    html.Hr(),
-    html.H4("Grade Progression Over Time", style={"color": COLOR_BLUE1}),
-    dbc.Row([dbc.Col(dcc.Graph(id="academic-trend-fig"), width=12)])
-], fluid=True, style={"backgroundColor": COLOR_BG, "color": COLOR_DARK})
+            html.Label("Terms:", style={"color": COLOR_DARK}),
+            dcc.RangeSlider(
+                id="academic-trend-range", min=0, max=len(terms) - 1, step=1, value=[0, len(terms) - 1],
+                marks={i: terms[i] for i in range(0, len(terms), step)}, allowCross=False
+            )
+        ], width=7),
+    ], className="mt-2")
+
+def layout(**kwargs):
+    return dbc.Container([
+        html.Br(),
+        html.H2("Academic Insights", style={"color": COLOR_BLUE1}),
+        dbc.Row([
+            dbc.Col([
+                html.Label("Filter by School:", style={"color": COLOR_DARK}),
+                dcc.Dropdown(
+                    id="academic-school-filter",
+                    options=[{"label": "All", "value": "All"}] +
+                            [{"label": s, "value": s} for s in schools()],
+                    value="All", clearable=False,
+                    style={"backgroundColor": COLOR_BG}
+                )
+            ], width=3)
+        ]),
+        *([] if clientside_mode() else [filter_panel("academic")]),
+        filter_store("academic"),
+        export_panel("academic"),
+        html.Br(),
+        html.H4("Key Metrics", style={"color": COLOR_BLUE1}),
+        html.Div(
+            [card(title, f"academic-kpi-{key}", icon, highlight=key in ("grade", "activities"))
+             for key, title, icon in KPI_CARDS],
+            id="academic-metrics-row",
+            style={
+                "display": "grid",
+                "gridTemplateColumns": "repeat(auto-fit, minmax(160px, 1fr))",
+                "gap": "12px",
+                "padding": "12px 6px",
+                "alignItems": "stretch"
+            }
+        ),
+        html.Hr(),
+        html.H4("Support & Lifestyle Factors vs Grades", style={"color": COLOR_BLUE1}),
+        dbc.Row([
+            dbc.Col([
+                html.Label("", style={"color": COLOR_DARK}),
+                dcc.Dropdown(
+                    id="support-factor",
+                    options=factor_options(SUPPORT_FACTORS),
+                    value="schoolsup", clearable=False,
+                    style={"backgroundColor": COLOR_BG}
+                ),
+                dcc.Graph(id="support-plot", figure=figure_skeletons()["factor"])
+            ], width=6),
+            dbc.Col([
+                html.Label("", style={"color": COLOR_DARK}),
+                dcc.Dropdown(
+                    id="lifestyle-factor",
+                    options=factor_options(LIFESTYLE_FACTORS),
+                    value="studytime", clearable=False,
+                    style={"backgroundColor": COLOR_BG}
+                ),
+                dcc.Graph(id="lifestyle-plot", figure=figure_skeletons()["factor"])
+            ], width=6),
+        ]),
+        drilldown_panel("academic", "Click a box in the support chart to list the students behind it."),
+        html.Hr(),
+        html.H4("Health and Personal Factors vs Grades", style={"color": COLOR_BLUE1}),
+        dbc.Row([
+            dbc.Col([
+                html.Label("", style={"color": COLOR_DARK}),
+                dcc.Dropdown(
+                    id="personal-factor",
+                    options=factor_options(PERSONAL_FACTORS),
+                    value="Walc", clearable=False,
+                    style={"backgroundColor": COLOR_BG}
+                ),
+                dcc.Graph(id="personal-plot", figure=figure_skeletons()["factor"])
+            ])
+        ]),
+        html.Hr(),
+        html.H4("Factor Effects and Correlations", style={"color": COLOR_BLUE1}),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="academic-effects-fig", figure=figure_skeletons()["effects"]), width=6),
+            dbc.Col(dcc.Graph(id="academic-correlation-fig", figure=figure_skeletons()["correlation"]), width=6),
+        ]),
+        html.Hr(),
+        html.H4("Grade Progression Over Time", style={"color": COLOR_BLUE1}),
+        trend_controls(),
+        dbc.Row([dbc.Col(dcc.Graph(id="academic-trend-fig", figure=figure_skeletons()["trend"]), width=12)]),
+        *([dcc.Store(id="academic-data", data=clientside_payload())] if clientside_mode() else []),
+    ], fluid=True, style={"backgroundColor": COLOR_BG, "color": COLOR_DARK})
+
+register_filter_store("academic")
+register_export("academic", "academic-school-filter", report_figures,
+                ["support-factor", "lifestyle-factor", "personal-factor", "academic-trend-group",
+                 "academic-trend-range", "academic-trend-window"])
+register_drilldown("academic", "academic-school-filter", [("support-plot", "clickData")], factor_drill,
+                   states=["support-factor"])
 
 @callback(
-    Output("academic-metrics-row", "children"),
-    Output("support-plot", "figure"),
-    Output("lifestyle-plot", "figure"),
-    Output("personal-plot", "figure"),
     Output("academic-trend-fig", "figure"),
     Input("academic-school-filter", "value"),
-    Input("support-factor", "value"),
-    Input("lifestyle-factor", "value"),
-    Input("personal-factor", "value")
+    Input("academic-filters", "data"),
+    Input("academic-trend-group", "value"),
+    Input("academic-trend-range", "value"),
+    Input("academic-trend-window", "value")
+)
+@instrumented
+@consistent_snapshot
+def update_trend(school, filters, grouping, selected_terms, window):
+    with stage("figure_build"):
+        return update_patch(trend_update(school, filters, grouping, selected_terms, window))
+
+@callback(
+    Output("academic-effects-fig", "figure"),
+    Output("academic-correlation-fig", "figure"),
+    Input("academic-school-filter", "value"),
+    Input("academic-filters", "data")
 )
-def update_academic_dashboard(school, support, lifestyle, personal):
-    dff = df if school == "All" else df[df["school"] == school]
-    m = calculate_metrics(dff)
-    ratio = f"GP: {m['gp_pct']}% · MS: {m['ms_pct']}%" if school == "All" else f"{school}: {round((len(dff)/len(df))*100)}%"
-    metrics_cards = [
-        card("Total Students", m["total"], "👥"),
-        card("School Ratio", ratio, "🏫"),
-        card("Avg Final Grade", f"{m['avg_grade']} / 20", "📊", highlight=True),
-        card("Absences / Student", f"{int(m['avg_absences'])} / yr", "📅"),
-        card("Activities", f"{m['activities_pct']}%", "🎯", highlight=True),
-        card("Free Time Rating", f"{m['avg_freetime']} / 5", "🕒"),
-        card("Health Rating", f"{m['avg_health']} / 5", "💪"),
-    ]
-    lifestyle_chart = "violin"
-    personal_chart = "strip" if personal == "absences" else ("bar" if personal in ["Walc", "Dalc"] else "box")
-    return (
-        metrics_cards,
-        plot_grade_by_factor(dff, support, chart_type="box"),
-        plot_grade_by_factor(dff, lifestyle, chart_type=lifestyle_chart),
-        plot_grade_by_factor(dff, personal, chart_type=personal_chart),
-        plot_grade_trend(dff)
-    )
\ No newline at end of file
+@instrumented
+@consistent_snapshot
+def update_statistics(school, filters):
+    with stage("figure_build"):
+        return [update_patch(update) for update in statistics_updates(school, filters)]
+
+def register_view_callbacks(app):
+    if clientside_mode():
+        app.clientside_callback(
+            ClientsideFunction("dashboard", "academicMetrics"),
+            *[Output(f"academic-kpi-{key}", "children") for key, _, _ in KPI_CARDS],
+            Input("academic-school-filter", "value"),
+            State("academic-data", "data")
+        )
+        for slot in FACTOR_PLOTS:
+            app.clientside_callback(
+                ClientsideFunction("dashboard", f"{slot}Plot"),
+                Output(f"{slot}-plot", "figure"),
+                Input("academic-school-filter", "value"),
+                Input(f"{slot}-factor", "value"),
+                State("academic-data", "data"),
+                State(f"{slot}-plot", "figure")
+            )
+        return
+
+    @app.callback(
+        *[Output(f"academic-kpi-{key}", "children") for key, _, _ in KPI_CARDS],
+        Input("academic-school-filter", "value"),
+        Input("academic-filters", "data")
+    )
+    @instrumented
+    @consistent_snapshot
+    def update_academic_metrics(school, filters):
+        with stage("metrics"):
+            values = kpi_values(school, filters)
+        return [values[key] for key, _, _ in KPI_CARDS]
+
+    @app.callback(
+        Output("support-plot", "figure"),
+        Input("academic-school-filter", "value"),
+        Input("support-factor", "value"),
+        Input("academic-filters", "data")
+    )
+    @instrumented
+    @consistent_snapshot
+    def update_support_plot(school, support, filters):
+        with stage("figure_build"):
+            return update_patch(factor_update(school, filters, support, "box"))
+
+    @app.callback(
+        Output("lifestyle-plot", "figure"),
+        Input("academic-school-filter", "value"),
+        Input("lifestyle-factor", "value"),
+        Input("academic-filters", "data")
+    )
+    @instrumented
+    @consistent_snapshot
+    def update_lifestyle_plot(school, lifestyle, filters):
+        with stage("figure_build"):
+            return update_patch(factor_update(school, filters, lifestyle, "violin"))
+
+    @app.callback(
+        Output("personal-plot", "figure"),
+        Input("academic-school-filter", "value"),
+        Input("personal-factor", "value"),
+        Input("academic-filters", "data")
+    )
+    @instrumented
+    @consistent_snapshot
+    def update_personal_plot(school, personal, filters):
+        with stage("figure_build"):
+            return update_patch(factor_update(school, filters, personal, personal_chart_type(personal)))
@@ -1,8 +1,18 @@
-from dash import html, dcc, register_page, Input, Output
+import math
+from functools import cache
+
+from dash import html, dcc, register_page, ClientsideFunction, Input, Output, State
 import dash_bootstrap_components as dbc
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+
+from aggregates import KPI_CARDS, grade_cube, kpi_values, metrics_for, schools
+from cache import figure_cache, memoize
+from cube import GRADE_GRID
+from dataset import consistent_snapshot
+from drilldown import drilldown_panel, grade_range_drill, register_drilldown
+from export import export_panel, register_export
+from figure_updates import SCHOOL_PLACEHOLDER, embeddable, trace_update, update_patch
+from filters import filter_panel, filter_store, register_filter_store
+from instrumentation import instrumented, stage
 
 COLOR_BG = "#FFFFFF"
 COLOR_DARK = "#062A74"
@@ -16,22 +26,7 @@ PALETTE_MAIN = [COLOR_BLUE1, COLOR_BLUE2, COLOR_CYAN, COLOR_GREY, COLOR_SOFT_ORA
 
 register_page(__name__, path="/", name="Overview")
 
-df = pd.read_csv("data/student_data.csv")
-df["final_grade"] = df[["G1", "G2", "G3"]].mean(axis=1)
-
-def calculate_metrics(df_filtered):
-    return {
-        "total": len(df_filtered),
-        "avg_grade": round(df_filtered["final_grade"].mean(), 1),
-        "gp_pct": round((df_filtered["school"] == "GP").mean() * 100),
-        "ms_pct": 100 - round((df_filtered["school"] == "GP").mean() * 100),
-        "activities_pct": round((df_filtered["activities"] == "yes").mean() * 100),
-        "avg_absences": round(df_filtered["absences"].mean()),
-        "avg_health": round(df_filtered["health"].mean(), 1),
-        "avg_freetime": round(df_filtered["freetime"].mean(), 1),
-        "activities_pct": round((df_filtered["activities"] == "yes").mean() * 100),
-    }
-def card(title, val, icon="📊"):
+def card(title, value_id, icon="📊"):
     style = {
         "flex": "0 0 auto",
         "width": "100%",
@@ -46,8 +41,6 @@ def card(title, val, icon="📊"):
         "margin": "0"
     }
 
-    safe_val = str(val) if val is not None else "-"
-
     return dbc.Card([
         dbc.CardBody([
             html.Div([
@@ -76,7 +69,7 @@ def card(title, val, icon="📊"):
                 "marginBottom": "0.6em"
             }),
 
-            html.Div(safe_val, style={
+            html.Div("-", id=value_id, style={
                 "color": COLOR_BLUE1,
                 "fontWeight": 700,
                 "fontSize": "1.15rem",
@@ -87,19 +80,17 @@ def card(title, val, icon="📊"):
         ])
     ], style=style)
 
-def plot_categorical_bar(df, column, label, categories=None, display_labels=None):
-    if categories is None:
-        categories = sorted(df[column].dropna().unique())
-    prop_data = (
-        df[column].value_counts(normalize=True)
-        .reindex(categories, fill_value=0)
-        .reset_index()
-    )
-    prop_data.columns = ["label", "Proportion"]
-    if display_labels:
-        prop_data["label"] = [display_labels.get(val, val) for val in categories]
-    else:
-        prop_data["label"] = prop_data["label"].astype(str)
+def categorical_bar_values(cube, school, column, categories):
+    proportions = cube.proportions(school, column)
+    return [proportions.get(val, 0) for val in categories]
+
+def plot_categorical_bar(values, label, categories, display_labels=None):
+    import plotly.express as px
+
+    prop_data = {
+        "label": [display_labels.get(val, val) if display_labels else str(val) for val in categories],
+        "Proportion": values,
+    }
     palette = PALETTE_MAIN.copy()
     while len(palette) < len(categories):
         palette += palette
@@ -124,6 +115,7 @@ def plot_categorical_bar(df, column, label, categories=None, display_labels=None
     return fig
 
 def plot_donut(title, yes_pct):
+    import plotly.graph_objects as go
     fig = go.Figure([
         go.Pie(
             labels=["Yes", "No"],
@@ -147,12 +139,54 @@ def plot_donut(title, yes_pct):
     )
     return fig
 
-def plot_grade_distribution(df):
-    fig = px.histogram(
-        df, x="final_grade", nbins=20,
-        color_discrete_sequence=[COLOR_BLUE1]
-    )
-    fig.update_traces(marker=dict(line=dict(width=1, color="white")))
+# The bins plotly.js picks for a histogram of the grades with nbins=20, as the chart was first drawn:
+# a round bin size, the first edge below the lowest grade, shifted half a bin when the grades sit
+# on the edges, and no empty bins at either end.
+HISTOGRAM_BINS = 20
+
+def _round_bin_size(rough):
+    if rough <= 0:
+        return 1.0
+    base = 10 ** math.floor(math.log(rough) / math.log(10))
+    return base * next((step for step in (2, 5) if step > rough / base), 10)
+
+def grade_distribution_bins(cube, school):
+    import numpy as np
+    weights = cube.grade_histogram(school)
+    present = np.flatnonzero(weights)
+    if not len(present):
+        return [], []
+    # final_grade is float32, so these are the values the browser binned.
+    values, weights = GRADE_GRID.astype(np.float32).astype(float)[present], weights[present]
+    lo, hi, total = values[0], values[-1], weights.sum()
+    size = _round_bin_size((hi - lo) / HISTOGRAM_BINS)
+    start = (math.ceil(lo / size) - 1) * size
+    def near_edge(v):
+        return (1 + (v - start) * 100 / size) % 100 < 2
+    if (values % 1 == 0).all():
+        start = lo - size / 2 if size < 1 else start - 0.5 + (size if start + size - 0.5 < lo else 0)
+    elif weights[near_edge(values + size / 2)].sum() < total * 0.1 \
+            and (weights[near_edge(values)].sum() > total * 0.3 or near_edge(lo) or near_edge(hi)):
+        start += size / 2 if start + size / 2 < lo else -size / 2
+    bins = np.floor((values - start) / size + 1e-9).astype(int)
+    first = bins.min()
+    edges = np.round(start + np.arange(first, bins.max() + 2) * size, 6)
+    return edges.tolist(), np.bincount(bins - first, weights=weights).tolist()
+
+def distribution_trace(edges, counts):
+    import numpy as np
+    edges = np.asarray(edges, dtype=float)
+    return dict(x=((edges[:-1] + edges[1:]) / 2).tolist(), y=counts,
+                width=float(edges[1] - edges[0]) if len(edges) > 1 else 1.0,
+                customdata=np.column_stack([edges[:-1], edges[1:]]).tolist())
+
+def plot_grade_distribution(bins):
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(
+        **distribution_trace(*bins),
+        marker=dict(color=COLOR_BLUE1, line=dict(width=1, color="white")),
+        hovertemplate="final_grade=%{customdata[0]}–%{customdata[1]}<br>count=%{y}<extra></extra>",
+    ))
     fig.update_layout(
         height=340,
         xaxis_title="Average Grade",
@@ -164,87 +198,159 @@ def plot_grade_distribution(df):
     )
     return fig
 
-layout = dbc.Container([
-    html.Br(),
-    html.H2("Key Metrics", style={"color": COLOR_BLUE1}),
-    dbc.Row([
-        dbc.Col([
-            html.Label("Filter by School:", style={"color": COLOR_DARK}),
-            dcc.Dropdown(
-                id="school-filter",
-                options=[
-                    {"label": "All", "value": "All"},
-                    {"label": "GP", "value": "GP"},
-                    {"label": "MS", "value": "MS"},
-                ],
-                value="All",
-                clearable=False,
-                style={"backgroundColor": COLOR_BG}
-            ),
-        ], width=3)
-    ]),
-    html.Br(),
-    html.Div(id="metrics-row", style={
-        "display": "grid",
-        "gridTemplateColumns": "repeat(auto-fit, minmax(160px, 1fr))",
-        "gap": "12px",
-        "padding": "12px 6px"
-    }),
-    html.Hr(),
-    html.H4("Demographics", style={"color": COLOR_BLUE1}),
-    dbc.Row(id="demographics-row"),
-    html.Hr(),
-    html.H4("Support Access", style={"color": COLOR_BLUE1}),
-    dbc.Row(id="support-row", className="mb-4"),
-    html.Hr(),
-    html.H4("Access and Aspirations", style={"color": COLOR_BLUE1}),
-    dbc.Row(id="donut-row"),
-    html.Hr(),
-    html.H4("Grade Distribution", style={"color": COLOR_BLUE1}),
-    dbc.Row([dbc.Col(dcc.Graph(id="grade-distribution"), width=12)]),
-], fluid=True, style={"backgroundColor": COLOR_BG, "color": COLOR_DARK})
+DEMOGRAPHIC_CHARTS = [("sex", "Gender", ["F", "M"], {"F": "Female", "M": "Male"}),
+                      ("address", "Urban vs Rural", ["U", "R"], {"U": "Urban", "R": "Rural"}),
+                      ("famsize", "Family Size", ["LE3", "GT3"], {"LE3": "≤3", "GT3": ">3"})]
+SUPPORT_CHARTS = [("schoolsup", "School Support", [False, True], {False: "No", True: "Yes"}),
+                  ("famsup", "Family Support", [False, True], {False: "No", True: "Yes"}),
+                  ("paid", "Paid Classes", [False, True], {False: "No", True: "Yes"})]
+DONUT_CHARTS = [("internet", "Has Internet Access"),
+                ("higher", "Wants Higher Education"),
+                ("activities", "Participates in Activities")]
+BAR_CHARTS = DEMOGRAPHIC_CHARTS + SUPPORT_CHARTS
+
+@memoize(figure_cache, shared=True)
+def bar_values(school, filters, column, categories):
+    return categorical_bar_values(grade_cube(filters), school, column, categories)
+
+@memoize(figure_cache, shared=True)
+def distribution_bins(school, filters):
+    return grade_distribution_bins(grade_cube(filters), school)
+
+def bar_update(school, filters, column, categories):
+    return trace_update(bar_values(school, filters, column, categories), per_trace=True)
+
+def donut_update(m, key):
+    return trace_update([m[f"{key}_pct"], 100 - m[f"{key}_pct"]], prop="values")
+
+def distribution_update(school, filters):
+    trace = distribution_trace(*distribution_bins(school, filters))
+    return {"traces": [[0, prop, value] for prop, value in trace.items()]}
+
+def report_figures(school, filters):
+    m = metrics_for(school, filters)
+    return [(title, plot_categorical_bar(bar_values(school, filters, col, cats), title, cats, labels))
+            for col, title, cats, labels in BAR_CHARTS] \
+        + [(title, plot_donut(title, m[f"{key}_pct"])) for key, title in DONUT_CHARTS] \
+        + [("Grade Distribution", plot_grade_distribution(distribution_bins(school, filters)))]
+
+@memoize(figure_cache, shared=True)
+def clientside_payload():
+    def school_view(school):
+        values = kpi_values(school)
+        m = metrics_for(school)
+        return {
+            "kpis": [values[key] for key, _, _ in KPI_CARDS],
+            "figures": [bar_update(school, {}, col, cats) for col, _, cats, _ in BAR_CHARTS]
+                       + [donut_update(m, key) for key, _ in DONUT_CHARTS]
+                       + [distribution_update(school, {})],
+        }
+    return {"schools": {school: school_view(school) for school in ["All", *schools()]},
+            "empty": school_view(SCHOOL_PLACEHOLDER)}
+
+# Decided on first use, since measuring the payload needs the data.
+@cache
+def clientside_mode():
+    return embeddable(clientside_payload)
+
+FIGURE_IDS = [f"{col}-bar" for col, *_ in BAR_CHARTS] + [f"{key}-donut" for key, _ in DONUT_CHARTS] \
+             + ["grade-distribution"]
+
+# Styled figures are built once, on first render; callbacks only patch their data arrays.
+@cache
+def figure_skeletons():
+    figures = [plot_categorical_bar([0] * len(cats), title, cats, labels) for _, title, cats, labels in BAR_CHARTS] \
+        + [plot_donut(title, 0) for _, title in DONUT_CHARTS] \
+        + [plot_grade_distribution(([], []))]
+    return dict(zip(FIGURE_IDS, (fig.to_dict() for fig in figures)))
+
+def bar_graph(column):
+    return dbc.Col(dcc.Graph(id=f"{column}-bar", figure=figure_skeletons()[f"{column}-bar"]), width=4)
+
+def donut_graph(key):
+    return dbc.Col(dcc.Graph(id=f"{key}-donut", figure=figure_skeletons()[f"{key}-donut"]), width=4)
+
+def layout(**kwargs):
+    return dbc.Container([
+        html.Br(),
+        html.H2("Key Metrics", style={"color": COLOR_BLUE1}),
+        dbc.Row([
+            dbc.Col([
+                html.Label("Filter by School:", style={"color": COLOR_DARK}),
+                dcc.Dropdown(
+                    id="school-filter",
+                    options=[
+                        {"label": "All", "value": "All"},
+                        {"label": "GP", "value": "GP"},
+                        {"label": "MS", "value": "MS"},
+                    ],
+                    value="All",
+                    clearable=False,
+                    style={"backgroundColor": COLOR_BG}
+                ),
+            ], width=3)
+        ]),
+        *([] if clientside_mode() else [filter_panel("overview")]),
+        filter_store("overview"),
+        export_panel("overview"),
+        html.Br(),
+        html.Div([card(title, f"kpi-{key}", icon) for key, title, icon in KPI_CARDS], id="metrics-row", style={
+            "display": "grid",
+            "gridTemplateColumns": "repeat(auto-fit, minmax(160px, 1fr))",
+            "gap": "12px",
+            "padding": "12px 6px"
+        }),
+        html.Hr(),
+        html.H4("Demographics", style={"color": COLOR_BLUE1}),
+        dbc.Row([bar_graph(col) for col, *_ in DEMOGRAPHIC_CHARTS], id="demographics-row"),
+        html.Hr(),
+        html.H4("Support Access", style={"color": COLOR_BLUE1}),
+        dbc.Row([bar_graph(col) for col, *_ in SUPPORT_CHARTS], id="support-row", className="mb-4"),
+        html.Hr(),
+        html.H4("Access and Aspirations", style={"color": COLOR_BLUE1}),
+        dbc.Row([donut_graph(key) for key, _ in DONUT_CHARTS], id="donut-row"),
+        html.Hr(),
+        html.H4("Grade Distribution", style={"color": COLOR_BLUE1}),
+        dbc.Row([dbc.Col(dcc.Graph(id="grade-distribution", figure=figure_skeletons()["grade-distribution"]), width=12)]),
+        drilldown_panel("overview", "Click a bar of the grade distribution, or box-select several, "
+                                    "to list the students behind it."),
+        *([dcc.Store(id="overview-data", data=clientside_payload())] if clientside_mode() else []),
+    ], fluid=True, style={"backgroundColor": COLOR_BG, "color": COLOR_DARK})
 
 def register_callbacks(app):
+    register_filter_store("overview")
+    register_export("overview", "school-filter", report_figures)
+    register_drilldown("overview", "school-filter",
+                       [("grade-distribution", "clickData"), ("grade-distribution", "selectedData")],
+                       grade_range_drill)
+
+def register_view_callbacks(app):
+    if clientside_mode():
+        app.clientside_callback(
+            ClientsideFunction("dashboard", "overview"),
+            *[Output(f"kpi-{key}", "children") for key, _, _ in KPI_CARDS],
+            *[Output(graph_id, "figure") for graph_id in FIGURE_IDS],
+            Input("school-filter", "value"),
+            State("overview-data", "data"),
+            *[State(graph_id, "figure") for graph_id in FIGURE_IDS],
+        )
+        return
+
+    # Every output depends on the same two inputs, so one request patches the data arrays of all charts.
     @app.callback(
-        Output("metrics-row", "children"),
-        Output("demographics-row", "children"),
-        Output("support-row", "children"),
-        Output("donut-row", "children"),
-        Output("grade-distribution", "figure"),
+        *[Output(f"kpi-{key}", "children") for key, _, _ in KPI_CARDS],
+        *[Output(graph_id, "figure") for graph_id in FIGURE_IDS],
         Input("school-filter", "value"),
+        Input("overview-filters", "data"),
     )
-    def update_dashboard(school):
-        dff = df if school == "All" else df[df["school"] == school]
-        m = calculate_metrics(dff)
-        ratio = f"GP: {m['gp_pct']}% · MS: {m['ms_pct']}%" if school == "All" else f"{school}: {round((len(dff)/len(df))*100)}%"
-        cards = [
-            card("Total Students", m["total"], "👥"),
-            card("School Ratio", ratio, "🏫"),
-            card("Avg Final Grade", f"{m['avg_grade']} / 20", "📊"),
-            card("Absences / Student", f"{int(m['avg_absences'])} / yr", "📅"),
-            card("Activities", f"{m['activities_pct']}%", "🎯"),
-            card("Free Time Rating", f"{m['avg_freetime']} / 5", "🕒"),
-            card("Health Rating", f"{m['avg_health']} / 5", "💪"),
-        ]
-        demo = [("sex", "Gender", ["F", "M"], {"F": "Female", "M": "Male"}),
-                ("address", "Urban vs Rural", ["U", "R"], {"U": "Urban", "R": "Rural"}),
-                ("famsize", "Family Size", ["LE3", "GT3"], {"LE3": "≤3", "GT3": ">3"})]
-        demo_graphs = [dbc.Col(dcc.Graph(figure=plot_categorical_bar(dff, col, title, cats, labels)), width=4)
-                       for col, title, cats, labels in demo]
-        support = [("schoolsup", "School Support", ["no", "yes"], {"no": "No", "yes": "Yes"}),
-                   ("famsup", "Family Support", ["no", "yes"], {"no": "No", "yes": "Yes"}),
-                   ("paid", "Paid Classes", ["no", "yes"], {"no": "No", "yes": "Yes"})]
-        support_graphs = [dbc.Col(dcc.Graph(figure=plot_categorical_bar(dff, col, title, cats, labels)), width=4)
-                          for col, title, cats, labels in support]
-        donut_row = [
-            dbc.Col(dcc.Graph(figure=plot_donut("Has Internet Access", (dff["internet"]=="yes").mean()*100)), width=4),
-            dbc.Col(dcc.Graph(figure=plot_donut("Wants Higher Education", (dff["higher"]=="yes").mean()*100)), width=4),
-            dbc.Col(dcc.Graph(figure=plot_donut("Participates in Activities", m["activities_pct"])), width=4),
-        ]
-        return (
-            cards,
-            dbc.Row(demo_graphs),
-            dbc.Row(support_graphs),
-            dbc.Row(donut_row),
-            plot_grade_distribution(dff)
-        )
+    @instrumented
+    @consistent_snapshot
+    def update_dashboard(school, filters):
+        with stage("metrics"):
+            values = kpi_values(school, filters)
+            m = metrics_for(school, filters)
+        with stage("figure_build"):
+            figures = [bar_update(school, filters, col, cats) for col, _, cats, _ in BAR_CHARTS] \
+                + [donut_update(m, key) for key, _ in DONUT_CHARTS] \
+                + [distribution_update(school, filters)]
+        return (*[values[key] for key, _, _ in KPI_CARDS], *[update_patch(update) for update in figures])
@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, GradeCube, grade_histogram, grade_units
+from metrics_engine import METRIC_COLUMNS, metric_sums
+
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", 0))
+PARALLEL_MIN_ROWS = int(os.environ.get("PARALLEL_MIN_ROWS", 500_000))
+
+_pool = None
+_pool_lock = threading.Lock()
+_attached = {}
+
+# A filtered view over many rows is split into row ranges, one per worker. The
+# workers read compact column codes from one shared memory block, get only
+# their slice of the selection bitmap, and return small per-range histograms
+# that the caller adds up.
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(PARALLEL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard(executor):
+    # A worker that dies breaks its executor for good; the next pool() starts a fresh one.
+    global _pool
+    with _pool_lock:
+        if _pool is executor:
+            _pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _forget_pool():
+    # A forked web worker (gunicorn --preload) cannot use the parent's pool threads.
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def in_pool_worker():
+    # Spawned workers import the main script again; they must not load data or start pools.
+    return multiprocessing.current_process().name != "MainProcess"
+
+
+def _attach(name):
+    # Workers keep the current snapshot's block mapped and let go of older ones.
+    if name not in _attached:
+        for block in _attached.values():
+            try:
+                block.close()
+            except BufferError:
+                pass
+        _attached.clear()
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    return _attached[name]
+
+
+def _columns(spec):
+    buffer = _attach(spec["name"]).buf
+    return {col: np.ndarray(length, dtype=dtype, buffer=buffer, offset=offset)
+            for col, (offset, dtype, length) in spec["columns"].items()}
+
+
+def _range_view(spec, start, stop, bitmap):
+    columns = _columns(spec)
+    rows = start + np.flatnonzero(np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=stop - start))
+    school = columns["school"][rows].astype(np.int64)
+    units = columns["units"][rows].astype(np.int64)
+    n_schools = len(spec["levels"]["school"])
+    hist = {dim: grade_histogram(school, n_schools, columns[dim][rows].astype(np.int64), len(spec["levels"][dim]),
+                                 units)
+            for dim in spec["dimensions"]}
+    g1, g2 = columns["G1"][rows].astype(np.float64), columns["G2"][rows].astype(np.float64)
+    measures = {"G1": g1, "G2": g2, "G3": units - g1 - g2}
+    measure_sums = {m: np.bincount(school, weights=v, minlength=n_schools) for m, v in measures.items()}
+    values = [np.ones(len(rows)), units / 3]
+    values += [np.asarray(spec["levels"][col], dtype=np.float64)[columns[col][rows]]
+               for col in METRIC_COLUMNS[1:]]
+    return hist, measure_sums, metric_sums(school, n_schools, np.column_stack(values))
+
+
+class SharedViews:
+    def __init__(self, frame, dimensions=CUBE_DIMENSIONS):
+        self.rows = len(frame)
+        self.dimensions = dimensions
+        arrays, self.levels = {}, {}
+        for col in list(dict.fromkeys(["school", *dimensions, *METRIC_COLUMNS[1:]])):
+            codes, uniques = pd.factorize(frame[col], sort=True)
+            arrays[col] = codes.astype(np.int8 if len(uniques) < 128 else np.int16)
+            self.levels[col] = uniques.tolist()
+        arrays["units"] = grade_units(frame).astype(np.int8)
+        arrays["G1"] = frame["G1"].to_numpy(dtype=np.int8)
+        arrays["G2"] = frame["G2"].to_numpy(dtype=np.int8)
+
+        layout, offset = {}, 0
+        for col, array in arrays.items():
+            layout[col] = (offset, array.dtype.str, len(array))
+            offset += array.nbytes
+        self.block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self._finalizer = weakref.finalize(self, _release, self.block, os.getpid())
+        for col, array in arrays.items():
+            np.ndarray(len(array), dtype=array.dtype, buffer=self.block.buf, offset=layout[col][0])[:] = array
+        self.spec = {"name": self.block.name, "columns": layout, "levels": self.levels,
+                     "dimensions": dimensions}
+        executor = pool()
+        try:
+            for _ in range(PARALLEL_WORKERS):
+                executor.submit(_attach, self.block.name)  # start the workers and map the block ahead of use
+        except BrokenProcessPool:
+            _discard(executor)
+
+    def view(self, bitmap):
+        # Ranges start on a byte boundary so each worker gets whole bytes of the bitmap.
+        # Raises BrokenProcessPool when a worker died; the next call gets a new pool.
+        step = (-(-self.rows // PARALLEL_WORKERS) + 7) // 8 * 8
+        executor = pool()
+        try:
+            futures = [executor.submit(_range_view, self.spec, start, min(start + step, self.rows),
+                                       bitmap[start // 8:(min(start + step, self.rows) + 7) // 8].tobytes())
+                       for start in range(0, self.rows, step)]
+            parts = [future.result() for future in futures]
+        except BrokenProcessPool:
+            _discard(executor)
+            raise
+        hist = {dim: sum(part[0][dim] for part in parts) for dim in self.dimensions}
+        measure_sums = {m: sum(part[1][m] for part in parts) for m in parts[0][1]}
+        sums = sum(part[2] for part in parts)
+        # Match build_cube over the selected rows: only schools and levels that occur.
+        present_schools = sums[:, 0] > 0
+        schools = [s for s, keep in zip(self.levels["school"], present_schools) if keep]
+        levels = {}
+        for dim in self.dimensions:
+            table = hist[dim][present_schools]
+            present = table.sum(axis=(0, 2)) > 0
+            hist[dim] = table[:, present]
+            levels[dim] = [level for level, keep in zip(self.levels[dim], present) if keep]
+        measure_sums = {m: v[present_schools] for m, v in measure_sums.items()}
+        return GradeCube(schools, levels, hist, measure_sums), dict(zip(schools, sums[present_schools]))
+
+
+def _release(block, owner):
+    block.close()
+    if os.getpid() == owner:
+        block.unlink()
@@ -0,0 +1,100 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from inspect import unwrap
+
+from dash import dcc, page_registry
+
+from cache import shared_cache
+from dataset import manager
+
+PRECOMPUTE_ON_STARTUP = os.environ.get("PRECOMPUTE_ON_STARTUP", "auto")
+PRECOMPUTE_LEASE = int(os.environ.get("PRECOMPUTE_LEASE", 1800))
+
+logger = logging.getLogger(__name__)
+
+
+def page_layouts(pages=None):
+    return [page["layout"]() if callable(page["layout"]) else page["layout"]
+            for page in (page_registry.values() if pages is None else pages)]
+
+
+def dropdown_options(layouts):
+    # Keyed by (id, property). Filter stores and sliders are precomputed at their initial value
+    # only: unfiltered, and the full term range for the trend.
+    options = {}
+    for layout in layouts:
+        for component in layout._traverse():
+            if not isinstance(getattr(component, "id", None), str):
+                continue
+            if isinstance(component, dcc.Dropdown):
+                options[(component.id, "value")] = [o["value"] if isinstance(o, dict) else o
+                                                    for o in component.options]
+            elif isinstance(component, (dcc.Slider, dcc.RangeSlider)):
+                options[(component.id, "value")] = [getattr(component, "value", None)]
+            elif isinstance(component, dcc.Store):
+                options[(component.id, "data")] = [getattr(component, "data", None)]
+    return options
+
+
+def server_callbacks(app):
+    # dash.callback registrations reach app.callback_map when Dash sets up for its first request.
+    return list(app.callback_map.values())
+
+
+def precompute(callbacks):
+    start = time.perf_counter()
+    with manager.pinned() as snapshot:
+        options = dropdown_options(page_layouts())
+        calls = 0
+        for entry in callbacks:
+            inputs = entry["inputs"]
+            keys = [(i["id"], i["property"]) for i in inputs]
+            if not keys or any(key not in options for key in keys):
+                continue
+            func = unwrap(entry["callback"])
+            for values in itertools.product(*(options[key] for key in keys)):
+                func(*values)
+                calls += 1
+    if shared_cache is not None and snapshot.content_key is not None:
+        shared_cache.set(("precomputed", snapshot.content_key), calls)
+    logger.info("precomputed %d callback inputs for version %s in %.1fs",
+                calls, snapshot.version, time.perf_counter() - start)
+    return calls
+
+
+def _run(callbacks, claim=None):
+    try:
+        precompute(callbacks)
+    except Exception:
+        logger.exception("precompute failed")
+    finally:
+        if claim is not None:
+            shared_cache.release(claim)
+
+
+def start_precompute(app):
+    if PRECOMPUTE_ON_STARTUP == "off" or (PRECOMPUTE_ON_STARTUP == "auto" and shared_cache is None):
+        return None
+    snapshot = manager.current()
+    claim = None
+    if shared_cache is not None:
+        # One worker per data version: the claim is a lease, so a worker killed mid-run only
+        # holds the others off until it runs out. Later workers see the finished marker.
+        claim = ("precompute", snapshot.content_key)
+        if snapshot.content_key is None or shared_cache.get(("precomputed", snapshot.content_key)) is not None \
+                or not shared_cache.claim(claim, PRECOMPUTE_LEASE):
+            return None
+    thread = threading.Thread(target=_run, args=(server_callbacks(app), claim), name="precompute", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    os.environ["PRECOMPUTE_ON_STARTUP"] = "off"  # the app's own run on its first request would repeat this one
+    from app import app
+    app.server.test_client().get("/_dash-dependencies")
+    precompute(server_callbacks(app))
@@ -0,0 +1,104 @@
+import gzip
+import os
+import threading
+
+import plotly.io.json
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_RESPONSES = os.environ.get("COMPRESS_RESPONSES", "on")
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+JSON_ENGINE = os.environ.get("JSON_ENGINE", "auto")
+ASSET_MAX_AGE = int(os.environ.get("ASSET_MAX_AGE", 31536000))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "image/svg+xml")
+STATIC_PREFIXES = ("/assets/", "/_dash-component-suites/")
+
+# Static files only change with a deploy, so each is compressed once, at the highest level.
+_static_bodies = {}
+_static_lock = threading.Lock()
+
+
+def compressible(response):
+    return response.mimetype.startswith("text/") or response.mimetype in COMPRESSIBLE_TYPES
+
+
+def negotiate():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, static=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else 4)
+    return gzip.compress(data, compresslevel=9 if static else COMPRESS_LEVEL, mtime=0)
+
+
+def static_body(response, encoding):
+    key = (request.full_path, response.get_etag()[0], encoding)
+    with _static_lock:
+        body = _static_bodies.get(key)
+    if body is None:
+        response.direct_passthrough = False
+        body = compress(response.get_data(), encoding, static=True)
+        with _static_lock:
+            _static_bodies[key] = body
+    return body
+
+
+def cache_headers(response):
+    # Dash links assets as /assets/style.css?m=<mtime> and bundles with a version fingerprint
+    # in the path, so those URLs never change content and can be cached for good. Anything
+    # else is revalidated against the ETag Flask or Dash already set.
+    if request.path.startswith("/assets/") and "m" in request.args \
+            or request.path.startswith("/_dash-component-suites/") and response.cache_control.max_age:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+
+
+def _after_request(response):
+    static = request.path.startswith(STATIC_PREFIXES)
+    if static:
+        cache_headers(response)
+    if COMPRESS_RESPONSES != "on" or response.status_code != 200 or not compressible(response) \
+            or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    # Callback responses are built per request; file downloads other than assets stream as is.
+    if response.is_streamed and not static:
+        return response
+    encoding = negotiate()
+    if encoding is None or (response.content_length or COMPRESS_MIN_BYTES) < COMPRESS_MIN_BYTES:
+        return response
+    if static:
+        body = static_body(response, encoding)
+        response.close()
+    else:
+        body = compress(response.get_data(), encoding)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.headers.pop("Accept-Ranges", None)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The compressed body is a different representation; a weak tag still revalidates.
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_responses(server):
+    # Dash serializes callback outputs with plotly.io.json, which honours the default engine.
+    plotly.io.json.config.default_engine = JSON_ENGINE
+    server.after_request(_after_request)
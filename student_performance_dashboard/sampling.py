@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, CUBE_MEASURES, GradeCube, grade_histogram, grade_units
+from metrics_engine import METRIC_COLUMNS, encode_columns, metric_sums
+
+APPROX_QUERIES = os.environ.get("APPROX_QUERIES", "off")
+APPROX_SAMPLE_SIZE = int(os.environ.get("APPROX_SAMPLE_SIZE", 2000))
+APPROX_MIN_ROWS = int(os.environ.get("APPROX_MIN_ROWS", 100_000))
+
+Z_95 = 1.96
+# (metric, column in encode_columns values, scale) for the KPIs shown with a margin of error.
+MARGIN_METRICS = [("avg_grade", 1, 1), ("avg_absences", 2, 1), ("avg_health", 3, 1),
+                  ("avg_freetime", 4, 1), ("activities_pct", 5, 100)]
+
+
+def _stratum_totals(strata, values, population, sampled):
+    # Estimated total per stratum and its variance under simple random sampling within the stratum.
+    s1 = np.bincount(strata, weights=values, minlength=len(population))
+    s2 = np.bincount(strata, weights=values ** 2, minlength=len(population))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = np.nan_to_num((s2 - s1 ** 2 / sampled) / (sampled - 1))
+        variance = np.nan_to_num(population ** 2 * (1 - sampled / population) * var / sampled)
+        total = np.nan_to_num(population / sampled * s1)
+    return total, variance
+
+
+def _bottom_k(keys, strata, n_strata, size):
+    # Rows holding the `size` smallest keys of their stratum. Keys are uniform, so those rows sit
+    # below roughly size / population; only rows under a looser bound are sorted, and a stratum
+    # that comes up short falls back to all of its rows.
+    population = np.bincount(strata, minlength=n_strata)
+    with np.errstate(divide="ignore"):
+        bound = np.minimum(1.5 * size / population, 1.0)
+    candidate = keys < bound[strata]
+    short = np.bincount(strata[candidate], minlength=n_strata) < np.minimum(population, size)
+    if short.any():
+        candidate |= short[strata]
+    rows = np.flatnonzero(candidate)
+    rows = rows[np.lexsort((keys[rows], strata[rows]))]
+    grouped = strata[rows]
+    counts = np.bincount(grouped, minlength=n_strata)
+    ranks = np.arange(len(rows)) - (np.cumsum(counts) - counts)[grouped]
+    member = np.zeros(len(keys), dtype=bool)
+    member[rows[ranks < size]] = True
+    return member
+
+
+class StratifiedSample:
+    def __init__(self, frame, size=APPROX_SAMPLE_SIZE, dimensions=CUBE_DIMENSIONS, seed=0):
+        # Every row gets a random key and each school x level stratum keeps its `size` smallest
+        # keys: the bottom-k form of a per-stratum reservoir. Sharing the keys across dimensions
+        # keeps the union of the per-dimension samples small.
+        keys = np.random.default_rng(seed).random(len(frame))
+        school_codes, schools = pd.factorize(frame["school"], sort=True)
+        self.schools = schools.tolist()
+        self.levels, self.population, self.sampled = {}, {}, {}
+        strata, members = {}, {}
+        for dim in dimensions:
+            codes, uniques = pd.factorize(frame[dim], sort=True)
+            self.levels[dim] = uniques.tolist()
+            if dim == "school":
+                strata[dim], n_strata = school_codes, len(self.schools)
+            else:
+                strata[dim], n_strata = school_codes * len(uniques) + codes, len(self.schools) * len(uniques)
+            members[dim] = _bottom_k(keys, strata[dim], n_strata, size)
+            self.population[dim] = np.bincount(strata[dim], minlength=n_strata)
+            self.sampled[dim] = np.minimum(self.population[dim], size)
+        self.positions = np.flatnonzero(np.logical_or.reduce(list(members.values())))
+        self.rows = frame[list(dict.fromkeys(dimensions + CUBE_MEASURES + METRIC_COLUMNS))].take(self.positions)
+        self.units = grade_units(self.rows)
+        self.strata, self.weights = {}, {}
+        for dim in dimensions:
+            stratum = strata[dim][self.positions]
+            member = members[dim][self.positions]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weight = self.population[dim] / self.sampled[dim]
+            self.strata[dim] = stratum
+            self.weights[dim] = np.where(member, weight[stratum], 0.0)
+        self.school_codes, _, self.values = encode_columns(self.rows)
+
+    def selected(self, bitmap):
+        shifts = (7 - (self.positions & 7)).astype(np.uint8)
+        return ((bitmap[self.positions >> 3] >> shifts) & 1).astype(bool)
+
+    def view(self, bitmap):
+        selected = self.selected(bitmap)
+        n_schools = len(self.schools)
+        levels, hist = {}, {}
+        for dim in self.levels:
+            n_levels = len(self.levels[dim])
+            weights = np.where(selected, self.weights[dim], 0.0)
+            table = np.rint(grade_histogram(self.school_codes, n_schools, self.strata[dim] % n_levels,
+                                            n_levels, self.units, weights)).astype(np.int64)
+            present = table.sum(axis=(0, 2)) > 0
+            hist[dim] = table[:, present]
+            levels[dim] = [level for level, keep in zip(self.levels[dim], present) if keep]
+        weights = np.where(selected, self.weights["school"], 0.0)
+        measure_sums = {m: np.bincount(self.school_codes, weights=self.rows[m].to_numpy(np.float64) * weights,
+                                       minlength=n_schools)
+                        for m in CUBE_MEASURES}
+        sums = metric_sums(self.school_codes, n_schools, self.values * weights[:, None])
+        cube = GradeCube(self.schools, levels, hist, measure_sums)
+        return cube, dict(zip(self.schools, sums)), self.margins(selected)
+
+    def margins(self, selected):
+        member = self.weights["school"] > 0
+        strata = self.strata["school"][member]
+        inside = selected[member].astype(np.float64)
+        values = self.values[member]
+        population, sampled = self.population["school"], self.sampled["school"]
+        count, count_var = _stratum_totals(strata, inside, population, sampled)
+        groups = {"All": slice(None), **{school: [i] for i, school in enumerate(self.schools)}}
+        margins = {}
+        for key, group in groups.items():
+            total = count[group].sum()
+            if total == 0:
+                continue
+            margins[key] = {"total": Z_95 * np.sqrt(count_var[group].sum())}
+            for metric, column, scale in MARGIN_METRICS:
+                ratio = _stratum_totals(strata, inside * values[:, column], population, sampled)[0][group].sum() / total
+                residual = inside * (values[:, column] - ratio)
+                variance = _stratum_totals(strata, residual, population, sampled)[1][group].sum()
+                margins[key][metric] = Z_95 * np.sqrt(variance) / total * scale
+        return margins
@@ -0,0 +1,53 @@
+SCHEMA_COLUMNS = ["school", "sex", "age", "address", "famsize", "Pstatus", "Medu",
+                  "Fedu", "Mjob", "Fjob", "reason", "guardian", "traveltime",
+                  "studytime", "failures", "schoolsup", "famsup", "paid",
+                  "activities", "nursery", "higher", "internet", "romantic",
+                  "famrel", "freetime", "goout", "Dalc", "Walc", "health",
+                  "absences", "G1", "G2", "G3"]
+CATEGORICAL_COLUMNS = ["school", "sex", "address", "famsize", "Pstatus",
+                       "Mjob", "Fjob", "reason", "guardian"]
+BOOL_COLUMNS = ["schoolsup", "famsup", "paid", "activities", "nursery",
+                "higher", "internet", "romantic"]
+INT8_COLUMNS = ["age", "Medu", "Fedu", "traveltime", "studytime", "failures",
+                "famrel", "freetime", "goout", "Dalc", "Walc", "health",
+                "G1", "G2", "G3"]
+INT16_COLUMNS = ["absences"]
+GRADE_COLUMNS = ["G1", "G2", "G3"]
+
+COLUMN_DTYPES = {
+    **{col: "category" for col in CATEGORICAL_COLUMNS},
+    **{col: "bool" for col in BOOL_COLUMNS},
+    **{col: "int8" for col in INT8_COLUMNS},
+    **{col: "int16" for col in INT16_COLUMNS},
+}
+READ_OPTIONS = {"dtype": COLUMN_DTYPES, "true_values": ["yes"], "false_values": ["no"]}
+
+
+def validate_columns(columns, path):
+    missing = [col for col in SCHEMA_COLUMNS if col not in columns]
+    unexpected = [col for col in columns if col not in SCHEMA_COLUMNS]
+    if missing or unexpected:
+        raise ValueError(f"{path} does not match the student schema "
+                         f"(missing: {missing or '-'}, unexpected: {unexpected or '-'})")
+
+
+def add_final_grade(df):
+    df["final_grade"] = (df[GRADE_COLUMNS].astype("int16").sum(axis=1) / 3).astype("float32")
+    return df
+
+
+def coerce_records(df):
+    validate_columns([col for col in df.columns if col != "student_id"], "records")
+    df = df.copy()
+    for col in BOOL_COLUMNS:
+        values = df[col].map({"yes": True, "no": False, True: True, False: False})
+        if values.isna().any():
+            raise ValueError(f"{col} must be 'yes' or 'no'")
+        df[col] = values.astype("bool")
+    for col in GRADE_COLUMNS:
+        if not df[col].between(0, 20).all():
+            raise ValueError(f"{col} must lie between 0 and 20")
+    for col, dtype in COLUMN_DTYPES.items():
+        if col not in BOOL_COLUMNS:
+            df[col] = df[col].astype(dtype)
+    return add_final_grade(df)
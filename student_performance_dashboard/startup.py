@@ -0,0 +1,64 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LAZY_STARTUP = os.environ.get("LAZY_STARTUP", "off")
+STARTUP_REPORT_MODULES = 25
+
+STARTUP_STEPS = []
+_steps_lock = threading.Lock()
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+@contextmanager
+def startup_step(name):
+    # Wall time and newly imported modules of one step of bringing the app up.
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _steps_lock:
+            STARTUP_STEPS.append((name, time.perf_counter() - start, len(sys.modules) - modules))
+
+
+def import_costs(stderr):
+    # Parses `python -X importtime` output into (module, self seconds, cumulative seconds)
+    # for the modules imported directly by the top-level script.
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and len(match.group(3)) <= 3:
+            rows.append((match.group(4), int(match.group(1)) / 1e6, int(match.group(2)) / 1e6))
+    return rows
+
+
+def startup_report(lazy=None):
+    # Boots the app in a fresh interpreter, so nothing is imported or cached yet.
+    env = dict(os.environ)
+    if lazy is not None:
+        env["LAZY_STARTUP"] = lazy
+    code = "import json, startup, time; t = time.perf_counter(); import app; " \
+           "print(json.dumps({'import app': time.perf_counter() - t, 'steps': startup.STARTUP_STEPS}))"
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=os.path.dirname(__file__),
+                            env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    lines = [f"LAZY_STARTUP={env.get('LAZY_STARTUP', 'off')}: process {wall:.2f}s, "
+             f"import app {timings['import app']:.2f}s", "", f"{'step':<30} {'seconds':>8} {'modules':>8}"]
+    lines += [f"{name:<30} {seconds:>8.3f} {modules:>8}" for name, seconds, modules in timings["steps"]]
+    costs = sorted(import_costs(result.stderr), key=lambda row: row[2], reverse=True)
+    lines += ["", f"{'module':<40} {'self':>8} {'total':>8}"]
+    lines += [f"{name:<40} {own:>8.3f} {total:>8.3f}" for name, own, total in costs[:STARTUP_REPORT_MODULES]]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    modes = sys.argv[1:] or [None]
+    print("\n\n".join(startup_report(mode) for mode in modes))
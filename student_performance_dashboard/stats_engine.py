@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from cube import GRADE_GRID
+from schema import INT8_COLUMNS, INT16_COLUMNS
+
+CORRELATION_COLUMNS = INT8_COLUMNS + INT16_COLUMNS + ["final_grade"]
+MOMENT_CHUNK_ROWS = 100_000
+
+try:
+    from scipy.special import chdtrc, fdtrc
+except ImportError:
+    chdtrc = fdtrc = None
+
+
+def _with_all(table):
+    # Row 0 pools every school; the others follow cube.schools.
+    return np.concatenate([table.sum(axis=0, keepdims=True), table])
+
+
+def _betacf(a, b, x):
+    # Continued fraction of the incomplete beta function (modified Lentz).
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+    h = d
+    for m in range(1, 300):
+        for num in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                    -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + num * d
+            d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+            c = 1.0 + num / c
+            c = c if abs(c) > 1e-300 else 1e-300
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-14:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    if x <= 0 or x >= 1:
+        return float(x >= 1)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1 - x) / b
+
+
+def _gammaincc(a, x):
+    if x <= 0:
+        return 1.0
+    front = math.exp(-x + a * math.log(x) - math.lgamma(a))
+    if x < a + 1:
+        term = total = 1.0 / a
+        for n in range(1, 1000):
+            term *= x / (a + n)
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return 1.0 - front * total
+    b, c, d = x + 1 - a, 1e300, 1.0 / (x + 1 - a)
+    h = d
+    for n in range(1, 1000):
+        an = -n * (n - a)
+        b += 2
+        d = an * d + b
+        d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+        c = b + an / c
+        c = c if abs(c) > 1e-300 else 1e-300
+        h *= d * c
+        if abs(d * c - 1.0) < 1e-15:
+            break
+    return front * h
+
+
+def f_pvalue(f, dfn, dfd):
+    if fdtrc is not None:
+        return fdtrc(dfn, dfd, f)
+    return np.array([_betainc(d2 / 2, d1 / 2, d2 / (d2 + d1 * v)) if np.isfinite(v) and d1 > 0 and d2 > 0
+                     else np.nan for v, d1, d2 in zip(f, dfn, dfd)])
+
+
+def chi2_pvalue(x, df):
+    if chdtrc is not None:
+        return chdtrc(df, x)
+    return np.array([_gammaincc(k / 2, v / 2) if np.isfinite(v) and k > 0 else np.nan
+                     for v, k in zip(x, df)])
+
+
+def group_tests(hist, grid=GRADE_GRID):
+    # One-way ANOVA and Kruskal-Wallis of the final grade across the levels of a factor, for
+    # every school at once. hist is schools x levels x grade bins. The grade takes only
+    # len(grid) values, so midranks with ties come straight from the pooled histogram.
+    hist = hist.astype(np.float64)
+    n = hist.sum(axis=2)
+    present = n > 0
+    total = n.sum(axis=1)
+    groups = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (hist @ grid) / n
+        grand = (hist @ grid).sum(axis=1) / total
+        between = (np.where(present, n * (means - grand[:, None]) ** 2, 0)).sum(axis=1)
+        within = (hist * (grid - np.where(present, means, 0)[:, :, None]) ** 2).sum(axis=(1, 2))
+        f = (between / (groups - 1)) / (within / (total - groups))
+        eta2 = between / (between + within)
+
+        pooled = hist.sum(axis=1)
+        midranks = pooled.cumsum(axis=1) - (pooled - 1) / 2
+        rank_sums = (hist * midranks[:, None, :]).sum(axis=2)
+        h = 12 / (total * (total + 1)) * np.where(present, rank_sums ** 2 / n, 0).sum(axis=1) - 3 * (total + 1)
+        h /= 1 - (pooled ** 3 - pooled).sum(axis=1) / (total ** 3 - total)
+        epsilon2 = h / (total - 1)
+    f = np.where(groups > 1, f, np.nan)
+    h = np.where(groups > 1, h, np.nan)
+    return {
+        "n": n, "means": means, "total": total, "groups": groups,
+        "f": f, "f_p": f_pvalue(f, groups - 1, total - groups), "eta2": eta2,
+        "h": h, "h_p": chi2_pvalue(h, groups - 1), "epsilon2": epsilon2,
+    }
+
+
+def factor_tests(cube, factors):
+    return {"schools": cube.schools,
+            "factors": {factor: {"levels": cube.levels[factor], **group_tests(_with_all(cube.hist[factor]))}
+                        for factor in factors if factor in cube.hist}}
+
+
+def moment_sums(frame, schools, columns=CORRELATION_COLUMNS):
+    # Per-school count, column sums and cross products: enough for every pairwise correlation.
+    codes = pd.Categorical(frame["school"], categories=schools).codes
+    values = frame[columns]
+    counts = np.bincount(codes[codes >= 0], minlength=len(schools)).astype(np.float64)
+    sums = np.zeros((len(schools), len(columns)))
+    cross = np.zeros((len(schools), len(columns), len(columns)))
+    for start in range(0, len(frame), MOMENT_CHUNK_ROWS):
+        chunk = values.iloc[start:start + MOMENT_CHUNK_ROWS].to_numpy(dtype=np.float64)
+        chunk_codes = codes[start:start + MOMENT_CHUNK_ROWS]
+        for i in range(len(schools)):
+            rows = chunk[chunk_codes == i]
+            sums[i] += rows.sum(axis=0)
+            cross[i] += rows.T @ rows
+    return {"schools": list(schools), "columns": list(columns),
+            "counts": _with_all(counts), "sums": _with_all(sums), "cross": _with_all(cross)}
+
+
+def correlation_matrix(moments, row):
+    count, sums, cross = moments["counts"][row], moments["sums"][row], moments["cross"][row]
+    if count < 2:
+        return np.full(cross.shape, np.nan)
+    mean = sums / count
+    cov = cross / count - np.outer(mean, mean)
+    std = np.sqrt(np.clip(np.diag(cov), 0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cov / np.outer(std, std)
+    corr[np.outer(std, std) < 1e-12] = np.nan
+    return np.clip(corr, -1, 1)
+
+
+def school_row(schools, school):
+    # Position of a school in the tables above, or None when the view has no such school.
+    return 0 if school == "All" else schools.index(school) + 1 if school in schools else None
+
+
+def cube_correlations(cube, school, dims):
+    # Without rows in memory, the cube still gives each numeric factor's correlation with
+    # final_grade: level values weighted by their grade histograms.
+    row = school_row(cube.schools, school)
+    result = {}
+    for dim in dims:
+        if row is None:
+            result[dim] = np.nan
+            continue
+        hist = _with_all(cube.hist[dim])[row].astype(np.float64)
+        x = np.asarray(cube.levels[dim], dtype=np.float64)
+        n = hist.sum(axis=1)
+        total = n.sum()
+        if total < 2:
+            result[dim] = np.nan
+            continue
+        mean_x, mean_g = n @ x / total, (hist @ GRADE_GRID).sum() / total
+        cov = x @ (hist @ GRADE_GRID) / total - mean_x * mean_g
+        var_x = n @ x ** 2 / total - mean_x ** 2
+        var_g = (hist @ GRADE_GRID ** 2).sum() / total - mean_g ** 2
+        result[dim] = cov / math.sqrt(var_x * var_g) if var_x > 1e-12 and var_g > 1e-12 else np.nan
+    return result
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from cube import GRADE_GRID
+
+KDE_GRID = np.linspace(0, 20, 81)
+STRIP_MAX_POINTS = int(os.environ.get("STRIP_MAX_POINTS", 2000))
+STRIP_FALLBACK = os.environ.get("STRIP_FALLBACK", "sample")
+
+
+def _value_at(cumulative, rank, grid):
+    return grid[np.searchsorted(cumulative, rank, side="right")]
+
+
+def weighted_quantile(hist, q, grid=GRADE_GRID):
+    cumulative = np.cumsum(hist)
+    pos = q * (cumulative[-1] - 1)
+    lo, hi = np.floor(pos), np.ceil(pos)
+    v_lo = _value_at(cumulative, lo, grid)
+    v_hi = _value_at(cumulative, hi, grid)
+    return float(v_lo + (v_hi - v_lo) * (pos - lo))
+
+
+def box_summary(hist, grid=GRADE_GRID):
+    n = int(hist.sum())
+    if n == 0:
+        return None
+    q1, median, q3 = (weighted_quantile(hist, q, grid) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    present = grid[hist > 0]
+    inside = present[(present >= q1 - 1.5 * iqr) & (present <= q3 + 1.5 * iqr)]
+    outliers = (present < inside.min()) | (present > inside.max())
+    return {
+        "count": n,
+        "mean": float(hist @ grid / n),
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lowerfence": float(inside.min()),
+        "upperfence": float(inside.max()),
+        "outliers": present[outliers].tolist(),
+        "outlier_counts": hist[hist > 0][outliers].tolist(),
+    }
+
+
+def kde_summary(hist, grid=GRADE_GRID, points=KDE_GRID):
+    n = hist.sum()
+    if n == 0:
+        return np.zeros_like(points)
+    mean = hist @ grid / n
+    std = np.sqrt(hist @ (grid - mean) ** 2 / n)
+    bandwidth = 1.06 * std * n ** -0.2 if std > 0 else 0.5
+    z = (points[:, None] - grid[None, :]) / bandwidth
+    density = np.exp(-0.5 * z ** 2) @ hist / (n * bandwidth * np.sqrt(2 * np.pi))
+    present = grid[hist > 0]
+    span = (points >= present.min() - 2 * bandwidth) & (points <= present.max() + 2 * bandwidth)
+    return np.where(span, density, 0.0)
+
+
+def strip_sample(hists, max_points=STRIP_MAX_POINTS, seed=0):
+    totals = np.array([h.sum() for h in hists])
+    if totals.sum() <= max_points:
+        return [np.repeat(GRADE_GRID, h) for h in hists]
+    rng = np.random.default_rng(seed)
+    quotas = np.floor(totals / totals.sum() * max_points).astype(np.int64)
+    quotas = np.maximum(quotas, np.minimum(totals, 1))
+    return [np.repeat(GRADE_GRID, rng.multivariate_hypergeometric(h, k)) for h, k in zip(hists, quotas)]
+
+
+def strip_density(hist, grid=GRADE_GRID):
+    present = hist > 0
+    return grid[present], hist[present]
@@ -0,0 +1,160 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+from datastore import BASE_DIR
+from schema import GRADE_COLUMNS
+
+TERMS_PATH = os.environ.get("STUDENT_TERMS_PATH", os.path.join(BASE_DIR, "data", "student_terms.csv"))
+TREND_MAX_POINTS = int(os.environ.get("TREND_MAX_POINTS", 500))
+
+ALL_STUDENTS = "All students"
+TREND_GROUPINGS = ["All", "school", "sex", "address", "famsize", "schoolsup", "famsup",
+                   "internet", "higher", "studytime"]
+
+
+def load_history(path=TERMS_PATH):
+    # Earlier terms in long form: one row per student_id, term and grade (0-20). Term labels
+    # must sort chronologically, e.g. 2023-1, 2023-2; the current G1-G3 follow the last one.
+    if not os.path.exists(path):
+        return None
+    history = pd.read_csv(path, usecols=["student_id", "term", "grade"],
+                          dtype={"student_id": "int64", "term": "str", "grade": "int8"})
+    if not history["grade"].between(0, 20).all():
+        raise ValueError(f"{path}: grades must lie between 0 and 20")
+    return history
+
+
+def _patched(codes, rows, positions, values):
+    patched = np.zeros(rows, dtype=codes.dtype)
+    patched[:len(codes)] = codes
+    patched[positions] = values
+    return patched
+
+
+class TermSeries:
+    def __init__(self, frame, history=None, groupings=TREND_GROUPINGS):
+        # Student x term grades in a long layout: three parallel arrays with one entry per
+        # grade, so any number of terms costs the same per entry as G1-G3.
+        rows = len(frame)
+        self.history = history
+        earlier = [] if history is None else sorted(set(history["term"]) - set(GRADE_COLUMNS))
+        self.terms = earlier + GRADE_COLUMNS
+        students = [np.tile(np.arange(rows, dtype=np.int32), len(GRADE_COLUMNS))]
+        term_codes = [np.repeat(np.arange(len(earlier), len(self.terms), dtype=np.int16), rows)]
+        grades = [frame[GRADE_COLUMNS].to_numpy(dtype=np.int8).T.ravel()]
+        if history is not None:
+            history = history[(history["student_id"] >= 0) & (history["student_id"] < rows)]
+            students.insert(0, history["student_id"].to_numpy(dtype=np.int32))
+            term_codes.insert(0, pd.Index(self.terms).get_indexer(history["term"]).astype(np.int16))
+            grades.insert(0, history["grade"].to_numpy(dtype=np.int8))
+        self.students = np.concatenate(students)
+        self.term_codes = np.concatenate(term_codes)
+        self.grades = np.concatenate(grades)
+
+        school_codes, schools = pd.factorize(frame["school"], sort=True)
+        self.schools = schools.tolist()
+        self.school_codes = school_codes.astype(np.int16)
+        self.codes, self.levels = {}, {}
+        for grouping in groupings:
+            if grouping == "All":
+                self.codes[grouping], self.levels[grouping] = np.zeros(rows, dtype=np.int16), [ALL_STUDENTS]
+            else:
+                codes, uniques = pd.factorize(frame[grouping], sort=True)
+                self.codes[grouping], self.levels[grouping] = codes.astype(np.int16), uniques.tolist()
+        # Per-cohort running totals along the term axis, so a rolling mean over any window
+        # and term range is a difference of two columns.
+        self.cumulative = {grouping: self.cumulative_totals(grouping) for grouping in groupings}
+
+    def cumulative_totals(self, grouping, selected=None):
+        return self.entry_totals(grouping, slice(None) if selected is None else selected[self.students])
+
+    def entry_totals(self, grouping, entries):
+        students = self.students[entries]
+        n_levels, n_terms = len(self.levels[grouping]), len(self.terms)
+        flat = (self.school_codes[students].astype(np.int64) * n_levels + self.codes[grouping][students]) \
+            * n_terms + self.term_codes[entries]
+        shape = (len(self.schools), n_levels, n_terms)
+        size = shape[0] * n_levels * n_terms
+        counts = np.bincount(flat, minlength=size).reshape(shape)
+        sums = np.bincount(flat, weights=self.grades[entries], minlength=size).reshape(shape)
+        pad = ((0, 0), (0, 0), (1, 0))
+        return np.pad(counts.cumsum(axis=2), pad), np.pad(sums.cumsum(axis=2), pad)
+
+    def entries(self, positions):
+        # Every grade entry of the students at `positions`: earlier terms, then G1-G3.
+        rows = len(self.school_codes)
+        earlier = len(self.students) - len(GRADE_COLUMNS) * rows
+        current = earlier + (np.arange(len(GRADE_COLUMNS))[:, None] * rows + positions).ravel()
+        return np.concatenate([np.flatnonzero(np.isin(self.students[:earlier], positions)), current])
+
+    def updated(self, frame, positions):
+        # The series of `frame`, which differs from this one's frame only at `positions`
+        # (appended rows included): the running totals lose the changed students' old entries
+        # and gain their new ones. A new or vanished cohort level rebuilds from scratch.
+        rows, old_rows = len(frame), len(self.school_codes)
+        changed = frame.take(positions)
+        school_codes = pd.Index(self.schools).get_indexer(changed["school"])
+        codes = {grouping: pd.Index(self.levels[grouping]).get_indexer(changed[grouping])
+                 for grouping in self.codes if grouping != "All"}
+        appended_history = self.history is not None and self.history["student_id"].between(old_rows, rows - 1).any()
+        if appended_history or (school_codes < 0).any() or any((c < 0).any() for c in codes.values()):
+            return TermSeries(frame, self.history, list(self.codes))
+        series = copy.copy(self)
+        series.school_codes = _patched(self.school_codes, rows, positions, school_codes)
+        series.codes = {grouping: _patched(self.codes[grouping], rows, positions, codes.get(grouping, 0))
+                        for grouping in self.codes}
+        earlier = len(self.students) - len(GRADE_COLUMNS) * old_rows
+        series.students = np.concatenate([self.students[:earlier],
+                                          np.tile(np.arange(rows, dtype=np.int32), len(GRADE_COLUMNS))])
+        series.term_codes = np.concatenate([self.term_codes[:earlier], np.repeat(
+            np.arange(len(self.terms) - len(GRADE_COLUMNS), len(self.terms), dtype=np.int16), rows)])
+        series.grades = np.concatenate([self.grades[:earlier], frame[GRADE_COLUMNS].to_numpy(dtype=np.int8).T.ravel()])
+        before, after = self.entries(positions[positions < old_rows]), series.entries(positions)
+        series.cumulative = {}
+        for grouping, (counts, sums) in self.cumulative.items():
+            old_counts, old_sums = self.entry_totals(grouping, before)
+            new_counts, new_sums = series.entry_totals(grouping, after)
+            counts = counts - old_counts + new_counts
+            if (counts[:, :, -1].sum(axis=1) == 0).any() or (counts[:, :, -1].sum(axis=0) == 0).any():
+                return TermSeries(frame, self.history, list(self.codes))
+            series.cumulative[grouping] = counts, sums - old_sums + new_sums
+        return series
+
+    def means(self, school, grouping, first, last, window=1, selected=None):
+        counts, sums = self.cumulative[grouping] if selected is None else \
+            self.cumulative_totals(grouping, selected)
+        if school == "All":
+            counts, sums = counts.sum(axis=0), sums.sum(axis=0)
+        elif school in self.schools:
+            counts, sums = counts[self.schools.index(school)], sums[self.schools.index(school)]
+        else:
+            counts, sums = np.zeros(counts.shape[1:]), np.zeros(sums.shape[1:])
+        stop = np.arange(first, last + 1) + 1
+        start = np.maximum(stop - window, 0)
+        n = counts[:, stop] - counts[:, start]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (sums[:, stop] - sums[:, start]) / n
+        present = n.sum(axis=1) > 0
+        return [level for level, keep in zip(self.levels[grouping], present) if keep], means[present]
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from each bucket in
+    # between, the point spanning the largest triangle with the previous pick and the next
+    # bucket's mean, so peaks and dips survive the downsampling.
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.append(np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64), n)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    for i in range(threshold - 2):
+        start, stop, after = edges[i], edges[i + 1], edges[i + 2]
+        mean_x, mean_y = x[stop:after].mean(), y[stop:after].mean()
+        a = keep[i]
+        area = np.abs((x[a] - mean_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y - y[a]))
+        keep[i + 1] = start + int(np.argmax(area))
+    return keep
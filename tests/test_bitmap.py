@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from bitmap import BitmapIndex, SortIndex
+from datastore import load_frame
+
+
+@pytest.fixture(scope="module")
+def index():
+    return BitmapIndex(load_frame())
+
+
+@pytest.mark.parametrize("filters", [
+    None, ["sex"], {"nope": ["x"]}, {"sex": "F"}, {"sex": None}, {"age": {"between": ["a", "b"]}},
+    {"age": {"between": [15]}}, {"age": {"between": [True, 17]}}, {"sex": {"between": [0, 1]}},
+])
+def test_malformed_filters_are_dropped(index, filters):
+    assert index.normalize(filters) == {}
+    assert index.count(index.select(filters)) == index.rows
+
+
+def test_valid_filters_survive_next_to_malformed_ones(index):
+    filters = {"age": {"between": [15, 16]}, "sex": ["F", "X"], "nope": ["x"], "Mjob": {"between": [1, 2]}}
+    assert index.normalize(filters) == {"age": [15, 16], "sex": ["F"]}
+    frame = index.frame
+    assert index.count(index.select(filters)) == int(((frame["sex"] == "F") & frame["age"].between(15, 16)).sum())
+
+
+@pytest.mark.parametrize("col", ["school", "age", "final_grade", "internet"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_small_and_large_selections_sort_alike(col, descending):
+    frame = load_frame()
+    sort_index = SortIndex(frame)
+    rows = np.random.default_rng(1).random(len(frame))
+    for share in (0.01, 0.5):
+        positions = np.flatnonzero(rows < share)
+        expected = sort_index.orders[col][np.isin(sort_index.orders[col], positions)]
+        assert np.array_equal(sort_index.sort(positions, col, descending), expected[::-1] if descending else expected)
@@ -0,0 +1,55 @@
+import os
+import pickle
+import time
+
+import numpy as np
+import pytest
+
+from cache import DirectoryStore, SharedCache, decode, encode
+
+
+def test_encoding_round_trips_chart_data():
+    value = {"schools": ["GP", "MS"], "f": np.array([1.5, np.nan]), "codes": np.arange(6, dtype=np.int16).reshape(2, 3),
+             "levels": np.array(["a", None], dtype=object), "parts": ({"x": [1, 2]}, 3.0), True: np.float64(2.5),
+             "__tuple__": "not a tag"}
+    result = decode(encode(value))
+    assert result.keys() == value.keys()
+    assert np.array_equal(result["f"], value["f"], equal_nan=True) and result["f"].dtype == np.float64
+    assert result["codes"].dtype == np.int16 and result["codes"].shape == (2, 3)
+    assert result["codes"].flags.writeable
+    assert list(result["levels"]) == ["a", None]
+    assert result["parts"] == ({"x": [1, 2]}, 3.0)
+    assert result[True] == 2.5 and result["__tuple__"] == "not a tag"
+
+
+def test_untrusted_entries_are_misses(tmp_path):
+    cache = SharedCache(DirectoryStore(str(tmp_path)))
+    cache.store.set(cache.key_name("evil"), pickle.dumps(os.system))
+    cache.store.set(cache.key_name("bad tag"), b'{"__ndarray__": 5}')
+    assert cache.get("evil", "missing") == "missing"
+    assert cache.get("bad tag", "missing") == "missing"
+    cache.set("unsupported", object())
+    assert cache.get("unsupported") is None
+
+
+def test_entries_expire_and_are_swept(tmp_path):
+    store = DirectoryStore(str(tmp_path), ttl=60)
+    store.set("old", b"1")
+    store.set("new", b"2")
+    past = time.time() - 120
+    os.utime(tmp_path / "old", (past, past))
+    assert store.get("old") is None and store.get("new") == b"2"
+    store._swept = 0
+    store.sweep()
+    assert sorted(os.listdir(tmp_path)) == ["new"]
+
+
+@pytest.mark.parametrize("age, taken", [(10, False), (120, True)])
+def test_claims_are_leases(tmp_path, age, taken):
+    store = DirectoryStore(str(tmp_path))
+    assert store.claim("job", lease=60)
+    past = time.time() - age
+    os.utime(tmp_path / "job", (past, past))
+    assert store.claim("job", lease=60) is taken
+    store.release("job")
+    assert store.claim("job", lease=60)
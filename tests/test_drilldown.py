@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bitmap import BitmapIndex
+from datastore import load_frame
+from drilldown import clean_drill, grade_range_drill, parse_query
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    frame = load_frame()
+    return SimpleNamespace(frame=frame, index=BitmapIndex(frame))
+
+
+def test_typed_operands_are_unwrapped():
+    assert parse_query("{age} s> num(16) && {address} icontains str(U)") == [
+        ("age", "gt", "16"), ("address", "contains", "U")]
+
+
+@pytest.mark.parametrize("query", ["{age} s> num(x)", "{age} s> datetime(2020-01-01)", "{nope} = 1", "age > 1"])
+def test_unreadable_queries_raise(query):
+    with pytest.raises(ValueError):
+        parse_query(query)
+
+
+def test_drills_built_by_the_charts_survive(snapshot):
+    levels = {"column": "sex", "in": ["F"], "label": "sex = F"}
+    grades = {"column": "final_grade", "range": [10, 12], "label": "final grade 10–12"}
+    assert clean_drill(levels, snapshot) == levels
+    assert clean_drill(grades, snapshot) == grades
+
+
+@pytest.mark.parametrize("drill", [
+    None, "sex", {"column": "sex", "in": ["F"]}, {"column": "nope", "in": ["F"], "label": "x"},
+    {"column": "final_grade", "range": ["a", "b"], "label": "x"},
+    {"column": "final_grade", "range": [True, 12], "label": "x"},
+    {"column": "sex", "range": [0, 1], "label": "x"}, {"column": "final_grade", "range": [1], "label": "x"},
+])
+def test_malformed_drills_are_ignored(snapshot, drill):
+    assert clean_drill(drill, snapshot) is None
+
+
+def test_unhashable_levels_are_dropped(snapshot):
+    drill = {"column": "sex", "in": ["F", ["M"], {"a": 1}], "label": "sex = F"}
+    assert clean_drill(drill, snapshot)["in"] == ["F"]
+
+
+def test_grade_drill_spans_the_clicked_bins():
+    points = [{"x": 12, "customdata": [11.5, 12.5]}, {"x": 10, "customdata": [9.5, 10.5]}, {"x": 3}]
+    assert grade_range_drill(points) == {"column": "final_grade", "range": [9.5, 12.5],
+                                         "label": "final grade 9.5–12.5"}
+    assert grade_range_drill([{"x": 3}]) is None
@@ -0,0 +1,132 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import stats_engine
+from cube import GRADE_UNITS, build_cube
+from datastore import load_frame
+from stats_engine import chi2_pvalue, f_pvalue, factor_tests, group_tests
+
+
+# The pure-python fallback always runs; scipy, an optional dependency, is cross-checked when installed.
+@pytest.fixture(params=["fallback", *(["scipy"] if stats_engine.fdtrc is not None else [])])
+def engine(request, monkeypatch):
+    if request.param == "fallback":
+        monkeypatch.setattr(stats_engine, "fdtrc", None)
+        monkeypatch.setattr(stats_engine, "chdtrc", None)
+
+
+def binomial_tail(a, b, x):
+    # I_x(a, b) for whole a and b: the chance of at least a successes in a + b - 1 trials.
+    n = a + b - 1
+    return sum(math.comb(n, j) * x ** j * (1 - x) ** (n - j) for j in range(a, n + 1))
+
+
+def poisson_head(a, x):
+    # Q(a, x) for whole a: the chance of fewer than a Poisson(x) events.
+    return sum(math.exp(-x) * x ** k / math.factorial(k) for k in range(a))
+
+
+@pytest.mark.parametrize("a, b", [(1, 1), (2, 5), (7, 3), (20, 35), (60, 60), (1, 200)])
+@pytest.mark.parametrize("x", [0.001, 0.1, 0.35, 0.5, 0.8, 0.999])
+def test_betainc_fallback_against_binomial_sums(a, b, x):
+    assert stats_engine._betainc(a, b, x) == pytest.approx(binomial_tail(a, b, x), rel=1e-10, abs=1e-15)
+
+
+@pytest.mark.parametrize("a", [0.5, 2.5, 7.25, 40.5])
+def test_betainc_fallback_is_symmetric(a):
+    assert stats_engine._betainc(a, a, 0.5) == pytest.approx(0.5, rel=1e-12)
+    assert stats_engine._betainc(a, 3.0, 0.3) == pytest.approx(1 - stats_engine._betainc(3.0, a, 0.7), rel=1e-10)
+
+
+@pytest.mark.parametrize("a", [1, 2, 5, 12, 30])
+@pytest.mark.parametrize("x", [0.01, 0.5, 3.0, 11.0, 29.0, 60.0])
+def test_gammaincc_fallback_against_poisson_sums(a, x):
+    assert stats_engine._gammaincc(a, x) == pytest.approx(poisson_head(a, x), rel=1e-10, abs=1e-15)
+
+
+@pytest.mark.parametrize("x", [0.01, 0.7, 2.0, 9.0, 25.0])
+def test_gammaincc_fallback_at_half_integers(x):
+    # Q(1/2, x) = erfc(sqrt x), and Q(a + 1, x) = Q(a, x) + x^a e^-x / Γ(a + 1).
+    expected = math.erfc(math.sqrt(x))
+    for a in (0.5, 1.5, 2.5, 3.5):
+        assert stats_engine._gammaincc(a, x) == pytest.approx(expected, rel=1e-10, abs=1e-15)
+        expected += math.exp(a * math.log(x) - x - math.lgamma(a + 1))
+
+
+@pytest.mark.parametrize("x", [0.01, 0.5, 1.0, 3.0, 10.0, 40.0])
+def test_tail_probabilities_with_closed_forms(engine, x):
+    assert chi2_pvalue(np.array([x]), np.array([2]))[0] == pytest.approx(math.exp(-x / 2), rel=1e-10)
+    assert chi2_pvalue(np.array([x]), np.array([1]))[0] == pytest.approx(math.erfc(math.sqrt(x / 2)), rel=1e-9)
+    for d2 in (1, 7, 30):
+        assert f_pvalue(np.array([x]), np.array([2]), np.array([d2]))[0] == \
+            pytest.approx((1 + 2 * x / d2) ** (-d2 / 2), rel=1e-9)
+    assert f_pvalue(np.array([x]), np.array([1]), np.array([1]))[0] == \
+        pytest.approx(1 - 2 / math.pi * math.atan(math.sqrt(x)), rel=1e-9)
+
+
+# Critical values from standard F, chi-square and Student t tables (t² is F with 1 numerator df).
+F_TABLE = [(4.9646, 1, 10, 0.05), (3.0984, 3, 20, 0.05), (5.3903, 2, 30, 0.01), (2.9037, 5, 40, 0.025),
+           (2.228139 ** 2, 1, 10, 0.05), (2.042272 ** 2, 1, 30, 0.05), (2.660283 ** 2, 1, 60, 0.01)]
+CHI2_TABLE = [(3.841459, 1, 0.05), (6.634897, 1, 0.01), (7.814728, 3, 0.05), (9.487729, 4, 0.05),
+              (23.209251, 10, 0.01), (31.410433, 20, 0.05)]
+
+
+@pytest.mark.parametrize("f, dfn, dfd, p", F_TABLE)
+def test_f_table(engine, f, dfn, dfd, p):
+    assert f_pvalue(np.array([f]), np.array([dfn]), np.array([dfd]))[0] == pytest.approx(p, abs=2e-5)
+
+
+@pytest.mark.parametrize("x, df, p", CHI2_TABLE)
+def test_chi2_table(engine, x, df, p):
+    assert chi2_pvalue(np.array([x]), np.array([df]))[0] == pytest.approx(p, abs=2e-6)
+
+
+def reference_tests(grades, groups):
+    # ANOVA from group means and Kruskal-Wallis from pandas midranks, with the tie correction.
+    data = pd.DataFrame({"grade": grades, "group": groups})
+    n, k = len(data), data["group"].nunique()
+    stats = data.groupby("group")["grade"].agg(["count", "mean"])
+    between = (stats["count"] * (stats["mean"] - data["grade"].mean()) ** 2).sum()
+    within = ((data["grade"] - data.groupby("group")["grade"].transform("mean")) ** 2).sum()
+    ranks = data["grade"].rank().groupby(data["group"]).agg(["sum", "count"])
+    h = 12 / (n * (n + 1)) * (ranks["sum"] ** 2 / ranks["count"]).sum() - 3 * (n + 1)
+    ties = data["grade"].value_counts().to_numpy().astype(float)
+    h /= 1 - (ties ** 3 - ties).sum() / (n ** 3 - n)
+    return {"f": between / (k - 1) / (within / (n - k)), "eta2": between / (between + within), "h": h}
+
+
+def histogram(units, groups, n_groups):
+    hist = np.zeros((1, n_groups, GRADE_UNITS), dtype=np.int64)
+    np.add.at(hist, (0, groups, units), 1)
+    return hist
+
+
+def test_group_tests_with_ties():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 4, 300)
+    units = np.clip(rng.normal(30 + 2 * groups, 6).round(), 0, GRADE_UNITS - 1).astype(int)
+    result = group_tests(histogram(units, groups, 4))
+    expected = reference_tests(units / 3, groups)
+    for key, value in expected.items():
+        assert result[key][0] == pytest.approx(value, rel=1e-9), key
+    assert result["h_p"][0] == pytest.approx(chi2_pvalue(np.array([expected["h"]]), np.array([3]))[0])
+
+
+def test_group_tests_need_two_groups():
+    result = group_tests(histogram(np.array([30, 31, 33]), np.array([1, 1, 1]), 3))
+    assert np.isnan(result["f"][0]) and np.isnan(result["h"][0])
+
+
+def test_factor_tests_match_per_school_reference():
+    frame = load_frame()
+    result = factor_tests(build_cube(frame), ["studytime", "sex"])
+    units = frame[["G1", "G2", "G3"]].sum(axis=1)
+    for row, school in enumerate(["All", *result["schools"]]):
+        rows = frame if school == "All" else frame[frame["school"] == school]
+        for factor, tests in result["factors"].items():
+            expected = reference_tests(units[rows.index] / 3, rows[factor].astype(str))
+            for key, value in expected.items():
+                assert tests[key][row] == pytest.approx(value, rel=1e-9), (school, factor, key)
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from bitmap import BitmapIndex, SortIndex
+from columnar import write_artifact
+from cube import build_cube
+import dataset
+from dataset import DatasetManager
+from datastore import load_frame
+from ingest import iter_chunks
+from metrics_engine import compute_metrics
+from schema import BOOL_COLUMNS
+from timeseries import TermSeries
+
+
+@pytest.fixture
+def base():
+    frame = load_frame()
+    return frame.iloc[np.random.default_rng(0).integers(0, len(frame), 2000)].reset_index(drop=True)
+
+
+@pytest.fixture
+def manager(base):
+    manager = DatasetManager()
+    manager.swap_frame(base)
+    return manager
+
+
+def records(frame, rows, student_ids=None, **overrides):
+    rows = frame.drop(columns="final_grade").iloc[rows].astype(object)
+    for col in BOOL_COLUMNS:
+        rows[col] = rows[col].map({True: "yes", False: "no"})
+    for col, value in overrides.items():
+        rows[col] = value
+    result = rows.to_dict("records")
+    for record, student_id in zip(result, student_ids or []):
+        if student_id is not None:
+            record["student_id"] = int(student_id)
+    return result
+
+
+def assert_same_cube(merged, expected):
+    # Merging keeps schools and levels that dropped to zero students; a rebuilt cube omits them.
+    for dim, levels in merged.levels.items():
+        for school in merged.schools:
+            counts = dict(zip(levels, merged.hist[dim][merged.schools.index(school)].tolist()))
+            for level, hist in counts.items():
+                if school in expected.schools and level in expected.levels[dim]:
+                    assert hist == expected.grade_histogram(school, dim, level).tolist(), (dim, school, level)
+                else:
+                    assert not any(hist), (dim, school, level)
+    for measure, sums in merged.measure_sums.items():
+        for school in expected.schools:
+            assert sums[merged.schools.index(school)] == pytest.approx(
+                expected.measure_sums[measure][expected.schools.index(school)])
+
+
+def assert_same_rows(snapshot):
+    frame = snapshot.frame
+    index = BitmapIndex(frame)
+    assert snapshot.index.values == index.values
+    for col, bitmaps in index.bitmaps.items():
+        assert all(np.array_equal(a, b) for a, b in zip(snapshot.index.bitmaps[col], bitmaps)), col
+    for col, order in SortIndex(frame).orders.items():
+        assert np.array_equal(snapshot.sort_index.orders[col], order), col
+    series = TermSeries(frame, snapshot.term_series.history)
+    assert snapshot.term_series.levels == series.levels
+    for grouping, (counts, sums) in series.cumulative.items():
+        assert np.array_equal(snapshot.term_series.cumulative[grouping][0], counts), grouping
+        assert np.array_equal(snapshot.term_series.cumulative[grouping][1], sums), grouping
+
+
+def assert_matches_recompute(snapshot):
+    assert_same_cube(snapshot.cube, build_cube(snapshot.frame))
+    expected = compute_metrics(snapshot.frame)
+    assert snapshot.metrics.keys() == expected.keys()
+    for school, metrics in expected.items():
+        assert snapshot.metrics[school] == pytest.approx(metrics), school
+    assert_same_rows(snapshot)
+
+
+def test_upserts_match_a_full_recompute(manager, base):
+    rng = np.random.default_rng(1)
+    for _ in range(3):
+        replaced = rng.choice(manager.current().row_count, 30, replace=False)
+        result = manager.upsert(records(base, rng.integers(0, len(base), 40), list(replaced)))
+        assert result["updated"] == 30 and result["inserted"] == 10
+        assert_matches_recompute(manager.current())
+    assert manager.current().row_count == len(base) + 30
+
+
+def test_levels_that_appear_and_vanish(manager, base):
+    manager.upsert(records(base, [0, 1], [3, None], Mjob="pilot", studytime=7))
+    assert "pilot" in manager.current().index.values["Mjob"]
+    assert_matches_recompute(manager.current())
+
+    frame = manager.current().frame
+    students = np.flatnonzero((frame["Mjob"] == "pilot").to_numpy() | (frame["school"] == "MS").to_numpy())
+    manager.upsert(records(base, [0] * len(students), list(students), school="GP", studytime=2))
+    snapshot = manager.current()
+    assert "pilot" not in snapshot.index.values["Mjob"]
+    assert snapshot.metrics.keys() == {"All", "GP"}
+    assert_matches_recompute(snapshot)
+
+
+@pytest.mark.parametrize("student_id", ["abc", 1.5, True, "1", float("inf"), -1, 10**6])
+def test_rejects_bad_student_ids(manager, base, student_id):
+    version = manager.current().version
+    record = records(base, [0])[0]
+    with pytest.raises(ValueError):
+        manager.upsert([{**record, "student_id": student_id}])
+    assert manager.current().version == version
+
+
+def test_manager_reads_its_own_artifact(base, tmp_path, monkeypatch):
+    csv = tmp_path / "students.csv"
+    rows = base.drop(columns="final_grade").head(50)
+    rows.assign(**{col: rows[col].map({True: "yes", False: "no"}) for col in BOOL_COLUMNS}).to_csv(csv, index=False)
+    write_artifact(iter_chunks(str(csv), 20), str(csv), str(tmp_path / "students.columns"))
+    monkeypatch.setattr(dataset, "load_frame", None)  # the CSV must not be parsed
+    snapshot = DatasetManager(str(csv), str(tmp_path / "students.columns")).current()
+    assert snapshot.row_count == 50
+    assert (snapshot.frame["G3"].to_numpy() == rows["G3"].to_numpy()).all()